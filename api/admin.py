@@ -1,9 +1,16 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils import timezone
 from .models import (
     Category, Material, Product, CustomOrder,
     ContactMessage, Newsletter, Testimonial,
-    Order, OrderItem, Payment, Coupon
+    Order, OrderItem, Payment, Coupon, StockReservation, IdempotencyKey,
+    MaterialPricing, Task, NewsletterCampaign, NewsletterDelivery, WebhookEvent, BestSeller,
 )
+from .services.mesh_service import MeshAnalysisService
+from .services.newsletter_service import NewsletterService
+from .services.order_state_service import OrderStateService
+from .services.quote_service import QuoteService
+from .services.webhook_service import WebhookService
 
 
 @admin.register(Category)
@@ -34,6 +41,20 @@ class MaterialAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
 
 
+@admin.register(MaterialPricing)
+class MaterialPricingAdmin(admin.ModelAdmin):
+    list_display = [
+        'code', 'material', 'density', 'price_per_kg', 'infill_factor', 'print_rate',
+        'machine_rate', 'setup_fee', 'minimum_price', 'updated_at',
+    ]
+    list_editable = ['price_per_kg', 'machine_rate', 'setup_fee', 'minimum_price']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        repriced = QuoteService.quote_backlog(codes=[obj.code])
+        self.message_user(request, f'Re-priced {repriced} custom order(s) still under review.')
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'material', 'price', 'stock_quantity', 'is_available', 'is_featured', 'created_at']
@@ -70,11 +91,16 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(CustomOrder)
 class CustomOrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'name', 'email', 'phone', 'material', 'status', 'quantity', 'created_at']
-    list_filter = ['status', 'material', 'created_at']
+    list_display = ['id', 'name', 'email', 'phone', 'material', 'status', 'quantity', 'analysis_status', 'created_at']
+    list_filter = ['status', 'material', 'analysis_status', 'created_at']
     search_fields = ['name', 'email', 'phone', 'description']
     list_editable = ['status']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = [
+        'created_at', 'updated_at', 'analysis_status', 'analysis_error', 'analyzed_at',
+        'mesh_triangle_count', 'mesh_size_x', 'mesh_size_y', 'mesh_size_z',
+        'mesh_surface_area', 'mesh_volume', 'quote_breakdown',
+    ]
+    actions = ['queue_mesh_analysis', 'recalculate_quote']
     
     fieldsets = (
         ('Customer Information', {
@@ -83,14 +109,31 @@ class CustomOrderAdmin(admin.ModelAdmin):
         ('Order Details', {
             'fields': ('material', 'color', 'quantity', 'budget', 'description', 'design_file')
         }),
+        ('Mesh Analysis', {
+            'fields': (
+                'analysis_status', 'analysis_error', 'analyzed_at', 'mesh_triangle_count',
+                ('mesh_size_x', 'mesh_size_y', 'mesh_size_z'), 'mesh_surface_area', 'mesh_volume',
+            )
+        }),
         ('Order Management', {
-            'fields': ('status', 'quote_amount', 'admin_notes')
+            'fields': ('status', 'quote_amount', 'quote_breakdown', 'admin_notes')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
+
+    @admin.action(description='Re-run mesh analysis')
+    def queue_mesh_analysis(self, request, queryset):
+        for custom_order in queryset:
+            MeshAnalysisService.queue(custom_order)
+        self.message_user(request, 'Queued for analysis — run `python manage.py analyze_custom_orders`.')
+
+    @admin.action(description='Recalculate automatic quote (overwrites manual quotes)')
+    def recalculate_quote(self, request, queryset):
+        repriced = QuoteService.quote_orders(queryset, force=True)
+        self.message_user(request, f'Re-priced {repriced} custom order(s) with an analysed mesh.')
     
     def has_delete_permission(self, request, obj=None):
         # Only allow deletion for cancelled orders
@@ -129,6 +172,41 @@ class NewsletterAdmin(admin.ModelAdmin):
     readonly_fields = ['subscribed_at']
 
 
+@admin.register(NewsletterCampaign)
+class NewsletterCampaignAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'sent_count', 'failed_count', 'total_recipients', 'started_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject']
+    readonly_fields = [
+        'status', 'total_recipients', 'sent_count', 'failed_count', 'last_subscriber_id',
+        'lease_expires_at', 'created_at', 'started_at', 'finished_at', 'updated_at',
+    ]
+    actions = ['send_campaign', 'cancel_campaign']
+
+    @admin.action(description='Send to all active subscribers')
+    def send_campaign(self, request, queryset):
+        started = sum(NewsletterService.start(campaign) for campaign in queryset)
+        self.message_user(request, f'Queued {started} campaign(s) — sent by `python manage.py run_worker`.')
+
+    @admin.action(description='Cancel sending')
+    def cancel_campaign(self, request, queryset):
+        cancelled = queryset.filter(status__in=[NewsletterCampaign.DRAFT, NewsletterCampaign.SENDING]).update(
+            status=NewsletterCampaign.CANCELLED
+        )
+        self.message_user(request, f'Cancelled {cancelled} campaign(s).')
+
+
+@admin.register(NewsletterDelivery)
+class NewsletterDeliveryAdmin(admin.ModelAdmin):
+    list_display = ['email', 'campaign', 'status', 'created_at']
+    list_filter = ['status', 'campaign']
+    search_fields = ['email']
+    readonly_fields = ['campaign', 'subscriber', 'email', 'status', 'error', 'created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+
 @admin.register(Testimonial)
 class TestimonialAdmin(admin.ModelAdmin):
     list_display = ['name', 'company', 'rating', 'is_featured', 'created_at']
@@ -175,13 +253,14 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ['order_id', 'customer_name', 'customer_email', 'total_amount', 'status', 'payment_status', 'created_at']
     list_filter = ['status', 'payment_status', 'created_at']
     search_fields = ['order_id', 'customer_name', 'customer_email', 'customer_phone', 'razorpay_order_id', 'razorpay_payment_id']
-    list_editable = ['status']
-    readonly_fields = ['order_id', 'razorpay_order_id', 'razorpay_payment_id', 'razorpay_signature', 'created_at', 'updated_at']
+    # Status moves only through OrderStateService (the actions below), never by direct edit
+    readonly_fields = ['order_id', 'status', 'payment_status', 'coupon_redeemed', 'razorpay_order_id', 'razorpay_payment_id', 'razorpay_signature', 'created_at', 'updated_at']
     inlines = [OrderItemInline]
+    actions = ['mark_processing', 'mark_shipped', 'mark_delivered', 'cancel_orders']
     
     fieldsets = (
         ('Order Information', {
-            'fields': ('order_id', 'status', 'payment_status', 'total_amount', 'discount_amount', 'coupon_code')
+            'fields': ('order_id', 'status', 'payment_status', 'total_amount', 'discount_amount', 'coupon_code', 'coupon_redeemed')
         }),
         ('Customer Details', {
             'fields': ('customer_name', 'customer_email', 'customer_phone')
@@ -201,6 +280,30 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
     
+    def _transition(self, request, queryset, target):
+        moved = OrderStateService.bulk_transition(queryset, target)
+        skipped = queryset.count() - len(moved)
+        message = f'{len(moved)} order(s) marked {target}.'
+        if skipped:
+            message += f' {skipped} skipped: not allowed from their current status.'
+        self.message_user(request, message, level=messages.WARNING if skipped else messages.SUCCESS)
+
+    @admin.action(description='Mark selected orders as PROCESSING')
+    def mark_processing(self, request, queryset):
+        self._transition(request, queryset, 'PROCESSING')
+
+    @admin.action(description='Mark selected orders as SHIPPED (tracking numbers: manage.py ship_orders)')
+    def mark_shipped(self, request, queryset):
+        self._transition(request, queryset, 'SHIPPED')
+
+    @admin.action(description='Mark selected orders as DELIVERED')
+    def mark_delivered(self, request, queryset):
+        self._transition(request, queryset, 'DELIVERED')
+
+    @admin.action(description='Cancel selected orders (releases stock and coupon uses)')
+    def cancel_orders(self, request, queryset):
+        self._transition(request, queryset, 'CANCELLED')
+
     def has_add_permission(self, request):
         # Orders should only be created through the API
         return False
@@ -211,7 +314,7 @@ class PaymentAdmin(admin.ModelAdmin):
     list_display = ['razorpay_order_id', 'order', 'amount', 'currency', 'status', 'payment_method', 'created_at']
     list_filter = ['status', 'currency', 'created_at']
     search_fields = ['razorpay_order_id', 'razorpay_payment_id', 'order__order_id', 'order__customer_email']
-    readonly_fields = ['order', 'razorpay_order_id', 'razorpay_payment_id', 'razorpay_signature', 'amount', 'currency', 'created_at', 'updated_at']
+    readonly_fields = ['order', 'razorpay_order_id', 'razorpay_payment_id', 'razorpay_signature', 'amount', 'currency', 'status', 'created_at', 'updated_at']
     
     fieldsets = (
         ('Payment Information', {
@@ -237,3 +340,81 @@ class PaymentAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         # Don't allow deletion of payment records
         return False
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['event', 'razorpay_order_id', 'status', 'attempts', 'event_created_at', 'received_at']
+    list_filter = ['status', 'event', 'received_at']
+    search_fields = ['event_id', 'razorpay_order_id']
+    readonly_fields = [
+        'event_id', 'event', 'razorpay_order_id', 'payload', 'event_created_at', 'status',
+        'attempts', 'last_error', 'received_at', 'processed_at',
+    ]
+    actions = ['reprocess']
+
+    @admin.action(description='Reprocess selected events')
+    def reprocess(self, request, queryset):
+        order_ids = set(queryset.values_list('razorpay_order_id', flat=True))
+        count = queryset.update(status=WebhookEvent.RECEIVED, last_error='')
+        for razorpay_order_id in order_ids:
+            WebhookService.process_order(razorpay_order_id)
+        self.message_user(request, f'Reprocessed {count} event(s).')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['order', 'product', 'quantity', 'status', 'expires_at', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['order__order_id', 'product__name']
+    readonly_fields = ['order', 'product', 'quantity', 'status', 'expires_at', 'created_at', 'updated_at']
+
+    def has_add_permission(self, request):
+        # Reservations are only created by checkout
+        return False
+
+
+@admin.register(BestSeller)
+class BestSellerAdmin(admin.ModelAdmin):
+    list_display = ['window', 'rank', 'product', 'category', 'quantity', 'computed_at']
+    list_filter = ['window', 'category']
+    search_fields = ['product__name']
+    readonly_fields = ['window', 'rank', 'product', 'category', 'quantity', 'computed_at']
+
+    def has_add_permission(self, request):
+        # Rankings are computed by `python manage.py refresh_best_sellers`
+        return False
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'scope', 'endpoint', 'status', 'response_status', 'created_at']
+    list_filter = ['endpoint', 'status', 'created_at']
+    search_fields = ['key', 'scope']
+    readonly_fields = ['key', 'scope', 'endpoint', 'request_hash', 'status', 'response_status', 'response_body', 'created_at', 'updated_at']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'created_at']
+    list_filter = ['status', 'name', 'created_at']
+    search_fields = ['name', 'last_error']
+    readonly_fields = ['name', 'payload', 'attempts', 'locked_at', 'locked_by', 'last_error', 'created_at', 'updated_at']
+    actions = ['retry_tasks']
+
+    @admin.action(description='Retry now (resets attempts)')
+    def retry_tasks(self, request, queryset):
+        retried = queryset.exclude(status=Task.RUNNING).update(
+            status=Task.QUEUED, attempts=0, run_at=timezone.now(), locked_at=None, locked_by='',
+        )
+        self.message_user(request, f'Re-queued {retried} task(s).')
+
+    def has_add_permission(self, request):
+        # Tasks are only created by api.tasks.enqueue()
+        return False
@@ -0,0 +1,170 @@
+"""
+Catalog response cache — PrintBox3D
+Caches serialized responses of the read-only catalog endpoints
+(categories, materials, products, testimonials).
+
+Every cache key embeds a catalog "generation" number. Saving or deleting a
+Product, Category, Material or Testimonial bumps the generation (see the
+receivers in api/models.py), which orphans every previously cached response
+in O(1) — no key scanning. Orphaned entries simply age out via the timeout.
+
+Stock moves on every checkout, so it has a generation of its own: keys of
+viewsets that render stock (``catalog_cache_tracks_stock = True``) also
+embed the stock generation, which InventoryService bumps on reserve and
+release. Categories, materials and testimonials stay cached through orders.
+
+Hit/miss/invalidation counters live in the cache too (``cache.incr``), so
+with Redis they add up across all gunicorn workers; read them with
+``python manage.py catalog_cache_stats``.
+
+Usage:
+    from api.catalog_cache import CatalogCacheMixin, catalog_cached
+
+    class CategoryViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
+        ...
+
+        @action(detail=False, methods=['get'])
+        @catalog_cached
+        def featured(self, request):
+            ...
+"""
+
+import functools
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from .conditional import apply_validators
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'catalog:generation'
+STOCK_GENERATION_KEY = 'catalog:stock-generation'
+
+STATS_KEY_PREFIX = 'catalog:stats:'
+STATS_COUNTERS = ('hits', 'misses', 'invalidations')
+
+
+def _get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_generation(key: str = GENERATION_KEY) -> int:
+    """Return the current catalog (or stock) generation, initialising it if absent."""
+    cache = _get_cache()
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 1, timeout=None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def bump_generation(key: str = GENERATION_KEY) -> None:
+    """Invalidate the cached responses embedding ``key`` by moving it to a new generation."""
+    cache = _get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Key missing (first write or evicted) — any fresh value invalidates old keys
+        cache.set(key, get_generation(key) + 1, timeout=None)
+    _count('invalidations')
+
+
+def bump_stock_generation() -> None:
+    """Invalidate only the cached responses that render stock."""
+    bump_generation(STOCK_GENERATION_KEY)
+
+
+def build_key(request, basename: str, action: str, tracks_stock: bool = False) -> str:
+    """
+    Build a cache key from the generation(s), the endpoint and the full URL.
+
+    The absolute URI (scheme + host + path + querystring) is used because some
+    serializers render absolute media URLs from the request.
+    """
+    digest = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    generation = get_generation()
+    if tracks_stock:
+        generation = f"{generation}.{get_generation(STOCK_GENERATION_KEY)}"
+    return f"catalog:{generation}:{basename}:{action}:{digest}"
+
+
+def _count(counter: str) -> None:
+    cache = _get_cache()
+    key = STATS_KEY_PREFIX + counter
+    try:
+        cache.incr(key)
+    except ValueError:
+        # First count (or evicted); if another worker created it meanwhile, add ours to theirs
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_stats() -> dict:
+    """Return the hit/miss/invalidation counters shared by every process using the cache."""
+    values = _get_cache().get_many([STATS_KEY_PREFIX + counter for counter in STATS_COUNTERS])
+    stats = {counter: values.get(STATS_KEY_PREFIX + counter, 0) for counter in STATS_COUNTERS}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    return stats
+
+
+def reset_stats() -> None:
+    _get_cache().delete_many([STATS_KEY_PREFIX + counter for counter in STATS_COUNTERS])
+
+
+def catalog_cached(view_method):
+    """
+    Decorator for viewset handlers: serve ``response.data`` from the catalog
+    cache, or run the handler and cache a successful result.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if not getattr(settings, 'CATALOG_CACHE_ENABLED', True):
+            return view_method(self, request, *args, **kwargs)
+
+        cache = _get_cache()
+        key = build_key(
+            request, self.basename, self.action, getattr(self, 'catalog_cache_tracks_stock', False),
+        )
+        entry = cache.get(key)
+        if entry is not None:
+            _count('hits')
+            # Validators are cached with the data so a hit never touches the DB
+            not_modified = get_conditional_response(
+                request, etag=entry['etag'], last_modified=entry['last_modified']
+            )
+            if not_modified is not None:
+                return not_modified
+            return apply_validators(Response(entry['data']), entry['etag'], entry['last_modified'])
+
+        _count('misses')
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            last_modified = response.get('Last-Modified')
+            cache.set(key, {
+                'data': response.data,
+                'etag': response.get('ETag'),
+                'last_modified': parse_http_date_safe(last_modified) if last_modified else None,
+            }, timeout=getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return response
+
+    return wrapper
+
+
+class CatalogCacheMixin:
+    """Caches ``list`` and ``retrieve`` of a ReadOnlyModelViewSet."""
+
+    @catalog_cached
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @catalog_cached
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
@@ -0,0 +1,76 @@
+"""
+Conditional GET support — PrintBox3D
+Answers If-None-Match / If-Modified-Since with 304 before any serialization.
+
+The validator for a response is computed with ONE aggregate query over the
+same (filtered) queryset the view would serialize, e.g.
+max(updated_at) + count. Viewsets declare what to aggregate by overriding
+``get_validator_aggregates``.
+"""
+
+import datetime
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def build_etag(values: dict) -> str:
+    """Hash aggregate values into a strong, quoted ETag."""
+    payload = '|'.join(f"{key}={values[key]!r}" for key in sorted(values))
+    return '"%s"' % hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def latest_timestamp(values: dict):
+    """Return the newest datetime among the aggregate values as a Unix timestamp."""
+    stamps = [v for v in values.values() if isinstance(v, datetime.datetime)]
+    if not stamps:
+        return None
+    return int(max(stamps).timestamp())
+
+
+def apply_validators(response, etag, last_modified):
+    """Set ETag / Last-Modified on a response if not already present."""
+    if etag and not response.has_header('ETag'):
+        response['ETag'] = etag
+    if last_modified and not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag / Last-Modified validators to ``list`` and ``retrieve`` of a
+    ReadOnlyModelViewSet and short-circuits with 304 Not Modified.
+    """
+
+    def get_validator_aggregates(self) -> dict:
+        """Return ``{name: aggregate expression}`` describing the response data."""
+        raise NotImplementedError
+
+    def _validator_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        # only()/ordering are irrelevant to an aggregate and only add SQL
+        return queryset.order_by()
+
+    def _conditional(self, request, handler, *args, **kwargs):
+        values = self._validator_queryset().aggregate(**self.get_validator_aggregates())
+        if self.action == 'retrieve' and not values.get('count'):
+            return handler(request, *args, **kwargs)  # let the 404 happen normally
+
+        etag = build_etag(values)
+        last_modified = latest_timestamp(values)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        return apply_validators(handler(request, *args, **kwargs), etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(request, super().retrieve, *args, **kwargs)
@@ -1,17 +1,182 @@
-from django.core.mail import send_mail
-from django.conf import settings
+"""
+Outbound email — PrintBox3D
+
+All mail goes through two per-process, long-lived transports instead of a
+fresh connection per message:
+
+    - Resend: one keep-alive ``requests.Session`` (TLS handshake once), and
+      the /emails/batch endpoint for bulk sends (up to 100 per request)
+    - SMTP: one open EMAIL_BACKEND (HostingerEmailBackend) connection, so
+      connect + STARTTLS + AUTH happen once rather than per message. It is
+      dropped after EMAIL_SMTP_IDLE_TIMEOUT seconds unused (servers close idle
+      sessions anyway) and re-opened transparently if the server hung up
+      (checked with a NOOP before each message, so no message is ever resent
+      after the server may have accepted it)
+
+Usage:
+    from api.email_utils import _send_email, send_bulk_emails
+    _send_email('asha@example.com', 'Subject', 'Body')
+    send_bulk_emails([(to, subject, text), ...])   # returns number sent
+"""
+
 import logging
+import smtplib
+import threading
+import time
+
 import requests as _requests
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
+RESEND_API_URL = 'https://api.resend.com'
+RESEND_BATCH_LIMIT = 100
+
+
+class _ResendTransport:
+    """Keep-alive HTTPS session to the Resend API, rebuilt when the key changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._session = None
+        self._key = None
+
+    def session(self, api_key: str) -> _requests.Session:
+        with self._lock:
+            if self._session is None or self._key != api_key:
+                if self._session is not None:
+                    self._session.close()
+                session = _requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+                session.headers.update({
+                    'Authorization': f'Bearer {api_key}',
+                    'Content-Type': 'application/json',
+                })
+                self._session, self._key = session, api_key
+            return self._session
+
+    def post(self, api_key: str, path: str, payload) -> dict:
+        try:
+            resp = self.session(api_key).post(f'{RESEND_API_URL}{path}', json=payload, timeout=30)
+        except _requests.exceptions.RequestException as e:
+            logger.error(f'[EMAIL] Resend network error: {e}', exc_info=True)
+            raise
+        logger.info(f'[EMAIL] Resend response: status={resp.status_code} body={resp.text}')
+        if not resp.ok:
+            raise RuntimeError(f'Resend API error {resp.status_code}: {resp.text}')
+        return resp.json()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = self._key = None
+
+
+class _SMTPTransport:
+    """
+    One open EMAIL_BACKEND connection shared by every send in this process.
+
+    A reused connection is checked with NOOP before a message goes out, so a
+    dropped one is replaced before anything is sent. Once a message is in
+    flight it is resent only when the server answers 421 (refused, closing);
+    a connection lost or timed out mid-transaction may already have delivered
+    it, so the error is raised instead of risking a duplicate.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backend = None
+        self._key = None
+        self._last_used = 0.0
+        self.connects = 0
+
+    @staticmethod
+    def _settings_key() -> tuple:
+        return (
+            settings.EMAIL_BACKEND, settings.EMAIL_HOST, settings.EMAIL_PORT, settings.EMAIL_HOST_USER,
+            settings.EMAIL_USE_TLS, getattr(settings, 'EMAIL_USE_SSL', False),
+        )
+
+    def _alive(self) -> bool:
+        """NOOP round trip on the open connection (True for backends without one)."""
+        connection = getattr(self._backend, 'connection', None)
+        if connection is None:
+            return True
+        try:
+            return connection.noop()[0] == 250
+        except OSError:  # smtplib.SMTPException included
+            return False
+
+    def _connection(self):
+        idle = time.monotonic() - self._last_used
+        if self._backend is not None and (
+            self._key != self._settings_key() or idle > getattr(settings, 'EMAIL_SMTP_IDLE_TIMEOUT', 60)
+        ):
+            self._close()
+        if self._backend is not None and not self._alive():
+            logger.warning('[EMAIL] SMTP connection lost, reconnecting')
+            self._close()
+        if self._backend is None:
+            self._backend = get_connection(fail_silently=False)
+            self._key = self._settings_key()
+        if self._backend.open():  # True only when a new connection was made
+            self.connects += 1
+            logger.info(f'[EMAIL] Opened SMTP connection to {settings.EMAIL_HOST}:{settings.EMAIL_PORT}')
+        return self._backend
+
+    def _close(self) -> None:
+        backend, self._backend = self._backend, None
+        if backend is not None:
+            try:
+                backend.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _server_replied(exc: Exception) -> bool:
+        """The server answered (e.g. 550), so the connection is still in a known state."""
+        return isinstance(exc, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused))
+
+    def send(self, message: EmailMessage) -> None:
+        with self._lock:
+            try:
+                self._connection().send_messages([message])
+            except Exception as exc:
+                if isinstance(exc, smtplib.SMTPResponseException) and exc.smtp_code == 421:
+                    # Refused before acceptance and the server is closing: safe to resend once
+                    self._close()
+                    logger.warning(f'[EMAIL] SMTP server closing ({exc!r}), reconnecting')
+                    self._connection().send_messages([message])
+                else:
+                    if not self._server_replied(exc):
+                        self._close()
+                    raise
+            self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+
+_resend = _ResendTransport()
+_smtp = _SMTPTransport()
+
+
+def close_email_connections() -> None:
+    """Close the pooled transports (e.g. when a worker shuts down)."""
+    _resend.close()
+    _smtp.close()
+
 
 def _send_email(to: str, subject: str, text: str) -> None:
     """
     Unified email sender.
     Uses Resend API when RESEND_API_KEY is configured (recommended for cloud
     deployments where outbound SMTP ports are often blocked).
-    Falls back to Django SMTP otherwise.
+    Falls back to the pooled SMTP connection otherwise.
     """
     resend_key = getattr(settings, 'RESEND_API_KEY', '')
     from_email = settings.DEFAULT_FROM_EMAIL
@@ -25,38 +190,51 @@ def _send_email(to: str, subject: str, text: str) -> None:
             'subject': subject,
             'text': text,
         }
-        logger.info(f'[EMAIL] Resend payload from={from_email} to={to}')
-        try:
-            resp = _requests.post(
-                'https://api.resend.com/emails',
-                headers={
-                    'Authorization': f'Bearer {resend_key}',
-                    'Content-Type': 'application/json',
-                },
-                json=payload,
-                timeout=30,
-            )
-            logger.info(f'[EMAIL] Resend response: status={resp.status_code} body={resp.text}')
-            if not resp.ok:
-                raise RuntimeError(
-                    f'Resend API error {resp.status_code}: {resp.text}'
-                )
-            logger.info(f'[EMAIL] Sent via Resend to {to} id={resp.json().get("id")}')
-        except _requests.exceptions.RequestException as e:
-            logger.error(f'[EMAIL] Resend network error: {e}', exc_info=True)
-            raise
+        data = _resend.post(resend_key, '/emails', payload)
+        logger.info(f'[EMAIL] Sent via Resend to {to} id={data.get("id")}')
     else:
-        logger.info(f'[EMAIL] Sending via SMTP {settings.EMAIL_HOST}:{settings.EMAIL_PORT}')
-        send_mail(
-            subject=subject,
-            message=text,
-            from_email=from_email,
-            recipient_list=[to],
-            fail_silently=False,
-        )
+        _smtp.send(EmailMessage(subject=subject, body=text, from_email=from_email, to=[to]))
         logger.info(f'[EMAIL] Sent via SMTP to {to}')
 
 
+def send_bulk_emails(messages, failed: list | None = None) -> int:
+    """
+    Send many (to, subject, text) messages over one connection.
+
+    Resend: batches of RESEND_BATCH_LIMIT per request. SMTP: every message on
+    the pooled connection; a rejected recipient is logged and skipped rather
+    than aborting the rest (and appended to ``failed`` as (to, error) if given).
+
+    Returns:
+        Number of messages accepted.
+    """
+    messages = list(messages)
+    resend_key = getattr(settings, 'RESEND_API_KEY', '')
+    from_email = settings.DEFAULT_FROM_EMAIL
+    sent = 0
+
+    if resend_key:
+        for start in range(0, len(messages), RESEND_BATCH_LIMIT):
+            batch = [
+                {'from': from_email, 'to': [to], 'subject': subject, 'text': text}
+                for to, subject, text in messages[start:start + RESEND_BATCH_LIMIT]
+            ]
+            _resend.post(resend_key, '/emails/batch', batch)
+            sent += len(batch)
+    else:
+        for to, subject, text in messages:
+            try:
+                _smtp.send(EmailMessage(subject=subject, body=text, from_email=from_email, to=[to]))
+                sent += 1
+            except smtplib.SMTPRecipientsRefused as e:
+                logger.warning(f'[EMAIL] Recipient refused, skipping {to}: {e}')
+                if failed is not None:
+                    failed.append((to, str(e)))
+
+    logger.info(f'[EMAIL] Bulk send: {sent} of {len(messages)} message(s) accepted')
+    return sent
+
+
 def send_order_confirmation_email(order, prefetched_items=None):
     """
     Send order confirmation email to customer.
@@ -0,0 +1,160 @@
+"""
+Idempotency keys — PrintBox3D
+Makes POST endpoints safe to retry.
+
+A client sends ``Idempotency-Key: <uuid>`` with a request. The first request
+claims the key (unique insert) and its final response is stored against it;
+replays with the same key and body get the stored response back without
+re-running the endpoint — no duplicate orders, no duplicate gateway calls.
+
+Keys are scoped to the sender (the user, or for guests the request's email
+address) and the endpoint, so nobody can replay someone else's response by
+guessing their key. Stored keys are kept for IDEMPOTENCY_KEY_TTL_HOURS:
+    python manage.py purge_idempotency_keys
+
+    - same key, same body, completed  -> stored response replayed
+    - same key, still in progress     -> 409 Conflict
+    - same key, different body        -> 422 Unprocessable Entity
+    - endpoint answered 5xx           -> key is dropped so the client can retry
+
+Usage:
+    @api_view(['POST'])
+    @idempotent('create_order')
+    def create_order(request):
+        ...
+"""
+
+import functools
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+
+# An IN_PROGRESS key untouched for this long belongs to a crashed worker and may be taken over
+STALE_AFTER = timedelta(minutes=5)
+
+
+def _scope(request, email_field: str) -> str:
+    """Who is sending the key: the user, else the email address in the body."""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    email = str(request.data.get(email_field) or '').strip().lower()
+    return f'email:{email}' if email else 'anonymous'
+
+
+def _request_hash(request) -> str:
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def _claim(key: str, scope: str, endpoint: str, request_hash: str):
+    """
+    Try to claim ``key`` for ``scope`` on ``endpoint``.
+
+    Returns:
+        (record, None) when this request owns the key, or
+        (None, Response) when the caller must answer with the given response.
+    """
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                key=key, scope=scope, endpoint=endpoint, request_hash=request_hash,
+            ), None
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(scope=scope, endpoint=endpoint, key=key).first()
+    if record is None:
+        # Deleted after a 5xx between our insert and read — claim it again
+        return _claim(key, scope, endpoint, request_hash)
+
+    if record.request_hash != request_hash:
+        return None, Response(
+            {'error': f'{HEADER} was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+
+    if record.status == IdempotencyKey.COMPLETED:
+        response = Response(record.response_body, status=record.response_status)
+        response['Idempotent-Replayed'] = 'true'
+        return None, response
+
+    # Take over an abandoned claim with a conditional update
+    taken_over = IdempotencyKey.objects.filter(
+        pk=record.pk, status=IdempotencyKey.IN_PROGRESS,
+        updated_at__lt=timezone.now() - STALE_AFTER,
+    ).update(updated_at=timezone.now())
+    if taken_over:
+        return record, None
+
+    return None, Response(
+        {'error': 'A request with this idempotency key is still being processed'},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+def purge(older_than: timedelta | None = None, batch_size: int = 1000) -> int:
+    """Delete keys created more than ``older_than`` ago (default IDEMPOTENCY_KEY_TTL_HOURS). Returns the count."""
+    older_than = older_than or timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    expired = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - older_than)
+    purged = 0
+    while True:
+        ids = list(expired.order_by('created_at').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return purged
+        purged += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+
+
+def idempotent(endpoint: str, email_field: str = 'customer_email'):
+    """
+    Decorator for DRF function views honouring the Idempotency-Key header.
+
+    Guests are told apart by ``email_field`` of the request body.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER, '').strip()
+            if not key:
+                return view(request, *args, **kwargs)
+            if len(key) > 255:
+                return Response({'error': f'{HEADER} is too long'}, status=status.HTTP_400_BAD_REQUEST)
+
+            record, early_response = _claim(
+                key, _scope(request, email_field), endpoint, _request_hash(request),
+            )
+            if early_response is not None:
+                return early_response
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+
+            if response.status_code >= 500:
+                # Transient failure — let the client retry with the same key
+                record.delete()
+            else:
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    status=IdempotencyKey.COMPLETED,
+                    response_status=response.status_code,
+                    response_body=json.loads(json.dumps(response.data, cls=DjangoJSONEncoder)),
+                    updated_at=timezone.now(),
+                )
+            return response
+        return wrapper
+    return decorator
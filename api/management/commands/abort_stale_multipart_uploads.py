@@ -0,0 +1,43 @@
+"""
+Abort incomplete S3 multipart uploads that were never completed.
+Parts of an abandoned upload are billed as storage until aborted.
+Run periodically (e.g. daily via Railway cron):
+    python manage.py abort_stale_multipart_uploads
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services.s3_service import S3Service
+
+
+class Command(BaseCommand):
+    help = 'Abort S3 multipart uploads started more than --hours ago and never completed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=getattr(settings, 'AWS_S3_MULTIPART_STALE_HOURS', 24),
+            help='Age after which an incomplete upload is considered abandoned',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='List stale uploads without aborting them')
+
+    def handle(self, *args, **options):
+        if not S3Service.is_configured():
+            raise CommandError('S3 storage is not configured')
+
+        stale = S3Service.stale_multipart_uploads(timedelta(hours=options['hours']))
+        aborted = 0
+        for upload in stale:
+            if options['dry_run']:
+                self.stdout.write(f"  would abort {upload['s3_key']} (started {upload['initiated']:%Y-%m-%d %H:%M})")
+                continue
+            if S3Service.abort_multipart_upload(upload['s3_key'], upload['upload_id']):
+                aborted += 1
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{len(stale)} stale multipart upload(s) found.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Aborted {aborted} of {len(stale)} stale multipart upload(s).'
+            ))
@@ -0,0 +1,26 @@
+"""
+Analyse design files of custom orders waiting for mesh analysis
+(bounding box, triangle count, surface area, volume).
+Run periodically (e.g. every minute via Railway cron):
+    python manage.py analyze_custom_orders
+"""
+from django.core.management.base import BaseCommand
+
+from api.services.mesh_service import MeshAnalysisService
+
+
+class Command(BaseCommand):
+    help = 'Run mesh analysis for custom orders with analysis_status=PENDING'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=50, help='Maximum number of orders to analyse')
+
+    def handle(self, *args, **options):
+        results = {}
+        for order in MeshAnalysisService.pending(limit=options['limit']):
+            outcome = MeshAnalysisService.analyze(order)
+            results[outcome] = results.get(outcome, 0) + 1
+            self.stdout.write(f'  #{order.pk}: {outcome}')
+
+        summary = ', '.join(f'{count} {outcome.lower()}' for outcome, count in sorted(results.items()))
+        self.stdout.write(self.style.SUCCESS(f'Analysed {sum(results.values())} custom order(s). {summary}'.strip()))
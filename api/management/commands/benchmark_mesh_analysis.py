@@ -0,0 +1,145 @@
+"""
+Benchmark mesh analysis over synthetic closed meshes (UV spheres).
+Run with: python manage.py benchmark_mesh_analysis --triangles 10000 100000 1000000 5000000
+          python manage.py benchmark_mesh_analysis --formats obj --triangles 1000000
+
+Each mesh is written as a binary STL, an ASCII STL and an OBJ (shared
+vertices, quad faces) to a temp file in bands (never held in memory whole),
+analysed with api.mesh.analyze_file, and removed. Prints throughput (untraced
+run), peak memory (a second run under tracemalloc, which slows parsing) and the
+volume error against 4/3·π·r³.
+"""
+import math
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api.mesh import _STL_RECORD, analyze_file
+
+RADIUS = 50.0  # mm
+
+
+def _grid(target_triangles: int) -> tuple:
+    slices = max(8, int(math.sqrt(target_triangles)))
+    stacks = max(4, target_triangles // (2 * slices))
+    return slices, stacks
+
+
+def _ring(i: int, stacks: int, phi) -> np.ndarray:
+    theta = np.pi * i / stacks
+    return RADIUS * np.stack([np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.full_like(phi, np.cos(theta))], 1)
+
+
+def _bands(slices: int, stacks: int):
+    """Yield the triangles of each band between two rings, shaped (2 * slices, 3, 3)."""
+    phi = np.linspace(0, 2 * np.pi, slices + 1)
+    for i in range(stacks):
+        ring0, ring1 = _ring(i, stacks, phi), _ring(i + 1, stacks, phi)
+        triangles = np.empty((2 * slices, 3, 3))
+        # Outward winding: (a, c, b) and (b, c, d) for quad a-b (ring0) / c-d (ring1)
+        triangles[0::2] = np.stack([ring0[:-1], ring1[:-1], ring0[1:]], 1)
+        triangles[1::2] = np.stack([ring0[1:], ring1[:-1], ring1[1:]], 1)
+        yield triangles
+
+
+def write_uv_sphere(fh, target_triangles: int) -> int:
+    """Write a closed UV sphere with about ``target_triangles`` faces as binary STL; returns the real count."""
+    slices, stacks = _grid(target_triangles)
+    count = 2 * slices * stacks
+    fh.write(b'PrintBox3D benchmark sphere'.ljust(80, b' '))
+    fh.write(count.to_bytes(4, 'little'))
+    for triangles in _bands(slices, stacks):
+        records = np.zeros(len(triangles), dtype=_STL_RECORD)
+        records['vertices'] = triangles
+        fh.write(records.tobytes())
+    return count
+
+
+_ASCII_FACET = (
+    'facet normal 0 0 0\n outer loop\n'
+    '  vertex %.6f %.6f %.6f\n  vertex %.6f %.6f %.6f\n  vertex %.6f %.6f %.6f\n'
+    ' endloop\nendfacet\n'
+)
+
+
+def write_uv_sphere_ascii(fh, target_triangles: int) -> int:
+    """Same sphere as ``write_uv_sphere``, as ASCII STL."""
+    slices, stacks = _grid(target_triangles)
+    fh.write(b'solid sphere\n')
+    for triangles in _bands(slices, stacks):
+        fh.write((_ASCII_FACET * len(triangles) % tuple(triangles.ravel())).encode('ascii'))
+    fh.write(b'endsolid sphere\n')
+    return 2 * slices * stacks
+
+
+def write_uv_sphere_obj(fh, target_triangles: int) -> int:
+    """Same sphere as OBJ: each ring's vertices once, one quad face per grid cell."""
+    slices, stacks = _grid(target_triangles)
+    phi = np.linspace(0, 2 * np.pi, slices + 1)
+    for i in range(stacks + 1):
+        fh.write(('v %.6f %.6f %.6f\n' * (slices + 1) % tuple(_ring(i, stacks, phi).ravel())).encode('ascii'))
+    j = np.arange(slices)
+    for i in range(stacks):
+        a = i * (slices + 1) + j + 1          # OBJ indices are 1-based
+        b, c = a + 1, a + slices + 1
+        # Quad a-c-d-b is planar (an isosceles trapezoid); fan-triangulated to (a, c, d), (a, d, b)
+        quads = np.stack([a, c, c + 1, b], 1)
+        fh.write(('f %d %d %d %d\n' * slices % tuple(quads.ravel())).encode('ascii'))
+    return 2 * slices * stacks
+
+
+WRITERS = {
+    'binary': ('.stl', write_uv_sphere),
+    'ascii': ('.stl', write_uv_sphere_ascii),
+    'obj': ('.obj', write_uv_sphere_obj),
+}
+
+
+class Command(BaseCommand):
+    help = 'Time mesh analysis of synthetic spheres in binary STL, ASCII STL and OBJ'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--triangles', type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 5_000_000],
+            help='Approximate triangle counts to benchmark',
+        )
+        parser.add_argument(
+            '--formats', nargs='+', choices=list(WRITERS), default=list(WRITERS),
+            help='File formats to benchmark',
+        )
+
+    def handle(self, *args, **options):
+        expected = 4 / 3 * math.pi * RADIUS ** 3
+        self.stdout.write(
+            f"{'format':>7} {'triangles':>10} {'MB':>8} {'seconds':>8} {'Mtri/s':>8} {'peak MB':>8} {'vol err':>9}"
+        )
+        for file_format in options['formats']:
+            suffix, write = WRITERS[file_format]
+            for target in options['triangles']:
+                fd, path = tempfile.mkstemp(suffix=suffix)
+                try:
+                    with os.fdopen(fd, 'wb') as fh:
+                        count = write(fh, target)
+                    size = os.path.getsize(path)
+
+                    started = time.perf_counter()
+                    with open(path, 'rb') as fh:
+                        stats = analyze_file(fh, path, size=size)
+                    elapsed = time.perf_counter() - started
+
+                    tracemalloc.start()
+                    with open(path, 'rb') as fh:
+                        analyze_file(fh, path, size=size)
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                finally:
+                    os.remove(path)
+
+                self.stdout.write(
+                    f'{file_format:>7} {count:>10} {size / 1e6:8.1f} {elapsed:8.3f} {count / elapsed / 1e6:8.2f} '
+                    f'{peak / 1e6:8.1f} {abs(stats.volume - expected) / expected:9.2e}'
+                )
@@ -0,0 +1,124 @@
+"""
+Benchmark product search latency: full-text (Postgres) vs legacy icontains.
+Run with: python manage.py benchmark_search --products 100000 --queries 200
+
+Seeds products into a throwaway "Search Benchmark" category, runs the same
+random queries through both search paths and prints p50/p95 latency.
+Each query fetches the first page of /api/products/?search=… exactly as
+ProductViewSet builds it (list columns, joins, relevance ordering); the
+legacy path is that queryset with icontains and the default ordering.
+Seeded rows are removed afterwards unless --keep is passed.
+"""
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.text import slugify
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.test import APIRequestFactory
+
+from api.models import Category, Product
+from api.search import is_postgres, legacy_search, refresh_category_search_vectors
+from api.views import ProductViewSet
+
+WORDS = [
+    'planter', 'vase', 'lamp', 'keychain', 'holder', 'stand', 'dragon', 'gear',
+    'organizer', 'coaster', 'bracket', 'figurine', 'phone', 'desk', 'cable',
+    'hexagon', 'geometric', 'minimal', 'articulated', 'modular', 'spiral',
+    'lattice', 'succulent', 'headphone', 'bookend', 'tray', 'hook', 'clip',
+]
+
+BENCHMARK_CATEGORY = 'Search Benchmark'
+
+
+def _view_queryset(text):
+    """The queryset ProductViewSet.list pages through for ?search=text."""
+    view = ProductViewSet(action='list', format_kwarg=None, kwargs={})
+    view.request = Request(APIRequestFactory().get('/api/products/', {'search': text}))
+    return view.filter_queryset(view.get_queryset())
+
+
+def _legacy_queryset(text):
+    """The same listing through the pre-FTS icontains search."""
+    view = ProductViewSet(action='list', format_kwarg=None, kwargs={})
+    return legacy_search(view.get_queryset(), text).order_by(*ProductViewSet.ordering)
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Seed products and report p50/p95 latency of full-text vs legacy search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000, help='Number of products to seed')
+        parser.add_argument('--queries', type=int, default=200, help='Number of queries per search path')
+        parser.add_argument('--batch-size', type=int, default=5_000, help='bulk_create batch size')
+        parser.add_argument('--keep', action='store_true', help='Keep seeded products after the run')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        category, _ = Category.objects.get_or_create(name=BENCHMARK_CATEGORY)
+
+        existing = category.products.count()
+        to_create = max(0, options['products'] - existing)
+        self.stdout.write(f'Seeding {to_create} products ({existing} already present)...')
+        started = time.perf_counter()
+        batch = []
+        for i in range(existing, existing + to_create):
+            name = ' '.join(rng.sample(WORDS, 3)).title()
+            batch.append(Product(
+                name=name,
+                slug=f'{slugify(name)}-bench-{i}',
+                description=' '.join(rng.choices(WORDS, k=30)),
+                price=rng.randint(99, 2999),
+                category=category,
+            ))
+            if len(batch) >= options['batch_size']:
+                Product.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Product.objects.bulk_create(batch)
+        refresh_category_search_vectors(category)
+        self.stdout.write(f'  seeded in {time.perf_counter() - started:.1f}s')
+
+        # Mix of exact terms, two-term queries and single-letter typos
+        queries = []
+        for _ in range(options['queries']):
+            word = rng.choice(WORDS)
+            kind = rng.random()
+            if kind < 0.2 and len(word) > 4:
+                pos = rng.randrange(1, len(word) - 1)
+                word = word[:pos] + word[pos + 1:]
+            elif kind < 0.5:
+                word = f'{word} {rng.choice(WORDS)}'
+            queries.append(word)
+
+        page_size = api_settings.PAGE_SIZE
+        paths = [('legacy icontains', _legacy_queryset)]
+        if is_postgres():
+            paths.insert(0, ('full-text + trigram', _view_queryset))
+        else:
+            self.stdout.write(self.style.WARNING('Not on Postgres — only the legacy path is measured.'))
+
+        self.stdout.write('')
+        for label, build in paths:
+            timings = []
+            for text in queries:
+                t0 = time.perf_counter()
+                list(build(text)[:page_size])
+                timings.append((time.perf_counter() - t0) * 1000)
+            self.stdout.write(
+                f'{label:<22} p50={_percentile(timings, 50):8.2f} ms  '
+                f'p95={_percentile(timings, 95):8.2f} ms  '
+                f'mean={statistics.mean(timings):8.2f} ms'
+            )
+
+        if not options['keep']:
+            category.delete()
+            self.stdout.write('\nRemoved benchmark products.')
@@ -0,0 +1,24 @@
+"""
+Print the catalog cache hit/miss/invalidation counters (summed over every
+worker sharing the cache; per process with the local-memory fallback).
+Run with: python manage.py catalog_cache_stats
+          python manage.py catalog_cache_stats --reset
+"""
+from django.core.management.base import BaseCommand
+
+from api.catalog_cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Show (and optionally reset) the catalog cache counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        for name in ('hits', 'misses', 'invalidations', 'hit_ratio'):
+            self.stdout.write(f'{name:>13}: {stats[name]}')
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
@@ -0,0 +1,25 @@
+"""
+Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL_HOURS.
+Run periodically (e.g. daily via Railway cron):
+    python manage.py purge_idempotency_keys
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.idempotency import purge
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys older than --hours'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24),
+            help='Keep keys created within this many hours',
+        )
+
+    def handle(self, *args, **options):
+        purged = purge(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} idempotency key(s).'))
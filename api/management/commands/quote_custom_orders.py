@@ -0,0 +1,26 @@
+"""
+Re-price every custom order still under review (status PENDING/REVIEWING)
+from its analysed mesh and the current MaterialPricing table.
+Run after changing material prices:
+    python manage.py quote_custom_orders [--material PLA] [--force]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.quote_service import QuoteService
+
+
+class Command(BaseCommand):
+    help = 'Recalculate automatic quotes for the custom-order backlog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--material', action='append', dest='materials', help='Only this material code (repeatable)')
+        parser.add_argument('--force', action='store_true', help='Also overwrite quotes edited by hand')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        repriced = QuoteService.quote_backlog(codes=options['materials'], force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Re-priced {repriced} custom order(s) in {time.perf_counter() - started:.2f}s.'
+        ))
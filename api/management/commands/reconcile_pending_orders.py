@@ -0,0 +1,44 @@
+"""
+Settle PENDING orders whose payment callback never arrived, by asking Razorpay.
+Run periodically (e.g. every 5 minutes via Railway cron), before release_expired_reservations:
+    python manage.py reconcile_pending_orders
+    python manage.py reconcile_pending_orders --older-than 60 --concurrency 4 --dry-run
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.services.reconciliation_service import ReconciliationService
+
+
+class Command(BaseCommand):
+    help = 'Reconcile stuck PENDING orders against Razorpay (PAID / FAILED / EXPIRED)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None, help='Minimum order age in minutes')
+        parser.add_argument('--batch-size', type=int, default=None, help='Orders per batch')
+        parser.add_argument('--concurrency', type=int, default=None, help='Parallel Razorpay lookups')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many orders')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+
+    def handle(self, *args, **options):
+        stats = ReconciliationService.sweep(
+            older_than=timedelta(minutes=options['older_than']) if options['older_than'] else None,
+            batch_size=options['batch_size'],
+            concurrency=options['concurrency'],
+            limit=options['limit'],
+            dry_run=options['dry_run'],
+        )
+        verb = 'Would settle' if options['dry_run'] else 'Settled'
+        self.stdout.write(
+            f"Scanned {stats['scanned']} PENDING order(s) in {stats['elapsed']}s "
+            f"({stats['orders_per_second']} orders/s)"
+        )
+        message = (
+            f"{verb}: {stats['paid']} paid, {stats['failed']} failed, {stats['expired']} expired; "
+            f"{stats['waiting']} still pending, {stats['errors']} lookup error(s)."
+        )
+        if stats['aborted']:
+            self.stdout.write(self.style.WARNING(message + ' Stopped early: payment gateway unavailable.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
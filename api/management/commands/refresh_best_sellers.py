@@ -0,0 +1,23 @@
+"""
+Update the best-seller rankings (7 / 30 / 90 days) from paid orders.
+Run periodically (e.g. hourly via Railway cron); only days with changed orders are re-summed:
+    python manage.py refresh_best_sellers
+    python manage.py refresh_best_sellers --full
+"""
+from django.core.management.base import BaseCommand
+
+from api.services.ranking_service import BestSellerService
+
+
+class Command(BaseCommand):
+    help = 'Refresh the precomputed best-seller rankings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Re-sum every day in the 90-day window')
+
+    def handle(self, *args, **options):
+        result = BestSellerService.refresh(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-summed {result['days']} day(s), {result['ranked']} ranking row(s)"
+            f"{'' if result['changed'] else ' (unchanged)'}."
+        ))
@@ -0,0 +1,39 @@
+"""
+Release stock held by unpaid orders whose reservation TTL has passed.
+Run periodically (e.g. every 5 minutes via Railway cron):
+    python manage.py release_expired_reservations
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Order, StockReservation
+from api.services.inventory_service import InventoryService
+from api.services.order_state_service import OrderStateService
+
+
+class Command(BaseCommand):
+    help = 'Cancel PENDING orders with expired stock reservations, restoring stock and coupon uses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders processed per transaction')
+
+    def handle(self, *args, **options):
+        total_orders = total_released = 0
+        while True:
+            order_ids = InventoryService.expired_order_ids(limit=options['batch_size'])
+            if not order_ids:
+                break
+            with transaction.atomic():
+                # Guarded transition: an order paid in the meantime is left alone
+                expired = OrderStateService.bulk_transition(
+                    Order.objects.filter(pk__in=order_ids, status='PENDING'), 'CANCELLED', payment_status='EXPIRED'
+                )
+                # A PENDING order's reservations were all ACTIVE, so these are the ones just released
+                total_released += StockReservation.objects.filter(
+                    order_id__in=expired, status=StockReservation.RELEASED
+                ).count()
+            total_orders += len(expired)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {total_orders} order(s), released {total_released} reservation(s).'
+        ))
@@ -0,0 +1,51 @@
+"""
+Re-apply stored Razorpay webhook events received in a time window
+(e.g. after fixing a handler bug or restoring the database).
+    python manage.py replay_webhooks --hours 6
+    python manage.py replay_webhooks --since 2024-05-01T10:00 --until 2024-05-01T12:00 --event payment.captured
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.models import WebhookEvent
+from api.services.webhook_service import WebhookService
+
+
+def _when(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise CommandError(f'Not a date/time: {value!r} (use ISO 8601, e.g. 2024-05-01T10:00)')
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+class Command(BaseCommand):
+    help = 'Reprocess stored Razorpay webhook events received in a time window'
+
+    def add_arguments(self, parser):
+        window = parser.add_mutually_exclusive_group(required=True)
+        window.add_argument('--since', type=_when, help='Start of the window (ISO 8601)')
+        window.add_argument('--hours', type=float, help='Window is the last N hours')
+        parser.add_argument('--until', type=_when, default=None, help='End of the window (default: now)')
+        parser.add_argument('--event', action='append', default=None, help='Only this event type (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be replayed')
+
+    def handle(self, *args, **options):
+        since = options['since'] or timezone.now() - timedelta(hours=options['hours'])
+        until = options['until']
+
+        if options['dry_run']:
+            queryset = WebhookEvent.objects.filter(received_at__gte=since)
+            if until is not None:
+                queryset = queryset.filter(received_at__lt=until)
+            if options['event']:
+                queryset = queryset.filter(event__in=options['event'])
+            for event in queryset.order_by('received_at'):
+                self.stdout.write(f'  {event.received_at:%Y-%m-%d %H:%M:%S} {event.event} {event.event_id} ({event.status})')
+            self.stdout.write(self.style.SUCCESS(f'Would replay {queryset.count()} event(s).'))
+            return
+
+        replayed = WebhookService.replay(since, until, events=options['event'])
+        self.stdout.write(self.style.SUCCESS(f'Replayed {replayed} event(s).'))
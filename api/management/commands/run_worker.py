@@ -0,0 +1,58 @@
+"""
+Run the background task worker (see api/tasks.py).
+Runs until SIGTERM/SIGINT, finishing the task in hand first. On Railway add a
+second service with the Procfile `worker` process:
+    python manage.py run_worker
+    python manage.py run_worker --once      # drain due tasks and exit (cron / tests)
+"""
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.email_utils import close_email_connections
+from api.tasks import requeue_stale, run_pending, worker_id
+
+
+class Command(BaseCommand):
+    help = 'Process queued background tasks (emails) with retries and dead-lettering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run every due task, then exit')
+        parser.add_argument('--batch-size', type=int, default=20, help='Tasks run per poll')
+        parser.add_argument(
+            '--sleep', type=float, default=getattr(settings, 'TASK_QUEUE_POLL_SECONDS', 2.0),
+            help='Seconds to wait when the queue is empty',
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        if not options['once']:
+            signal.signal(signal.SIGTERM, self._stop)
+            signal.signal(signal.SIGINT, self._stop)
+
+        worker = worker_id()
+        totals = {}
+        self.stdout.write(f'Task worker {worker} started')
+        while not self.stopping:
+            close_old_connections()
+            stale = requeue_stale()
+            if stale:
+                self.stdout.write(self.style.WARNING(f'  re-queued {stale} stale task(s)'))
+            results = run_pending(limit=options['batch_size'], worker=worker)
+            for outcome, count in results.items():
+                totals[outcome] = totals.get(outcome, 0) + count
+            if not results:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        close_email_connections()
+        summary = ', '.join(f'{count} {outcome.lower()}' for outcome, count in sorted(totals.items()))
+        self.stdout.write(self.style.SUCCESS(f'Processed {sum(totals.values())} task(s). {summary}'.strip()))
+
+    def _stop(self, signum, frame):
+        self.stdout.write(f'Received signal {signum}, stopping after the current batch')
+        self.stopping = True
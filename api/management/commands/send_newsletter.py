@@ -0,0 +1,34 @@
+"""
+Send a newsletter campaign in the foreground (instead of via run_worker).
+Resumes from where a previous run stopped; drafts are started first.
+    python manage.py send_newsletter 12
+    python manage.py send_newsletter 12 --batch-size 50
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import NewsletterCampaign
+from api.services.newsletter_service import NewsletterService
+
+
+class Command(BaseCommand):
+    help = 'Broadcast a newsletter campaign to all active subscribers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_id', type=int)
+        parser.add_argument('--batch-size', type=int, default=None, help='Subscribers per batch')
+
+    def handle(self, *args, **options):
+        try:
+            campaign = NewsletterCampaign.objects.get(pk=options['campaign_id'])
+        except NewsletterCampaign.DoesNotExist:
+            raise CommandError(f"Campaign #{options['campaign_id']} does not exist")
+
+        if campaign.status == NewsletterCampaign.DRAFT:
+            NewsletterService.start(campaign)
+
+        outcome = NewsletterService.send(campaign.pk, batch_size=options['batch_size'])
+        campaign.refresh_from_db()
+        self.stdout.write(
+            f'Campaign #{campaign.pk} {outcome}: {campaign.sent_count} sent, {campaign.failed_count} failed '
+            f'of {campaign.total_recipients}'
+        )
@@ -0,0 +1,50 @@
+"""
+Mark orders SHIPPED with tracking numbers from a CSV (header: order_id,tracking_number).
+Orders that cannot ship (unpaid, cancelled, already shipped) are reported and skipped.
+    python manage.py ship_orders shipments.csv
+    python manage.py ship_orders shipments.csv --dry-run
+"""
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Order
+from api.services.order_state_service import OrderStateService
+
+
+class Command(BaseCommand):
+    help = 'Mark orders SHIPPED with tracking numbers from a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='CSV with order_id and tracking_number columns')
+        parser.add_argument('--dry-run', action='store_true', help='Only report which orders would ship')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_path'], newline='', encoding='utf-8-sig') as handle:
+                reader = csv.DictReader(handle)
+                if not {'order_id', 'tracking_number'} <= set(reader.fieldnames or ()):
+                    raise CommandError('CSV needs order_id and tracking_number columns')
+                tracking_numbers = {
+                    row['order_id'].strip(): row['tracking_number'].strip()
+                    for row in reader if row['order_id'] and row['tracking_number']
+                }
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['csv_path']}: {e}")
+
+        if options['dry_run']:
+            sources = OrderStateService.sources('SHIPPED')
+            statuses = dict(Order.objects.filter(order_id__in=tracking_numbers).values_list('order_id', 'status'))
+            ready = [order_id for order_id in tracking_numbers if statuses.get(order_id) in sources]
+            for order_id in tracking_numbers:
+                if order_id not in ready:
+                    self.stdout.write(f"  skip {order_id}: {statuses.get(order_id, 'not found')}")
+            self.stdout.write(self.style.SUCCESS(f'Would ship {len(ready)} of {len(tracking_numbers)} order(s).'))
+            return
+
+        result = OrderStateService.bulk_ship(tracking_numbers)
+        for order_id, reason in result['skipped'].items():
+            self.stdout.write(f'  skip {order_id}: {reason}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Shipped {len(result['shipped'])} of {len(tracking_numbers)} order(s)."
+        ))
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:53
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def create_search_indexes(apps, schema_editor):
+    """GIN indexes + backfill. Postgres only — SQLite keeps the icontains search."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS product_search_vector_idx "
+        "ON api_product USING GIN (search_vector)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS product_name_trgm_idx "
+        "ON api_product USING GIN (name gin_trgm_ops)"
+    )
+    # Must match api.search.build_search_vector
+    schema_editor.execute(
+        "UPDATE api_product p SET search_vector = "
+        "setweight(to_tsvector('english', coalesce(p.name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(c.name, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(p.description, '')), 'C') "
+        "FROM api_category c WHERE c.id = p.category_id"
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS product_search_vector_idx")
+    schema_editor.execute("DROP INDEX IF EXISTS product_name_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_userprofile'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
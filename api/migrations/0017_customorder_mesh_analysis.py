@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customorder',
+            name='analysis_error',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='customorder',
+            name='analysis_status',
+            field=models.CharField(choices=[('NONE', 'No design file'), ('PENDING', 'Pending'), ('DONE', 'Analysed'), ('FAILED', 'Failed'), ('UNSUPPORTED', 'Unsupported format')], db_index=True, default='NONE', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='customorder',
+            name='analyzed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customorder',
+            name='mesh_size_x',
+            field=models.FloatField(blank=True, help_text='Bounding box X (mm)', null=True),
+        ),
+        migrations.AddField(
+            model_name='customorder',
+            name='mesh_size_y',
+            field=models.FloatField(blank=True, help_text='Bounding box Y (mm)', null=True),
+        ),
+        migrations.AddField(
+            model_name='customorder',
+            name='mesh_size_z',
+            field=models.FloatField(blank=True, help_text='Bounding box Z (mm)', null=True),
+        ),
+        migrations.AddField(
+            model_name='customorder',
+            name='mesh_surface_area',
+            field=models.FloatField(blank=True, help_text='Surface area (mm²)', null=True),
+        ),
+        migrations.AddField(
+            model_name='customorder',
+            name='mesh_triangle_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customorder',
+            name='mesh_volume',
+            field=models.FloatField(blank=True, help_text='Enclosed volume (mm³)', null=True),
+        ),
+    ]
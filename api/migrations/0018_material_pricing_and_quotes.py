@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:12
+
+import django.core.serializers.json
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# code: (density g/cm³, ₹/kg, printed cm³/hour)
+DEFAULT_PRICING = {
+    'PLA': ('1.240', '1200', '12'),
+    'ABS': ('1.040', '1400', '10'),
+    'PETG': ('1.270', '1500', '10'),
+    'TPU': ('1.210', '2500', '6'),
+    'NYLON': ('1.140', '4000', '8'),
+}
+
+
+def seed_pricing(apps, schema_editor):
+    Material = apps.get_model('api', 'Material')
+    MaterialPricing = apps.get_model('api', 'MaterialPricing')
+    for code, (density, price_per_kg, print_rate) in DEFAULT_PRICING.items():
+        MaterialPricing.objects.get_or_create(code=code, defaults={
+            'material': Material.objects.filter(name__iexact=code, pricing__isnull=True).first(),
+            'density': density,
+            'price_per_kg': price_per_kg,
+            'print_rate': print_rate,
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_customorder_mesh_analysis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customorder',
+            name='quote_breakdown',
+            field=models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder),
+        ),
+        migrations.CreateModel(
+            name='MaterialPricing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(help_text='Matches CustomOrder.material (PLA, ABS, PETG, TPU, NYLON)', max_length=20, unique=True)),
+                ('density', models.DecimalField(decimal_places=3, help_text='g/cm³', max_digits=5, validators=[django.core.validators.MinValueValidator(0)])),
+                ('price_per_kg', models.DecimalField(decimal_places=2, help_text='₹ per kg of filament', max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('infill_factor', models.DecimalField(decimal_places=3, default=0.35, help_text='Fraction of the solid volume actually printed (walls + infill)', max_digits=4, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(1)])),
+                ('print_rate', models.DecimalField(decimal_places=2, help_text='Printed cm³ per hour', max_digits=6, validators=[django.core.validators.MinValueValidator(0.01)])),
+                ('machine_rate', models.DecimalField(decimal_places=2, default=60, help_text='₹ per printer hour', max_digits=8, validators=[django.core.validators.MinValueValidator(0)])),
+                ('setup_fee', models.DecimalField(decimal_places=2, default=100, help_text='₹ per piece', max_digits=8, validators=[django.core.validators.MinValueValidator(0)])),
+                ('minimum_price', models.DecimalField(decimal_places=2, default=199, help_text='₹ per piece', max_digits=8, validators=[django.core.validators.MinValueValidator(0)])),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('material', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pricing', to='api.material')),
+            ],
+            options={
+                'verbose_name_plural': 'Material pricing',
+                'ordering': ['code'],
+            },
+        ),
+        migrations.RunPython(seed_pricing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_order_razorpay_order_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BestSeller',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.PositiveSmallIntegerField(choices=[(7, 'Last 7 days'), (30, 'Last 30 days'), (90, 'Last 90 days')], help_text='Days')),
+                ('rank', models.PositiveIntegerField()),
+                ('quantity', models.PositiveIntegerField(help_text='Units sold in the window')),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['window', 'rank'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSalesDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.PositiveIntegerField()),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at'], name='order_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='productsalesday',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.product'),
+        ),
+        migrations.AddField(
+            model_name='bestseller',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.category'),
+        ),
+        migrations.AddField(
+            model_name='bestseller',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.product'),
+        ),
+        migrations.AddIndex(
+            model_name='productsalesday',
+            index=models.Index(fields=['day'], name='sales_day_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productsalesday',
+            constraint=models.UniqueConstraint(fields=('product', 'day'), name='sales_day_product_day_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='bestseller',
+            index=models.Index(fields=['window', 'rank'], name='best_seller_window_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bestseller',
+            index=models.Index(fields=['window', 'category', 'rank'], name='best_seller_category_rank_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bestseller',
+            constraint=models.UniqueConstraint(fields=('window', 'product'), name='best_seller_window_product_uniq'),
+        ),
+    ]
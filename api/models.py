@@ -1,9 +1,12 @@
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from django.utils.text import slugify
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 class UserProfile(models.Model):
@@ -40,10 +43,22 @@ class Category(models.Model):
         verbose_name_plural = 'Categories'
         ordering = ['name']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._search_name = instance.__dict__.get('name', models.DEFERRED)
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        stale = getattr(self, '_search_name', None) != self.name
         super().save(*args, **kwargs)
+        if stale:
+            # Category name is part of each product's search vector
+            from .search import refresh_category_search_vectors
+            refresh_category_search_vectors(self)
+            self._search_name = self.name
 
     def __str__(self):
         return self.name
@@ -55,6 +70,7 @@ class Material(models.Model):
     description = models.TextField(blank=True)
     properties = models.TextField(blank=True, help_text="Material properties and characteristics")
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['name']
@@ -63,6 +79,36 @@ class Material(models.Model):
         return self.name
 
 
+class MaterialPricing(models.Model):
+    """Print-cost parameters per material, used by the custom-order quoting engine"""
+    code = models.CharField(
+        max_length=20, unique=True,
+        help_text="Matches CustomOrder.material (PLA, ABS, PETG, TPU, NYLON)"
+    )
+    material = models.OneToOneField(
+        Material, on_delete=models.SET_NULL, null=True, blank=True, related_name='pricing'
+    )
+    density = models.DecimalField(max_digits=5, decimal_places=3, validators=[MinValueValidator(0)], help_text="g/cm³")
+    price_per_kg = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)], help_text="₹ per kg of filament")
+    infill_factor = models.DecimalField(
+        max_digits=4, decimal_places=3, default=0.35,
+        validators=[MinValueValidator(0), MaxValueValidator(1)],
+        help_text="Fraction of the solid volume actually printed (walls + infill)"
+    )
+    print_rate = models.DecimalField(max_digits=6, decimal_places=2, validators=[MinValueValidator(0.01)], help_text="Printed cm³ per hour")
+    machine_rate = models.DecimalField(max_digits=8, decimal_places=2, default=60, validators=[MinValueValidator(0)], help_text="₹ per printer hour")
+    setup_fee = models.DecimalField(max_digits=8, decimal_places=2, default=100, validators=[MinValueValidator(0)], help_text="₹ per piece")
+    minimum_price = models.DecimalField(max_digits=8, decimal_places=2, default=199, validators=[MinValueValidator(0)], help_text="₹ per piece")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['code']
+        verbose_name_plural = 'Material pricing'
+
+    def __str__(self):
+        return f"{self.code} pricing"
+
+
 class Product(models.Model):
     """Products available in the shop"""
     name = models.CharField(max_length=200)
@@ -92,17 +138,48 @@ class Product(models.Model):
     
     # SEO
     meta_description = models.TextField(blank=True, max_length=160)
+
+    # Full-text search (Postgres only — GIN indexed in migration 0012, see api/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination over the storefront listing (api/pagination.py)
+            models.Index(
+                fields=['-is_featured', '-created_at', 'id'],
+                condition=models.Q(is_available=True),
+                name='product_keyset_idx',
+            ),
+        ]
+
+    # Columns the search vector is built from (see api/search.py)
+    SEARCH_SOURCE_FIELDS = ('name', 'description', 'category_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._search_source = instance._search_source_values()
+        return instance
+
+    def _search_source_values(self) -> tuple:
+        # Read __dict__ so a deferred column is not fetched just to compare it
+        return tuple(self.__dict__.get(field, models.DEFERRED) for field in self.SEARCH_SOURCE_FIELDS)
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        search_source = self._search_source_values()
+        stale = getattr(self, '_search_source', None) != search_source
         super().save(*args, **kwargs)
+        if stale:
+            # Only name / description / category changes cost the extra UPDATE and category read
+            from .search import refresh_product_search_vector
+            refresh_product_search_vector(self)
+            self._search_source = search_source
 
     def __str__(self):
         return self.name
@@ -160,6 +237,34 @@ class CustomOrder(models.Model):
         null=True,
         help_text="Quoted price for the custom order"
     )
+
+    # Mesh analysis of design_file (filled in by `python manage.py analyze_custom_orders`)
+    ANALYSIS_NONE = 'NONE'
+    ANALYSIS_PENDING = 'PENDING'
+    ANALYSIS_DONE = 'DONE'
+    ANALYSIS_FAILED = 'FAILED'
+    ANALYSIS_UNSUPPORTED = 'UNSUPPORTED'
+    ANALYSIS_STATUS_CHOICES = [
+        (ANALYSIS_NONE, 'No design file'),
+        (ANALYSIS_PENDING, 'Pending'),
+        (ANALYSIS_DONE, 'Analysed'),
+        (ANALYSIS_FAILED, 'Failed'),
+        (ANALYSIS_UNSUPPORTED, 'Unsupported format'),
+    ]
+    analysis_status = models.CharField(
+        max_length=20, choices=ANALYSIS_STATUS_CHOICES, default=ANALYSIS_NONE, db_index=True
+    )
+    mesh_triangle_count = models.PositiveIntegerField(null=True, blank=True)
+    mesh_size_x = models.FloatField(null=True, blank=True, help_text="Bounding box X (mm)")
+    mesh_size_y = models.FloatField(null=True, blank=True, help_text="Bounding box Y (mm)")
+    mesh_size_z = models.FloatField(null=True, blank=True, help_text="Bounding box Z (mm)")
+    mesh_surface_area = models.FloatField(null=True, blank=True, help_text="Surface area (mm²)")
+    mesh_volume = models.FloatField(null=True, blank=True, help_text="Enclosed volume (mm³)")
+    analysis_error = models.CharField(max_length=255, blank=True)
+    analyzed_at = models.DateTimeField(null=True, blank=True)
+
+    # Automatic quote (see api/services/quote_service.py); quote_amount stays editable
+    quote_breakdown = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -203,6 +308,76 @@ class Newsletter(models.Model):
         return self.email
 
 
+class NewsletterCampaign(models.Model):
+    """A newsletter broadcast to all active subscribers (see services/newsletter_service.py)"""
+
+    DRAFT = 'DRAFT'
+    SENDING = 'SENDING'
+    SENT = 'SENT'
+    CANCELLED = 'CANCELLED'
+    STATUS_CHOICES = [
+        (DRAFT, 'Draft'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    subject = models.CharField(max_length=200)
+    body = models.TextField(help_text='Plain-text message')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=DRAFT)
+
+    total_recipients = models.PositiveIntegerField(default=0, help_text='Active subscribers when sending started')
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    last_subscriber_id = models.BigIntegerField(
+        default=0, help_text='Resume cursor: subscribers up to this id have been processed'
+    )
+    lease_expires_at = models.DateTimeField(null=True, blank=True, help_text='Held by the process currently sending')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
+
+
+class NewsletterDelivery(models.Model):
+    """Delivery state of one campaign to one subscriber"""
+
+    SENT = 'SENT'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    campaign = models.ForeignKey(NewsletterCampaign, on_delete=models.CASCADE, related_name='deliveries')
+    subscriber = models.ForeignKey(Newsletter, on_delete=models.SET_NULL, null=True, related_name='deliveries')
+    email = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    error = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'Newsletter deliveries'
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'subscriber'], name='newsletter_delivery_once'),
+        ]
+        indexes = [
+            # Daily provider quota: messages sent in the last 24h
+            models.Index(fields=['status', 'created_at'], name='newsletter_delivery_sent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign_id} → {self.email} ({self.status})"
+
+
 class Testimonial(models.Model):
     """Customer testimonials"""
     name = models.CharField(max_length=200)
@@ -223,6 +398,20 @@ class Testimonial(models.Model):
         return f"Testimonial from {self.name}"
 
 
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Material)
+@receiver(post_delete, sender=Material)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Testimonial)
+@receiver(post_delete, sender=Testimonial)
+def invalidate_catalog_cache(sender, **kwargs):
+    """Any staff edit to catalog data orphans all cached catalog responses."""
+    from .catalog_cache import bump_generation
+    bump_generation()
+
+
 class Coupon(models.Model):
     """Discount coupons"""
     DISCOUNT_TYPE_CHOICES = [
@@ -284,6 +473,8 @@ class Order(models.Model):
         ('CANCELLED', 'Cancelled'),
         ('FAILED', 'Payment Failed'),
     ]
+    # Legal transitions between these live in services/order_state_service.py
+    PAID_STATUSES = ('PAID', 'PROCESSING', 'SHIPPED', 'DELIVERED')
     
     # Order identification
     order_id = models.CharField(max_length=100, unique=True, editable=False)
@@ -313,6 +504,7 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)])
     coupon_code = models.CharField(max_length=50, blank=True)
+    coupon_redeemed = models.BooleanField(default=False, help_text='True while this order holds one use of coupon_code')
     
     # Payment tracking
     razorpay_order_id = models.CharField(max_length=100, blank=True, null=True)
@@ -331,6 +523,13 @@ class Order(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+            # Keyset pagination of a customer's orders (api/pagination.py)
+            models.Index(fields=['user', '-created_at', 'id'], name='order_user_keyset_idx'),
+            models.Index(fields=['customer_email', '-created_at', 'id'], name='order_email_keyset_idx'),
+            # Payment verification and webhooks look orders up by Razorpay's id
+            models.Index(fields=['razorpay_order_id'], name='order_razorpay_order_idx'),
+            # Incremental best-seller refresh reads orders changed since its last run
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
         ]
 
     def save(self, *args, **kwargs):
@@ -405,3 +604,184 @@ class Payment(models.Model):
 
     def __str__(self):
         return f"Payment for {self.order.order_id} - {self.status}"
+
+
+class StockReservation(models.Model):
+    """Stock held for a PENDING order while the customer pays (see api/services/inventory_service.py)"""
+
+    ACTIVE = 'ACTIVE'
+    COMMITTED = 'COMMITTED'
+    RELEASED = 'RELEASED'
+    STATUS_CHOICES = [
+        (ACTIVE, 'Active'),
+        (COMMITTED, 'Committed (paid)'),
+        (RELEASED, 'Released'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='stock_reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=ACTIVE)
+    expires_at = models.DateTimeField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for order {self.order_id} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """Stored response for a client-supplied Idempotency-Key (see api/idempotency.py)"""
+
+    IN_PROGRESS = 'IN_PROGRESS'
+    COMPLETED = 'COMPLETED'
+    STATUS_CHOICES = [
+        (IN_PROGRESS, 'In progress'),
+        (COMPLETED, 'Completed'),
+    ]
+
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=255, help_text='Who sent the key: user:<pk> or email:<address>')
+    endpoint = models.CharField(max_length=100)
+    request_hash = models.CharField(max_length=64, help_text='SHA-256 of the request body')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'endpoint', 'key'], name='idempotency_scope_endpoint_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.key} ({self.status})"
+
+
+class Task(models.Model):
+    """Durable background job, run by `python manage.py run_worker` (see api/tasks.py)"""
+
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    DEAD = 'DEAD'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (DEAD, 'Dead (gave up)'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now, help_text='Not picked up before this time (retry backoff)')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class WebhookEvent(models.Model):
+    """Inbox of received Razorpay webhooks, applied by the task worker (see services/webhook_service.py)"""
+
+    RECEIVED = 'RECEIVED'
+    PROCESSED = 'PROCESSED'
+    IGNORED = 'IGNORED'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (RECEIVED, 'Received'),
+        (PROCESSED, 'Processed'),
+        (IGNORED, 'Ignored'),
+        (FAILED, 'Failed'),
+    ]
+
+    event_id = models.CharField(max_length=100, unique=True, help_text='X-Razorpay-Event-Id')
+    event = models.CharField(max_length=50)
+    razorpay_order_id = models.CharField(max_length=100, blank=True, db_index=True)
+    payload = models.JSONField()
+    event_created_at = models.DateTimeField(null=True, blank=True, help_text="Razorpay's event timestamp")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=RECEIVED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-received_at']
+
+    def __str__(self):
+        return f"{self.event} {self.event_id} ({self.status})"
+
+
+class ProductSalesDay(models.Model):
+    """Units of a product sold on paid orders per day — input of the best-seller ranking (see services/ranking_service.py)"""
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='sales_day_product_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='sales_day_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} sold {self.quantity} on {self.day}"
+
+
+class BestSeller(models.Model):
+    """Precomputed best-seller rank of a product over a rolling window (see services/ranking_service.py)"""
+
+    WINDOW_CHOICES = [
+        (7, 'Last 7 days'),
+        (30, 'Last 30 days'),
+        (90, 'Last 90 days'),
+    ]
+
+    window = models.PositiveSmallIntegerField(choices=WINDOW_CHOICES, help_text='Days')
+    rank = models.PositiveIntegerField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    quantity = models.PositiveIntegerField(help_text='Units sold in the window')
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['window', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['window', 'product'], name='best_seller_window_product_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['window', 'rank'], name='best_seller_window_rank_idx'),
+            models.Index(fields=['window', 'category', 'rank'], name='best_seller_category_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.rank} ({self.window}d): {self.product_id}"
@@ -0,0 +1,188 @@
+"""
+Keyset (cursor) pagination — PrintBox3D
+Opt-in alternative to PageNumberPagination for deep listings.
+
+PageNumberPagination issues COUNT(*) and OFFSET scans, so page N costs O(N).
+Keyset pagination remembers the sort key of the last row it returned and
+seeks past it, so every page costs the same and no count query is issued.
+
+DRF's CursorPagination only seeks on the FIRST ordering field, which is
+useless when that field is a boolean like ``is_featured``. Here the whole
+composite key is used. Because orderings may mix directions (e.g.
+``-is_featured, -created_at, id``) a single row-value comparison is not
+possible, so the "rows after the cursor" set is split into one index-range
+query per ordering level, deepest first:
+
+    is_featured = a AND created_at = b AND id > c
+    is_featured = a AND created_at < b
+    is_featured < a
+
+Each is a plain range on a composite index matching the ordering; levels
+are only queried until the page is full (usually just the first one or two).
+
+A listing that is the union of several predicates (a customer's orders by
+account OR by email) would defeat those indexes if OR-ed in SQL;
+``paginate_querysets`` seeks each predicate on its own index instead and
+merges the pages in Python.
+"""
+
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class _FullPrecisionEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder truncates datetimes to milliseconds; keys need exact values."""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only composite keyset pagination.
+
+    Subclasses (or callers) set ``ordering``, e.g. ``('-created_at', 'id')``.
+    The last field must be unique so the key identifies a single row.
+    """
+    ordering = ('-created_at', 'id')
+    page_size = 20
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None, page_size=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+        if page_size is not None:
+            self.page_size = page_size
+
+    # ------------------------------------------------------------------
+    # Cursor encoding
+    # ------------------------------------------------------------------
+
+    def _field_names(self):
+        return [f.lstrip('-') for f in self.ordering]
+
+    def encode_cursor(self, obj) -> str:
+        values = [getattr(obj, name) for name in self._field_names()]
+        raw = json.dumps(values, cls=_FullPrecisionEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, queryset, encoded: str):
+        padded = encoded + '=' * (-len(encoded) % 4)
+        try:
+            values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            names = self._field_names()
+            if not isinstance(values, list) or len(values) != len(names):
+                raise ValueError
+            opts = queryset.model._meta
+            return [opts.get_field(name).to_python(value) for name, value in zip(names, values)]
+        except (ValueError, TypeError, binascii.Error, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    # ------------------------------------------------------------------
+    # Seeking
+    # ------------------------------------------------------------------
+
+    def _levels(self, values):
+        """Yield one filter per ordering level, deepest (tie-breaker) first."""
+        for depth in range(len(self.ordering) - 1, -1, -1):
+            filters = {}
+            for field, value in zip(self.ordering[:depth], values[:depth]):
+                filters[field.lstrip('-')] = value
+            field = self.ordering[depth]
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            filters[f"{field.lstrip('-')}__{lookup}"] = values[depth]
+            yield Q(**filters)
+
+    def _seek(self, queryset, values, want) -> list:
+        """Up to ``want`` rows of ``queryset`` after the cursor ``values`` (None = from the start)."""
+        queryset = queryset.order_by(*self.ordering)
+        if values is None:
+            return list(queryset[:want])
+        rows = []
+        for condition in self._levels(values):
+            rows.extend(queryset.filter(condition)[:want - len(rows)])
+            if len(rows) >= want:
+                break
+        return rows
+
+    def merge(self, querysets, values=None, limit=None) -> list:
+        """
+        Rows of several querysets in ``ordering``, each row once.
+
+        Every queryset is read separately (at most ``limit`` rows after the
+        cursor ``values``), then the results are merged and de-duplicated by pk.
+        """
+        rows = {}
+        for queryset in querysets:
+            fetched = self._seek(queryset, values, limit) if limit else queryset.order_by(*self.ordering)
+            for row in fetched:
+                rows.setdefault(row.pk, row)
+        merged = list(rows.values())
+        for field in reversed(self.ordering):  # stable sorts, least significant field first
+            merged.sort(key=lambda row: getattr(row, field.lstrip('-')), reverse=field.startswith('-'))
+        return merged[:limit] if limit else merged
+
+    def _paginate(self, querysets, request):
+        self.request = request
+        encoded = request.query_params.get(self.cursor_query_param, '')
+        values = self.decode_cursor(querysets[0], encoded) if encoded else None
+        want = self.page_size + 1  # one extra row tells us whether there is a next page
+        if len(querysets) == 1:
+            rows = self._seek(querysets[0], values, want)
+        else:
+            rows = self.merge(querysets, values, want)
+
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._paginate([queryset], request)
+
+    def paginate_querysets(self, querysets, request):
+        """Paginate the union of ``querysets`` (see ``merge``) without OR-ing them in SQL."""
+        return self._paginate(list(querysets), request)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ProductKeysetPagination(KeysetPagination):
+    """Matches the product_keyset_idx index on Product."""
+    ordering = ('-is_featured', '-created_at', 'id')
+
+
+class OrderKeysetPagination(KeysetPagination):
+    """Matches the order_*_keyset_idx indexes on Order."""
+    ordering = ('-created_at', 'id')
@@ -0,0 +1,104 @@
+"""
+Product search — PrintBox3D
+Postgres full-text search with a pg_trgm fallback for typos.
+
+On Postgres, ``Product.search_vector`` holds a weighted tsvector
+(name > category name > description) backed by a GIN index, and a trigram
+GIN index on ``name`` catches misspellings. Both predicates are OR-ed into a
+single query ranked by ``SearchRank`` + trigram similarity.
+
+On any other database (SQLite in development and tests) search degrades to
+DRF's SearchFilter behaviour (``icontains`` over name and description).
+"""
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity,
+)
+from django.db import connection
+from django.db.models import F, Q, Value
+from rest_framework import filters
+
+SEARCH_CONFIG = 'english'
+
+# Multiplier on pg_trgm similarity when it is added to the full-text rank, so
+# typo matches rank below genuine full-text matches
+TRIGRAM_WEIGHT = 0.5
+
+
+def is_postgres() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def build_search_vector(category_name: str):
+    """Weighted vector expression for Product rows of a single category."""
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Value(category_name or ''), weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_product_search_vector(product) -> None:
+    """Recompute ``search_vector`` for one product. No-op outside Postgres."""
+    if not is_postgres():
+        return
+    type(product).objects.filter(pk=product.pk).update(
+        search_vector=build_search_vector(product.category.name)
+    )
+
+
+def refresh_category_search_vectors(category) -> None:
+    """Recompute ``search_vector`` for every product in a category. No-op outside Postgres."""
+    if not is_postgres():
+        return
+    category.products.update(search_vector=build_search_vector(category.name))
+
+
+def search_products(queryset, text: str):
+    """
+    Full-text + trigram search, annotated with ``search_rank``.
+
+    Falls back to ``legacy_search`` outside Postgres.
+    """
+    if not is_postgres():
+        return legacy_search(queryset, text)
+
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    return queryset.filter(
+        Q(search_vector=query) | Q(name__trigram_similar=text)
+    ).annotate(
+        search_rank=SearchRank(F('search_vector'), query)
+        + TRIGRAM_WEIGHT * TrigramSimilarity('name', text)
+    )
+
+
+def legacy_search(queryset, text: str):
+    """The pre-FTS behaviour: every term must appear in name or description."""
+    for term in text.split():
+        queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+    return queryset
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """SearchFilter that uses ``search_products`` on Postgres."""
+
+    def filter_queryset(self, request, queryset, view):
+        if not is_postgres():
+            return super().filter_queryset(request, queryset, view)
+
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return search_products(queryset, ' '.join(terms))
+
+
+class ProductOrderingFilter(filters.OrderingFilter):
+    """Orders search results by relevance unless ``?ordering=`` is given."""
+
+    def filter_queryset(self, request, queryset, view):
+        if (
+            'search_rank' in queryset.query.annotations
+            and not request.query_params.get(self.ordering_param)
+        ):
+            return queryset.order_by('-search_rank', *self.get_default_ordering(view))
+        return super().filter_queryset(request, queryset, view)
@@ -4,6 +4,7 @@ from .models import (
     ContactMessage, Newsletter, Testimonial,
     Order, OrderItem, Payment, Coupon
 )
+from .uploads import DESIGN_FILE_EXTENSIONS, MAX_DESIGN_FILE_SIZE
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -15,6 +16,10 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'description', 'image_url', 'image', 'image_display_url', 'product_count', 'created_at']
     
     def get_product_count(self, obj):
+        # CategoryViewSet annotates this; bare instances (e.g. nested) fall back to a query
+        annotated = getattr(obj, 'available_product_count', None)
+        if annotated is not None:
+            return annotated
         return obj.products.filter(is_available=True).count()
 
     def get_image_display_url(self, obj):
@@ -80,15 +85,14 @@ class CustomOrderSerializer(serializers.ModelSerializer):
         """Validate file size and type"""
         if value:
             # Max file size: 10MB
-            if value.size > 10 * 1024 * 1024:
+            if value.size > MAX_DESIGN_FILE_SIZE:
                 raise serializers.ValidationError("File size cannot exceed 10MB")
             
             # Allowed extensions
-            allowed_extensions = ['.stl', '.obj', '.3mf', '.step', '.stp', '.jpg', '.jpeg', '.png', '.pdf']
             file_ext = value.name.lower().split('.')[-1]
-            if f".{file_ext}" not in allowed_extensions:
+            if f".{file_ext}" not in DESIGN_FILE_EXTENSIONS:
                 raise serializers.ValidationError(
-                    f"File type not allowed. Allowed types: {', '.join(allowed_extensions)}"
+                    f"File type not allowed. Allowed types: {', '.join(DESIGN_FILE_EXTENSIONS)}"
                 )
         return value
 
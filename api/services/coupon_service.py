@@ -0,0 +1,72 @@
+"""
+Coupon Service — PrintBox3D
+Race-free coupon redemption.
+
+Redemption is a single conditional UPDATE:
+
+    UPDATE api_coupon SET times_used = times_used + 1
+    WHERE id = %s AND is_active AND (max_uses IS NULL OR times_used < max_uses)
+
+The affected-row count decides whether the discount applies, so concurrent
+checkouts can never push ``times_used`` past ``max_uses``.
+
+Usage:
+    from api.services.coupon_service import CouponService
+    if CouponService.redeem(coupon):
+        ...apply discount, set order.coupon_redeemed = True...
+    CouponService.release([order.pk])   # order FAILED / CANCELLED
+"""
+
+import logging
+
+from django.db.models import F, Q
+
+from ..models import Coupon, Order
+
+logger = logging.getLogger(__name__)
+
+
+class CouponService:
+    """Atomic coupon usage counters."""
+
+    @staticmethod
+    def redeem(coupon) -> bool:
+        """
+        Claim one use of ``coupon``.
+
+        Returns:
+            True if a use was claimed, False if the coupon is exhausted or inactive.
+        """
+        claimed = Coupon.objects.filter(
+            Q(max_uses__isnull=True) | Q(times_used__lt=F('max_uses')),
+            pk=coupon.pk,
+            is_active=True,
+        ).update(times_used=F('times_used') + 1)
+        if not claimed:
+            logger.info(f"[Coupon] {coupon.code} exhausted — redemption refused")
+        return bool(claimed)
+
+    @staticmethod
+    def release(order_ids) -> int:
+        """
+        Give back the coupon uses claimed by the given orders.
+
+        Idempotent: ``Order.coupon_redeemed`` is flipped with a conditional
+        UPDATE first, so each order returns its use at most once.
+
+        Returns:
+            Number of uses returned.
+        """
+        orders = list(
+            Order.objects.filter(pk__in=order_ids, coupon_redeemed=True)
+            .values_list('pk', 'coupon_code')
+        )
+        released = 0
+        for pk, code in orders:
+            if not Order.objects.filter(pk=pk, coupon_redeemed=True).update(coupon_redeemed=False):
+                continue  # another worker got there first
+            Coupon.objects.filter(code=code, times_used__gt=0).update(times_used=F('times_used') - 1)
+            released += 1
+        if released:
+            logger.info(f"[Coupon] Returned {released} coupon use(s) for orders {list(order_ids)}")
+        return released
@@ -0,0 +1,161 @@
+"""
+Inventory Service — PrintBox3D
+Atomic stock reservation for checkout.
+
+create_order reserves stock while the customer pays; the reservation is
+committed when payment succeeds and released (stock restored) when payment
+fails, the order's reservation TTL expires, or a paid order is cancelled.
+
+All methods must run inside ``transaction.atomic()`` (they take row locks).
+Product rows are always locked in primary-key order so concurrent checkouts
+touching overlapping carts cannot deadlock.
+
+Usage:
+    from api.services.inventory_service import InventoryService
+    with transaction.atomic():
+        products = InventoryService.lock_products(ids)
+        ...
+        InventoryService.reserve(order, {product_id: quantity, ...})
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from ..models import Product, StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    """Raised when a guarded stock decrement does not match every product."""
+
+
+def _invalidate_catalog():
+    # Stock is shown in product responses; queryset.update() sends no signals
+    from ..catalog_cache import bump_stock_generation
+    transaction.on_commit(bump_stock_generation)
+
+
+class InventoryService:
+    """Stock reservation, commit and release."""
+
+    @staticmethod
+    def reservation_ttl() -> timedelta:
+        return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_TTL_MINUTES', 30))
+
+    @staticmethod
+    def lock_products(product_ids) -> dict:
+        """
+        Lock available products with SELECT ... FOR UPDATE, in pk order.
+
+        Returns:
+            {pk: Product}
+        """
+        products = (
+            Product.objects.select_for_update()
+            .filter(pk__in=product_ids, is_available=True)
+            .order_by('pk')
+        )
+        return {product.pk: product for product in products}
+
+    @staticmethod
+    def reserve(order, requested: dict) -> list:
+        """
+        Decrement stock for ``{product_id: quantity}`` and record reservations.
+
+        The decrement is a single guarded UPDATE using F() expressions, so it
+        can never drive stock negative even if the caller skipped locking.
+
+        Raises:
+            InsufficientStock: if any product lacks the requested quantity.
+        """
+        guard = Q()
+        for pk, quantity in requested.items():
+            guard |= Q(pk=pk, stock_quantity__gte=quantity)
+
+        updated = Product.objects.filter(guard).update(
+            stock_quantity=Case(
+                *[When(pk=pk, then=F('stock_quantity') - quantity) for pk, quantity in requested.items()],
+                default=F('stock_quantity'),
+                output_field=PositiveIntegerField(),
+            ),
+            updated_at=Now(),
+        )
+        if updated != len(requested):
+            raise InsufficientStock('Some items went out of stock while you were checking out.')
+
+        expires_at = timezone.now() + InventoryService.reservation_ttl()
+        reservations = StockReservation.objects.bulk_create([
+            StockReservation(order=order, product_id=pk, quantity=quantity, expires_at=expires_at)
+            for pk, quantity in requested.items()
+        ])
+        _invalidate_catalog()
+        logger.info(f"[Inventory] Reserved {len(reservations)} line(s) for order {order.order_id}")
+        return reservations
+
+    @staticmethod
+    def commit(order_ids) -> int:
+        """Mark active reservations as committed (stock stays decremented)."""
+        return StockReservation.objects.filter(
+            order_id__in=order_ids, status=StockReservation.ACTIVE
+        ).update(status=StockReservation.COMMITTED, updated_at=Now())
+
+    @staticmethod
+    def release(order_ids, include_committed: bool = False) -> int:
+        """
+        Release active reservations for the given orders and restore stock.
+
+        Idempotent: only ACTIVE reservations are touched, plus COMMITTED ones
+        with ``include_committed`` (cancelling an order that was already paid).
+
+        Returns:
+            Number of reservations released.
+        """
+        statuses = [StockReservation.ACTIVE]
+        if include_committed:
+            statuses.append(StockReservation.COMMITTED)
+        reservations = list(
+            StockReservation.objects.select_for_update()
+            .filter(order_id__in=order_ids, status__in=statuses)
+            .order_by('product_id', 'pk')
+        )
+        if not reservations:
+            return 0
+
+        restore = {}
+        for reservation in reservations:
+            restore[reservation.product_id] = restore.get(reservation.product_id, 0) + reservation.quantity
+
+        # Same lock order as lock_products()
+        list(Product.objects.select_for_update().filter(pk__in=restore).order_by('pk').values_list('pk', flat=True))
+        Product.objects.filter(pk__in=restore).update(
+            stock_quantity=Case(
+                *[When(pk=pk, then=F('stock_quantity') + quantity) for pk, quantity in restore.items()],
+                default=F('stock_quantity'),
+                output_field=PositiveIntegerField(),
+            ),
+            updated_at=Now(),
+        )
+        StockReservation.objects.filter(pk__in=[r.pk for r in reservations]).update(
+            status=StockReservation.RELEASED, updated_at=Now()
+        )
+        _invalidate_catalog()
+        logger.info(f"[Inventory] Released {len(reservations)} reservation(s) for orders {list(order_ids)}")
+        return len(reservations)
+
+    @staticmethod
+    def expired_order_ids(limit: int = 500) -> list:
+        """Ids of PENDING orders holding an ACTIVE reservation past its expiry."""
+        return list(
+            StockReservation.objects.filter(
+                status=StockReservation.ACTIVE,
+                expires_at__lte=timezone.now(),
+                order__status='PENDING',
+            ).values_list('order_id', flat=True).distinct()[:limit]
+        )
@@ -0,0 +1,91 @@
+"""
+Mesh Analysis Service — PrintBox3D
+Runs api.mesh over custom-order design files and stores the results on the
+CustomOrder for the admin (and quoting).
+
+Uploads only mark an order ``analysis_status=PENDING``; the analysis runs
+out of band in ``python manage.py analyze_custom_orders`` so request
+workers never parse meshes. A successful analysis is quoted straight away
+(see quote_service).
+
+Usage:
+    from api.services.mesh_service import MeshAnalysisService
+    MeshAnalysisService.queue(custom_order)     # after a design file is attached
+    MeshAnalysisService.analyze(custom_order)   # from the worker / command
+"""
+
+import logging
+
+from django.utils import timezone
+
+from ..mesh import MeshError, UnsupportedMesh, analyze_file
+from ..models import CustomOrder
+from .quote_service import QuoteService
+
+logger = logging.getLogger(__name__)
+
+_RESULT_FIELDS = [
+    'analysis_status', 'analysis_error', 'analyzed_at', 'mesh_triangle_count',
+    'mesh_size_x', 'mesh_size_y', 'mesh_size_z', 'mesh_surface_area', 'mesh_volume',
+]
+
+
+class MeshAnalysisService:
+    """Queue and run design-file mesh analysis."""
+
+    @staticmethod
+    def queue(custom_order) -> None:
+        """Mark ``custom_order`` for analysis if it has a design file."""
+        if not custom_order.design_file:
+            return
+        CustomOrder.objects.filter(pk=custom_order.pk).update(
+            analysis_status=CustomOrder.ANALYSIS_PENDING, analysis_error='', updated_at=timezone.now(),
+        )
+        custom_order.analysis_status = CustomOrder.ANALYSIS_PENDING
+
+    @staticmethod
+    def analyze(custom_order) -> str:
+        """
+        Analyse the order's design file and save the results.
+
+        Returns:
+            The resulting analysis_status.
+        """
+        order = custom_order
+        order.analysis_error = ''
+        order.analyzed_at = timezone.now()
+        try:
+            with order.design_file.open('rb') as fh:
+                stats = analyze_file(fh, order.design_file.name, size=order.design_file.size)
+        except UnsupportedMesh as exc:
+            order.analysis_status = CustomOrder.ANALYSIS_UNSUPPORTED
+            order.analysis_error = str(exc)[:255]
+        except MeshError as exc:
+            order.analysis_status = CustomOrder.ANALYSIS_FAILED
+            order.analysis_error = str(exc)[:255]
+        except Exception as exc:
+            logger.error(f"[Mesh] Analysis of custom order #{order.pk} failed: {exc}", exc_info=True)
+            order.analysis_status = CustomOrder.ANALYSIS_FAILED
+            order.analysis_error = f'Could not read design file: {exc}'[:255]
+        else:
+            order.analysis_status = CustomOrder.ANALYSIS_DONE
+            order.mesh_triangle_count = stats.triangle_count
+            order.mesh_size_x, order.mesh_size_y, order.mesh_size_z = stats.size
+            order.mesh_surface_area = stats.surface_area
+            order.mesh_volume = stats.volume
+            logger.info(
+                f"[Mesh] Custom order #{order.pk}: {stats.triangle_count} triangles, "
+                f"{stats.volume / 1000:.2f} cm³"
+            )
+        order.save(update_fields=_RESULT_FIELDS)
+        if order.analysis_status == CustomOrder.ANALYSIS_DONE:
+            QuoteService.quote_orders(CustomOrder.objects.filter(pk=order.pk))
+        return order.analysis_status
+
+    @staticmethod
+    def pending(limit: int = 50) -> list:
+        """Oldest custom orders waiting for analysis."""
+        return list(
+            CustomOrder.objects.filter(analysis_status=CustomOrder.ANALYSIS_PENDING)
+            .order_by('created_at', 'pk')[:limit]
+        )
@@ -0,0 +1,195 @@
+"""
+Newsletter Service — PrintBox3D
+Broadcast a NewsletterCampaign to every active subscriber.
+
+    - subscribers are read in keyset batches (id > cursor ORDER BY id LIMIT n),
+      so memory stays flat however many there are
+    - each batch goes out over the pooled email transport (one SMTP session,
+      or one Resend /emails/batch request per 100 recipients)
+    - sending is paced to NEWSLETTER_SEND_RATE messages/second and stops for
+      the day at NEWSLETTER_DAILY_QUOTA messages (the provider's limits)
+    - after each batch a NewsletterDelivery row per recipient and the
+      campaign's resume cursor are saved; a crashed or paused run resumes at
+      the next unsent subscriber (a hard crash mid-batch can re-send at most
+      that one batch)
+    - a lease on the campaign keeps two processes from sending it at once
+
+Sending runs in the task worker in time-boxed slices that re-queue
+themselves (``newsletter.broadcast``), or in the foreground with
+``python manage.py send_newsletter``.
+
+Usage:
+    from api.services.newsletter_service import NewsletterService
+    NewsletterService.start(campaign)          # DRAFT → SENDING, queues the worker task
+    NewsletterService.send(campaign.pk)        # run until done / paused / out of quota
+"""
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..email_utils import send_bulk_emails
+from ..models import Newsletter, NewsletterCampaign, NewsletterDelivery
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 120
+
+# Outcomes of NewsletterService.send()
+FINISHED = 'finished'    # every subscriber processed
+PAUSED = 'paused'        # time budget used up; call again to continue
+QUOTA = 'quota'          # daily quota reached; continue later
+BUSY = 'busy'            # another process holds the campaign lease
+INACTIVE = 'inactive'    # campaign is not SENDING (draft, cancelled, already sent)
+
+
+class _Throttle:
+    """Paces sends to ``rate`` messages per second (0 = unpaced)."""
+
+    def __init__(self, rate: float, sleep=time.sleep, clock=time.monotonic):
+        self.rate = rate
+        self.sleep = sleep
+        self.clock = clock
+        self.next_at = clock()
+
+    def wait(self, messages: int) -> None:
+        if self.rate <= 0:
+            return
+        now = self.clock()
+        if self.next_at > now:
+            self.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + messages / self.rate
+
+
+class NewsletterService:
+    """Resumable, rate-limited newsletter broadcasts."""
+
+    @staticmethod
+    def start(campaign) -> bool:
+        """Move a DRAFT campaign to SENDING and queue it. Returns False if it was not a draft."""
+        from ..tasks import enqueue
+
+        started = NewsletterCampaign.objects.filter(pk=campaign.pk, status=NewsletterCampaign.DRAFT).update(
+            status=NewsletterCampaign.SENDING,
+            total_recipients=Newsletter.objects.filter(is_active=True).count(),
+            started_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        if started:
+            enqueue('newsletter.broadcast', campaign_id=campaign.pk)
+            logger.info(f"[Newsletter] Campaign #{campaign.pk} queued for sending")
+        return bool(started)
+
+    @staticmethod
+    def _acquire(campaign_id) -> bool:
+        now = timezone.now()
+        return bool(NewsletterCampaign.objects.filter(
+            Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now),
+            pk=campaign_id,
+        ).update(lease_expires_at=now + timedelta(seconds=LEASE_SECONDS)))
+
+    @staticmethod
+    def _quota_left() -> int | None:
+        quota = getattr(settings, 'NEWSLETTER_DAILY_QUOTA', 0)
+        if not quota:
+            return None
+        sent = NewsletterDelivery.objects.filter(
+            status=NewsletterDelivery.SENT, created_at__gte=timezone.now() - timedelta(days=1)
+        ).count()
+        return max(0, quota - sent)
+
+    @staticmethod
+    def _send_batch(campaign, batch) -> bool:
+        """
+        Send to ``batch`` [(subscriber_id, email)] and record the outcome.
+        Returns False if the campaign was cancelled in the meantime.
+        """
+        delivered = set(
+            NewsletterDelivery.objects.filter(
+                campaign=campaign, subscriber_id__in=[pk for pk, _ in batch], status=NewsletterDelivery.SENT,
+            ).values_list('subscriber_id', flat=True)
+        )
+        recipients = [(pk, email) for pk, email in batch if pk not in delivered]
+
+        failed = []
+        send_bulk_emails([(email, campaign.subject, campaign.body) for _, email in recipients], failed=failed)
+        errors = dict(failed)
+
+        NewsletterDelivery.objects.bulk_create([
+            NewsletterDelivery(
+                campaign=campaign, subscriber_id=pk, email=email,
+                status=NewsletterDelivery.FAILED if email in errors else NewsletterDelivery.SENT,
+                error=errors.get(email, '')[:500],
+            )
+            for pk, email in recipients
+        ], ignore_conflicts=True)
+
+        still_sending = NewsletterCampaign.objects.filter(pk=campaign.pk, status=NewsletterCampaign.SENDING).update(
+            last_subscriber_id=batch[-1][0],
+            sent_count=F('sent_count') + len(recipients) - len(errors),
+            failed_count=F('failed_count') + len(errors),
+            lease_expires_at=timezone.now() + timedelta(seconds=LEASE_SECONDS),
+            updated_at=timezone.now(),
+        )
+        campaign.last_subscriber_id = batch[-1][0]
+        return bool(still_sending)
+
+    @staticmethod
+    def send(campaign_id, batch_size: int | None = None, time_budget: float | None = None, sleep=time.sleep) -> str:
+        """
+        Send a SENDING campaign from its resume cursor.
+
+        Args:
+            batch_size:  Subscribers per batch (default NEWSLETTER_BATCH_SIZE).
+            time_budget: Stop with PAUSED after this many seconds.
+
+        Returns:
+            FINISHED, PAUSED, QUOTA, BUSY or INACTIVE.
+        """
+        batch_size = batch_size or getattr(settings, 'NEWSLETTER_BATCH_SIZE', 100)
+        if not NewsletterService._acquire(campaign_id):
+            return BUSY
+        try:
+            campaign = NewsletterCampaign.objects.get(pk=campaign_id)
+            if campaign.status != NewsletterCampaign.SENDING:
+                return INACTIVE
+
+            throttle = _Throttle(getattr(settings, 'NEWSLETTER_SEND_RATE', 10), sleep=sleep)
+            deadline = time.monotonic() + time_budget if time_budget else None
+            subscribers = Newsletter.objects.filter(is_active=True).order_by('pk')
+            while True:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return PAUSED
+                limit = batch_size
+                quota_left = NewsletterService._quota_left()
+                if quota_left is not None:
+                    if quota_left == 0:
+                        logger.info(f"[Newsletter] Daily quota reached, campaign #{campaign.pk} continues later")
+                        return QUOTA
+                    limit = min(limit, quota_left)
+
+                batch = list(
+                    subscribers.filter(pk__gt=campaign.last_subscriber_id).values_list('pk', 'email')[:limit]
+                )
+                if not batch:
+                    break
+                throttle.wait(len(batch))
+                if not NewsletterService._send_batch(campaign, batch):
+                    return INACTIVE
+
+            NewsletterCampaign.objects.filter(pk=campaign.pk, status=NewsletterCampaign.SENDING).update(
+                status=NewsletterCampaign.SENT, finished_at=timezone.now(), updated_at=timezone.now(),
+            )
+            campaign.refresh_from_db()
+            logger.info(
+                f"[Newsletter] Campaign #{campaign.pk} sent: {campaign.sent_count} delivered, "
+                f"{campaign.failed_count} failed"
+            )
+            return FINISHED
+        finally:
+            NewsletterCampaign.objects.filter(pk=campaign_id).update(lease_expires_at=None)
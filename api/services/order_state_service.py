@@ -0,0 +1,273 @@
+"""
+Order State Service — PrintBox3D
+The legal status transitions of Order and Payment, in one place.
+
+    PENDING ──► PAID ──► PROCESSING ──► SHIPPED ──► DELIVERED
+       │  ▲       │           │
+       │  │       └───────────┴──► CANCELLED
+       ▼  │
+     FAILED ──► CANCELLED          (PENDING ──► CANCELLED: reservation expired)
+
+FAILED ──► PAID exists because Razorpay lets a customer retry on the same
+order after a failed attempt. A FAILED order has already given back its
+stock and coupon use, so reviving it claims them again first (guarded stock
+decrement, conditional coupon redemption); if either is gone the order stays
+FAILED with payment_status CAPTURED, i.e. a captured payment to refund.
+
+Every transition is a conditional UPDATE ``... SET status = target WHERE
+status IN (legal sources)``, so concurrent writers (verify endpoint, webhook
+worker, reservation sweeper, admin) can never move an order backwards: the
+loser simply updates no row. Side effects run only for rows that actually
+moved:
+
+    → PAID                commit the order's stock reservations, queue the confirmation email
+                          (FAILED → PAID: reserve stock and redeem the coupon again first)
+    → FAILED / CANCELLED  release reserved stock and claimed coupon uses
+                          (CANCELLED from PAID / PROCESSING: restock the committed stock too)
+
+Bulk transitions are set-based (lock ids, one UPDATE, side effects for all
+moved ids) — e.g. shipping 500 orders is a handful of queries.
+
+Usage:
+    from api.services.order_state_service import OrderStateService
+    OrderStateService.transition(order.pk, 'PAID', payment_status='CAPTURED')   # → bool
+    OrderStateService.bulk_transition(Order.objects.filter(...), 'PROCESSING')   # → moved pks
+    OrderStateService.bulk_ship({'ORD2024…': 'TRACK123', ...})
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models import Case, CharField, Sum, Value, When
+from django.utils import timezone
+
+from ..models import Coupon, Order, OrderItem, Payment
+from .coupon_service import CouponService
+from .inventory_service import InsufficientStock, InventoryService
+
+logger = logging.getLogger(__name__)
+
+ORDER_TRANSITIONS = {
+    'PENDING': ('PAID', 'FAILED', 'CANCELLED'),
+    'FAILED': ('PAID', 'CANCELLED'),
+    'PAID': ('PROCESSING', 'SHIPPED', 'CANCELLED'),
+    'PROCESSING': ('SHIPPED', 'CANCELLED'),
+    'SHIPPED': ('DELIVERED',),
+    'DELIVERED': (),
+    'CANCELLED': (),
+}
+
+PAYMENT_TRANSITIONS = {
+    'CREATED': ('AUTHORIZED', 'CAPTURED', 'FAILED'),
+    'AUTHORIZED': ('CAPTURED', 'FAILED'),
+    'FAILED': ('CAPTURED',),
+    'CAPTURED': ('REFUNDED',),
+    'REFUNDED': (),
+}
+
+# Statuses whose stock reservations and coupon use were released on entry
+RELEASED_STATUSES = ('FAILED', 'CANCELLED')
+
+BULK_CHUNK = 500  # ids per UPDATE, well under every backend's parameter limit
+
+
+def _sources(transitions: dict, target: str) -> tuple:
+    if target not in transitions:
+        raise IllegalTransition(f'Unknown status {target!r}')
+    return tuple(state for state, targets in transitions.items() if target in targets)
+
+
+class IllegalTransition(ValueError):
+    """Raised for a status change the state machine does not allow."""
+
+
+class _HoldsUnavailable(Exception):
+    """A released order's stock or coupon use can no longer be claimed."""
+
+
+class OrderStateService:
+    """Guarded status transitions for orders and payments."""
+
+    @staticmethod
+    def can_transition(current: str, target: str) -> bool:
+        return target in ORDER_TRANSITIONS.get(current, ())
+
+    @staticmethod
+    def sources(target: str) -> tuple:
+        """Order statuses from which ``target`` may be reached."""
+        return _sources(ORDER_TRANSITIONS, target)
+
+    @staticmethod
+    def _holding_sources(target: str) -> tuple:
+        """Sources of ``target`` that still hold their stock and coupon use (plain UPDATE suffices)."""
+        sources = OrderStateService.sources(target)
+        if target != 'PAID':
+            return sources
+        return tuple(state for state in sources if state not in RELEASED_STATUSES)
+
+    @staticmethod
+    def _revive(order_pk, target: str, fields: dict) -> bool:
+        """
+        Move a FAILED order to PAID, claiming its stock and coupon use again.
+
+        Returns:
+            True if the order moved. False if it is not FAILED, or if its stock
+            or coupon use is gone — it then stays FAILED with ``fields`` applied
+            (payment_status CAPTURED marks a payment to refund).
+        """
+        released = [state for state in OrderStateService.sources(target) if state in RELEASED_STATUSES]
+        order = (
+            Order.objects.select_for_update().filter(pk=order_pk, status__in=released)
+            .only('pk', 'order_id', 'coupon_code', 'coupon_redeemed').first()
+        )
+        if order is None:
+            return False
+        requested = dict(
+            OrderItem.objects.filter(order_id=order_pk, product__isnull=False)
+            .values('product_id').annotate(quantity=Sum('quantity')).order_by()
+            .values_list('product_id', 'quantity')
+        )
+        try:
+            with transaction.atomic():
+                InventoryService.lock_products(requested)
+                InventoryService.reserve(order, requested)
+                if order.coupon_code and not order.coupon_redeemed:
+                    coupon = Coupon.objects.filter(code=order.coupon_code).first()
+                    if coupon is None or not CouponService.redeem(coupon):
+                        raise _HoldsUnavailable(f'coupon {order.coupon_code} exhausted')
+                    Order.objects.filter(pk=order_pk).update(coupon_redeemed=True)
+        except (InsufficientStock, _HoldsUnavailable) as exc:
+            if fields:
+                Order.objects.filter(pk=order_pk).update(updated_at=timezone.now(), **fields)
+            logger.error(f"[OrderState] Cannot revive FAILED order {order.order_id} as {target}: {exc}")
+            return False
+
+        Order.objects.filter(pk=order_pk).update(status=target, updated_at=timezone.now(), **fields)
+        OrderStateService._after(target, [order_pk])
+        logger.info(f"[OrderState] FAILED order {order.order_id} revived as {target}")
+        return True
+
+    @staticmethod
+    def _after(target: str, order_ids) -> None:
+        if not order_ids:
+            return
+        if target == 'PAID':
+            from ..tasks import enqueue
+
+            InventoryService.commit(order_ids)
+            # Queued in the same transaction, so exactly the path that wins sends it
+            for order_pk in order_ids:
+                enqueue('email.order_confirmation', order_id=order_pk)
+        elif target in ('FAILED', 'CANCELLED'):
+            # Only a cancelled paid order has committed stock; FAILED never follows PAID
+            InventoryService.release(order_ids, include_committed=target == 'CANCELLED')
+            CouponService.release(order_ids)
+
+    @staticmethod
+    def transition(order_pk, target: str, **fields) -> bool:
+        """
+        Move one order to ``target`` (one conditional UPDATE), setting ``fields`` too.
+
+        Returns:
+            True if this call moved the order; False if its current status does
+            not allow the transition (including a concurrent writer getting
+            there first).
+        """
+        holding = OrderStateService._holding_sources(target)
+        with transaction.atomic():
+            moved = Order.objects.filter(pk=order_pk, status__in=holding).update(
+                status=target, updated_at=timezone.now(), **fields
+            )
+            if moved:
+                OrderStateService._after(target, [order_pk])
+            elif holding != OrderStateService.sources(target):
+                moved = OrderStateService._revive(order_pk, target, fields)
+        return bool(moved)
+
+    @staticmethod
+    def bulk_transition(queryset, target: str, **fields) -> list:
+        """
+        Move every order in ``queryset`` that may legally reach ``target``.
+
+        Returns:
+            Primary keys of the orders that moved (others are left untouched).
+        """
+        holding = OrderStateService._holding_sources(target)
+        with transaction.atomic():
+            order_ids = list(
+                queryset.filter(status__in=holding).select_for_update().order_by('pk').values_list('pk', flat=True)
+            )
+            now = timezone.now()
+            for start in range(0, len(order_ids), BULK_CHUNK):
+                Order.objects.filter(pk__in=order_ids[start:start + BULK_CHUNK]).update(
+                    status=target, updated_at=now, **fields
+                )
+            OrderStateService._after(target, order_ids)
+            if holding != OrderStateService.sources(target):
+                # Orders whose holds were released need them back one by one
+                released = queryset.filter(status__in=OrderStateService.sources(target)).exclude(status__in=holding)
+                for order_pk in released.order_by('pk').values_list('pk', flat=True):
+                    if OrderStateService._revive(order_pk, target, fields):
+                        order_ids.append(order_pk)
+        if order_ids:
+            logger.info(f"[OrderState] {len(order_ids)} order(s) → {target}")
+        return order_ids
+
+    @staticmethod
+    def bulk_ship(tracking_numbers: dict) -> dict:
+        """
+        Mark orders SHIPPED with their tracking numbers.
+
+        Args:
+            tracking_numbers: {order_id (e.g. "ORD2024…"): tracking number}
+
+        Returns:
+            {'shipped': [order_id, ...], 'skipped': {order_id: reason}}
+        """
+        sources = OrderStateService.sources('SHIPPED')
+        shipped, skipped = [], {}
+        order_ids = list(tracking_numbers)
+        with transaction.atomic():
+            for start in range(0, len(order_ids), BULK_CHUNK):
+                chunk = order_ids[start:start + BULK_CHUNK]
+                rows = dict(
+                    Order.objects.filter(order_id__in=chunk).select_for_update().order_by('pk')
+                    .values_list('order_id', 'status')
+                )
+                eligible = [order_id for order_id in chunk if rows.get(order_id) in sources]
+                for order_id in chunk:
+                    if order_id not in rows:
+                        skipped[order_id] = 'not found'
+                    elif rows[order_id] not in sources:
+                        skipped[order_id] = f'cannot ship a {rows[order_id]} order'
+                if not eligible:
+                    continue
+                Order.objects.filter(order_id__in=eligible, status__in=sources).update(
+                    status='SHIPPED',
+                    tracking_number=Case(
+                        *[When(order_id=order_id, then=Value(tracking_numbers[order_id])) for order_id in eligible],
+                        output_field=CharField(),
+                    ),
+                    updated_at=timezone.now(),
+                )
+                shipped.extend(eligible)
+        logger.info(f"[OrderState] Shipped {len(shipped)} order(s), skipped {len(skipped)}")
+        return {'shipped': shipped, 'skipped': skipped}
+
+    @staticmethod
+    def transition_payment(order_pk, target: str, **fields) -> bool:
+        """Move an order's Payment row to ``target`` if legal. Returns True if it moved."""
+        return bool(Payment.objects.filter(
+            order_id=order_pk, status__in=_sources(PAYMENT_TRANSITIONS, target),
+        ).update(status=target, updated_at=timezone.now(), **fields))
+
+    @staticmethod
+    def transition_payments(order_ids, target: str, **fields) -> int:
+        """Bulk ``transition_payment`` for many orders. Returns the number of payments moved."""
+        sources = _sources(PAYMENT_TRANSITIONS, target)
+        moved = 0
+        for start in range(0, len(order_ids), BULK_CHUNK):
+            moved += Payment.objects.filter(
+                order_id__in=order_ids[start:start + BULK_CHUNK], status__in=sources,
+            ).update(status=target, updated_at=timezone.now(), **fields)
+        return moved
@@ -0,0 +1,148 @@
+"""
+Quote Service — PrintBox3D
+Automatic print-cost quotes for custom orders.
+
+For every order with an analysed mesh (see mesh_service) and a priced
+material (MaterialPricing):
+
+    printed volume  = mesh volume × infill factor                 (cm³)
+    filament mass   = printed volume × density                    (g)
+    print time      = printed volume / print rate                 (h)
+    unit price      = max(minimum, mass × ₹/kg + time × ₹/h + setup fee)
+    quote_amount    = unit price × quantity
+
+A whole batch is priced in one vectorised NumPy pass and written back with
+bulk_update, so re-pricing the backlog after a price change is a handful of
+queries regardless of its size.
+
+Quotes are only (re)written for orders still under review, and never over a
+quote_amount an admin has changed by hand (unless ``force=True``).
+
+Usage:
+    from api.services.quote_service import QuoteService
+    QuoteService.quote_orders(CustomOrder.objects.filter(pk=order.pk))
+    QuoteService.quote_backlog()                   # after editing MaterialPricing
+"""
+
+import logging
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+from django.utils import timezone
+
+from ..models import CustomOrder, MaterialPricing
+
+logger = logging.getLogger(__name__)
+
+# Orders whose quote may still change
+REQUOTABLE_STATUSES = ('PENDING', 'REVIEWING')
+
+_PARAMS = ('density', 'price_per_kg', 'infill_factor', 'print_rate', 'machine_rate', 'setup_fee', 'minimum_price')
+
+_CENT = Decimal('0.01')
+
+
+def _money(value) -> Decimal:
+    return Decimal(str(value)).quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+class QuoteService:
+    """Vectorised print-cost quoting."""
+
+    @staticmethod
+    def price(volume_mm3, quantity, params: dict) -> dict:
+        """
+        Price arrays of orders.
+
+        Args:
+            volume_mm3: array of mesh volumes (mm³)
+            quantity:   array of piece counts
+            params:     {name: array} for every name in _PARAMS, aligned with the orders
+
+        Returns:
+            {name: array} with mass_g, print_hours, material_cost, machine_cost,
+            unit_price and total.
+        """
+        volume_cm3 = np.asarray(volume_mm3, dtype=np.float64) / 1000.0
+        printed_cm3 = volume_cm3 * params['infill_factor']
+        mass_g = printed_cm3 * params['density']
+        print_hours = printed_cm3 / params['print_rate']
+        material_cost = mass_g / 1000.0 * params['price_per_kg']
+        machine_cost = print_hours * params['machine_rate']
+        unit_price = np.maximum(params['minimum_price'], material_cost + machine_cost + params['setup_fee'])
+        return {
+            'mass_g': mass_g,
+            'print_hours': print_hours,
+            'material_cost': material_cost,
+            'machine_cost': machine_cost,
+            'unit_price': unit_price,
+            'total': unit_price * np.asarray(quantity, dtype=np.float64),
+        }
+
+    @staticmethod
+    def quote_orders(queryset, force: bool = False, batch_size: int = 1000) -> int:
+        """
+        Quote every analysed, re-quotable order in ``queryset`` with a priced material.
+
+        Returns:
+            Number of orders whose quote was written.
+        """
+        pricing = {p.code: p for p in MaterialPricing.objects.all()}
+        if not pricing:
+            return 0
+        codes = sorted(pricing)
+        table = {
+            name: np.array([float(getattr(pricing[code], name)) for code in codes])
+            for name in _PARAMS
+        }
+
+        rows = list(
+            queryset.filter(
+                analysis_status=CustomOrder.ANALYSIS_DONE,
+                mesh_volume__isnull=False,
+                status__in=REQUOTABLE_STATUSES,
+                material__in=codes,
+            ).values_list('pk', 'material', 'quantity', 'mesh_volume', 'quote_amount', 'quote_breakdown')
+        )
+        if not force:
+            # A quote_amount that differs from the last automatic total was set by hand
+            rows = [
+                row for row in rows
+                if row[4] is None or (row[5].get('total') is not None and Decimal(row[5]['total']) == row[4])
+            ]
+        if not rows:
+            return 0
+
+        pks, materials, quantities, volumes, _, _ = zip(*rows)
+        index = np.searchsorted(codes, materials)
+        params = {name: values[index] for name, values in table.items()}
+        priced = QuoteService.price(volumes, quantities, params)
+
+        now = timezone.now()
+        orders = []
+        for i, pk in enumerate(pks):
+            total = _money(priced['total'][i])
+            orders.append(CustomOrder(pk=pk, quote_amount=total, quote_breakdown={
+                'material': materials[i],
+                'quantity': quantities[i],
+                'volume_cm3': round(volumes[i] / 1000.0, 3),
+                'mass_g': round(float(priced['mass_g'][i]), 2),
+                'print_hours': round(float(priced['print_hours'][i]), 2),
+                'material_cost': str(_money(priced['material_cost'][i])),
+                'machine_cost': str(_money(priced['machine_cost'][i])),
+                'setup_fee': str(_money(params['setup_fee'][i])),
+                'unit_price': str(_money(priced['unit_price'][i])),
+                'total': str(total),
+                'quoted_at': now.isoformat(),
+            }, updated_at=now))
+        CustomOrder.objects.bulk_update(orders, ['quote_amount', 'quote_breakdown', 'updated_at'], batch_size=batch_size)
+        logger.info(f"[Quote] Priced {len(orders)} custom order(s)")
+        return len(orders)
+
+    @staticmethod
+    def quote_backlog(codes=None, force: bool = False) -> int:
+        """Re-price all orders still under review (optionally only for some material codes)."""
+        queryset = CustomOrder.objects.all()
+        if codes is not None:
+            queryset = queryset.filter(material__in=list(codes))
+        return QuoteService.quote_orders(queryset, force=force)
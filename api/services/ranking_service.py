@@ -0,0 +1,176 @@
+"""
+Ranking Service — PrintBox3D
+Precomputed best-seller rankings over rolling 7 / 30 / 90 day windows.
+
+Nothing is aggregated per request. A periodic job keeps two small tables:
+
+    ProductSalesDay  units sold per (product, day) on paid orders
+    BestSeller       rank of every product that sold in each window
+
+and ``best_sellers`` reads the top rows of BestSeller through its
+(window, rank) / (window, category, rank) indexes.
+
+A refresh is incremental: only days with orders changed since the previous
+refresh (found through ``order_updated_idx``) are re-summed from OrderItem —
+re-summing a whole day makes it idempotent and picks up cancellations and
+refunds as well as new sales. The rankings are then rebuilt from the daily
+rows (at most products × 90 rows), so windows roll forward even on days
+without orders. The catalog cache is invalidated only if a ranking changed.
+
+Sales are dated by the order's creation date, in TIME_ZONE.
+
+Run periodically (e.g. hourly via Railway cron):
+    python manage.py refresh_best_sellers
+
+Usage:
+    from api.services.ranking_service import BestSellerService
+    BestSellerService.refresh()                          # incremental
+    BestSellerService.top(30, category_slug='home-decor', limit=6)   # → product ids
+"""
+
+import logging
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ..models import BestSeller, Order, OrderItem, ProductSalesDay
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = tuple(days for days, _ in BestSeller.WINDOW_CHOICES)
+DEFAULT_WINDOW = 30
+
+# Orders committed while a refresh was running carry an updated_at slightly older
+# than its start; re-reading this much before the watermark catches them
+OVERLAP = timedelta(minutes=5)
+
+
+def _day_ranges(days):
+    """Merge dates into [start, end) datetime ranges of consecutive days (index-friendly filters)."""
+    ranges = []
+    for day in sorted(days):
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+class BestSellerService:
+    """Incrementally maintained best-seller rankings."""
+
+    @staticmethod
+    def _changed_days(since, horizon) -> set:
+        """Sale days (>= horizon) of orders created or updated since ``since``."""
+        days = (
+            Order.objects.filter(updated_at__gte=since)
+            .annotate(day=TruncDate('created_at'))
+            .values_list('day', flat=True)
+            .distinct()
+        )
+        return {day for day in days if day >= horizon}
+
+    @staticmethod
+    def _resum_days(days) -> int:
+        """Rewrite ProductSalesDay for ``days`` from paid OrderItems. Returns rows written."""
+        in_days = Q()
+        for start, end in _day_ranges(days):
+            in_days |= Q(order__created_at__gte=start, order__created_at__lt=end)
+        sales = (
+            OrderItem.objects.filter(in_days, order__status__in=Order.PAID_STATUSES, product__isnull=False)
+            .annotate(day=TruncDate('order__created_at'))
+            .values('product_id', 'day')
+            .annotate(quantity=Sum('quantity'))
+            .order_by()
+        )
+        ProductSalesDay.objects.filter(day__in=days).delete()
+        rows = ProductSalesDay.objects.bulk_create([
+            ProductSalesDay(product_id=row['product_id'], day=row['day'], quantity=row['quantity'])
+            for row in sales
+        ])
+        return len(rows)
+
+    @staticmethod
+    def _rankings(today, computed_at) -> list:
+        """BestSeller rows for every window, built from the daily sales."""
+        totals = (
+            ProductSalesDay.objects.filter(day__gt=today - timedelta(days=max(WINDOWS)))
+            .values('product_id', 'product__category_id')
+            .annotate(**{
+                f'w{days}': Sum('quantity', filter=Q(day__gt=today - timedelta(days=days))) for days in WINDOWS
+            })
+            .order_by()
+        )
+        totals = list(totals)
+        rows = []
+        for days in WINDOWS:
+            sold = sorted(
+                (row for row in totals if row[f'w{days}']),
+                key=lambda row: (-row[f'w{days}'], row['product_id']),
+            )
+            rows.extend(
+                BestSeller(
+                    window=days, rank=rank, product_id=row['product_id'], category_id=row['product__category_id'],
+                    quantity=row[f'w{days}'], computed_at=computed_at,
+                )
+                for rank, row in enumerate(sold, start=1)
+            )
+        return rows
+
+    @staticmethod
+    def refresh(full: bool = False) -> dict:
+        """
+        Bring the rankings up to date.
+
+        Args:
+            full: Re-sum every day in the longest window instead of only changed days.
+
+        Returns:
+            {'days': re-summed days, 'sales_rows': ProductSalesDay rows written,
+             'ranked': BestSeller rows, 'changed': whether any ranking changed}
+        """
+        from ..catalog_cache import bump_generation
+
+        started = timezone.now()
+        today = timezone.localdate(started)
+        horizon = today - timedelta(days=max(WINDOWS) - 1)
+        watermark = BestSeller.objects.aggregate(last=Max('computed_at'))['last']
+
+        if full or watermark is None:
+            days = {horizon + timedelta(days=offset) for offset in range(max(WINDOWS))}
+        else:
+            days = BestSellerService._changed_days(watermark - OVERLAP, horizon)
+
+        with transaction.atomic():
+            ProductSalesDay.objects.filter(day__lt=horizon).delete()
+            sales_rows = BestSellerService._resum_days(days) if days else 0
+
+            rankings = BestSellerService._rankings(today, started)
+            current = set(BestSeller.objects.values_list('window', 'rank', 'product_id', 'quantity'))
+            changed = current != {(row.window, row.rank, row.product_id, row.quantity) for row in rankings}
+            if changed:
+                BestSeller.objects.all().delete()
+                BestSeller.objects.bulk_create(rankings)
+            else:
+                BestSeller.objects.update(computed_at=started)  # advance the watermark only
+
+        if changed:
+            bump_generation()
+        logger.info(
+            f"[BestSellers] Refreshed: {len(days)} day(s) re-summed, {len(rankings)} ranking row(s)"
+            f"{'' if changed else ', unchanged'}"
+        )
+        return {'days': len(days), 'sales_rows': sales_rows, 'ranked': len(rankings), 'changed': changed}
+
+    @staticmethod
+    def top(window: int = DEFAULT_WINDOW, category_slug: str | None = None, limit: int = 6) -> list:
+        """Ids of the best-selling available products in ``window`` days, best first."""
+        ranking = BestSeller.objects.filter(window=window, product__is_available=True)
+        if category_slug:
+            ranking = ranking.filter(category__slug=category_slug)
+        return list(ranking.order_by('rank').values_list('product_id', flat=True)[:limit])
@@ -2,31 +2,216 @@
 Razorpay Service — PrintBox3D
 Centralises all Razorpay interactions so views stay thin.
 
+One Razorpay client (and one pooled keep-alive ``requests`` session) is kept
+per worker process, so checkouts reuse open TLS connections to the gateway.
+Every call has explicit connect/read timeouts; idempotent (GET) calls and
+connection failures are retried a bounded number of times with jittered
+backoff. A circuit breaker trips after repeated gateway failures and makes
+calls fail fast with ``GatewayUnavailable`` (create_order answers 503)
+until a trial call succeeds again.
+
 Usage:
     from api.services.razorpay_service import RazorpayService
     order  = RazorpayService.create_order(amount_inr=299, receipt='ORD123')
     valid  = RazorpayService.verify_signature(order_id, payment_id, signature)
+    tries  = RazorpayService.fetch_order_payments(order_id)   # payment attempts on an order
+    stats  = RazorpayService.stats()   # breaker state + latency histograms
 """
 
 import hmac
 import hashlib
 import logging
+import random
+import threading
+import time
 
 import razorpay
+import requests
 from django.conf import settings
+from razorpay.errors import GatewayError, ServerError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class GatewayUnavailable(RuntimeError):
+    """Raised without calling Razorpay while the circuit breaker is open."""
+
+
+class _JitteredRetry(Retry):
+    """Exponential backoff plus random jitter so retrying workers don't stampede."""
+    jitter = 0.1
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return backoff + random.uniform(0, self.jitter) if backoff else backoff
+
+
+class _TimeoutSession(requests.Session):
+    """requests.Session applying a default (connect, read) timeout to every call."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker.
+
+    closed    -> calls go through; ``failure_threshold`` consecutive failures open it
+    open      -> calls are rejected until ``reset_timeout`` seconds have passed
+    half_open -> a single trial call is let through; success closes, failure re-opens
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("[Razorpay] Circuit breaker closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"[Razorpay] Circuit breaker OPEN after {self._failures} failure(s)")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        state = self.state
+        with self._lock:
+            return {'state': state, 'consecutive_failures': self._failures}
+
+
+class _LatencyStats:
+    """Per-operation call counters and latency histograms (this process only)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def record(self, operation: str, outcome: str, elapsed_ms: float | None = None) -> None:
+        with self._lock:
+            op = self._ops.setdefault(operation, {
+                'success': 0, 'failure': 0, 'rejected': 0,
+                'latency_ms': {'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1), 'sum': 0.0},
+            })
+            op[outcome] += 1
+            if elapsed_ms is not None:
+                index = next(
+                    (i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound),
+                    len(LATENCY_BUCKETS_MS),
+                )
+                op['latency_ms']['buckets'][index] += 1
+                op['latency_ms']['sum'] += elapsed_ms
+
+    def snapshot(self) -> dict:
+        labels = [f'le_{bound}' for bound in LATENCY_BUCKETS_MS] + ['inf']
+        with self._lock:
+            result = {}
+            for name, op in self._ops.items():
+                result[name] = {
+                    'success': op['success'], 'failure': op['failure'], 'rejected': op['rejected'],
+                    'latency_ms': {
+                        'histogram': dict(zip(labels, op['latency_ms']['buckets'])),
+                        'sum': round(op['latency_ms']['sum'], 3),
+                    },
+                }
+            return result
+
+
+_client_lock = threading.Lock()
+_client = None
+_client_config = None
+_breaker = None
+_latency = _LatencyStats()
+
+
+def _config() -> tuple:
+    return (
+        getattr(settings, 'RAZORPAY_KEY_ID', ''),
+        getattr(settings, 'RAZORPAY_KEY_SECRET', ''),
+        getattr(settings, 'RAZORPAY_BASE_URL', 'https://api.razorpay.com'),
+        getattr(settings, 'RAZORPAY_CONNECT_TIMEOUT', 3.05),
+        getattr(settings, 'RAZORPAY_READ_TIMEOUT', 10.0),
+        getattr(settings, 'RAZORPAY_MAX_RETRIES', 2),
+        getattr(settings, 'RAZORPAY_POOL_MAXSIZE', 10),
+    )
+
+
+def _build_session(connect_timeout, read_timeout, max_retries, pool_maxsize) -> requests.Session:
+    session = _TimeoutSession(timeout=(connect_timeout, read_timeout))
+    retry = _JitteredRetry(
+        total=max_retries,
+        connect=max_retries,                 # request never reached the gateway: always safe
+        read=max_retries,
+        status=max_retries,
+        allowed_methods=frozenset({'GET', 'HEAD'}),  # read/status retries only for idempotent calls
+        status_forcelist=(502, 503, 504),
+        backoff_factor=0.2,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 
 def _get_client() -> razorpay.Client:
     """
-    Initialise and return an authenticated Razorpay client.
+    Return this process's authenticated Razorpay client, creating it on first use.
+
+    The client is rebuilt only if the Razorpay settings change.
 
     Raises:
         ValueError: if credentials are missing from settings.
     """
-    key_id = getattr(settings, 'RAZORPAY_KEY_ID', '')
-    key_secret = getattr(settings, 'RAZORPAY_KEY_SECRET', '')
+    global _client, _client_config
+    config = _config()
+    key_id, key_secret, base_url, connect_timeout, read_timeout, max_retries, pool_maxsize = config
 
     if not key_id or not key_secret:
         raise ValueError(
@@ -34,7 +219,50 @@ def _get_client() -> razorpay.Client:
             "are not configured in settings."
         )
 
-    return razorpay.Client(auth=(key_id, key_secret))
+    with _client_lock:
+        if _client is None or _client_config != config:
+            if _client is not None:
+                _client.session.close()
+            session = _build_session(connect_timeout, read_timeout, max_retries, pool_maxsize)
+            _client = razorpay.Client(session=session, auth=(key_id, key_secret), base_url=base_url)
+            _client_config = config
+        return _client
+
+
+def _get_breaker() -> CircuitBreaker:
+    global _breaker
+    with _client_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(
+                failure_threshold=getattr(settings, 'RAZORPAY_BREAKER_THRESHOLD', 5),
+                reset_timeout=getattr(settings, 'RAZORPAY_BREAKER_RESET_SECONDS', 30),
+            )
+        return _breaker
+
+
+def _call(operation: str, func, *args):
+    """Run one gateway call through the circuit breaker and record its latency."""
+    breaker = _get_breaker()
+    if not breaker.allow():
+        _latency.record(operation, 'rejected')
+        raise GatewayUnavailable('Payment gateway temporarily unavailable')
+
+    started = time.perf_counter()
+    try:
+        result = func(*args)
+    except (requests.RequestException, ServerError, GatewayError, ValueError) as exc:
+        # Network errors, timeouts, 5xx and unparseable gateway responses
+        _latency.record(operation, 'failure', (time.perf_counter() - started) * 1000)
+        breaker.record_failure()
+        raise
+    except Exception:
+        # 4xx (BadRequestError) — the gateway is healthy, the request was wrong
+        _latency.record(operation, 'failure', (time.perf_counter() - started) * 1000)
+        breaker.record_success()
+        raise
+    _latency.record(operation, 'success', (time.perf_counter() - started) * 1000)
+    breaker.record_success()
+    return result
 
 
 class RazorpayService:
@@ -60,8 +288,9 @@ class RazorpayService:
             }
 
         Raises:
-            ValueError:   If credentials are missing.
-            RuntimeError: If Razorpay API call fails.
+            ValueError:         If credentials are missing.
+            GatewayUnavailable: If the circuit breaker is open (no call made).
+            RuntimeError:       If Razorpay API call fails.
         """
         amount_paise = int(amount_inr * 100)
 
@@ -74,20 +303,47 @@ class RazorpayService:
         if notes:
             payload['notes'] = notes
 
+        client = _get_client()
         try:
-            client = _get_client()
-            rz_order = client.order.create(payload)
+            rz_order = _call('order.create', client.order.create, payload)
             logger.info(
                 f"[Razorpay] Order created → id={rz_order['id']}, "
                 f"amount={amount_paise} paise, receipt={receipt}"
             )
             return rz_order
-        except ValueError:
+        except GatewayUnavailable:
+            logger.warning(f"[Razorpay] create_order rejected — circuit open (receipt={receipt})")
             raise
         except Exception as exc:
             logger.error(f"[Razorpay] create_order failed: {exc}", exc_info=True)
             raise RuntimeError(f"Razorpay order creation failed: {exc}") from exc
 
+    @staticmethod
+    def fetch_order_payments(razorpay_order_id: str) -> list:
+        """
+        Fetch every payment attempt made against a Razorpay order.
+
+        Safe to call from worker threads: the pooled session is shared.
+
+        Returns:
+            List of Razorpay payment dicts ({'id', 'status', 'error_code', ...}),
+            oldest attempt first.
+
+        Raises:
+            ValueError:         If credentials are missing.
+            GatewayUnavailable: If the circuit breaker is open (no call made).
+            RuntimeError:       If the Razorpay API call fails.
+        """
+        client = _get_client()
+        try:
+            result = _call('order.payments', client.order.payments, razorpay_order_id)
+        except GatewayUnavailable:
+            raise
+        except Exception as exc:
+            logger.warning(f"[Razorpay] fetch_order_payments({razorpay_order_id}) failed: {exc}")
+            raise RuntimeError(f"Razorpay payment lookup failed: {exc}") from exc
+        return sorted(result.get('items', []), key=lambda payment: payment.get('created_at') or 0)
+
     @staticmethod
     def verify_signature(
         razorpay_order_id: str,
@@ -169,3 +425,21 @@ class RazorpayService:
             getattr(settings, 'RAZORPAY_KEY_ID', '') and
             getattr(settings, 'RAZORPAY_KEY_SECRET', '')
         )
+
+    @staticmethod
+    def stats() -> dict:
+        """Circuit breaker state and per-operation latency histograms for this process."""
+        return {
+            'breaker': _get_breaker().snapshot(),
+            'operations': _latency.snapshot(),
+        }
+
+    @staticmethod
+    def reset() -> None:
+        """Drop the cached client, breaker and stats (tests / settings changes)."""
+        global _client, _client_config, _breaker, _latency
+        with _client_lock:
+            if _client is not None:
+                _client.session.close()
+            _client = _client_config = _breaker = None
+            _latency = _LatencyStats()
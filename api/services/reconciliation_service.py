@@ -0,0 +1,201 @@
+"""
+Reconciliation Service — PrintBox3D
+Settle PENDING orders whose browser callback never arrived.
+
+A customer who closes the tab after paying (or never pays at all) leaves the
+order PENDING. The sweeper asks Razorpay what actually happened:
+
+    a captured payment           → PAID (commit stock, queue the confirmation email)
+    only failed attempts         → FAILED (release stock and coupon)
+    no attempt, reservation TTL  → CANCELLED / payment_status EXPIRED
+      (STOCK_RESERVATION_TTL_MINUTES) passed
+    anything else (authorized, in progress, gateway error) → left for the next run
+
+Orders are read in keyset batches over (status, created_at) — the
+``order_status_created_idx`` index — so each batch is one bounded index
+range scan. The gateway lookups of a batch run in a thread pool of at most
+RECONCILE_CONCURRENCY threads; the threads only make HTTP calls, all
+database work stays on the calling thread. Each outcome is applied to the
+whole batch at once through OrderStateService, so an order the webhook or
+the verify endpoint settled in the meantime is simply not moved.
+
+Run it periodically (cron), before release_expired_reservations so a paid
+order is never expired:
+    python manage.py reconcile_pending_orders
+
+Usage:
+    from api.services.reconciliation_service import ReconciliationService
+    stats = ReconciliationService.sweep()   # {'scanned': …, 'paid': …, 'orders_per_second': …}
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, Q, Value, When
+from django.utils import timezone
+
+from ..models import Order
+from .inventory_service import InventoryService
+from .order_state_service import OrderStateService
+from .razorpay_service import GatewayUnavailable, RazorpayService
+
+logger = logging.getLogger(__name__)
+
+# Classification of one order's payment attempts
+PAID, FAILED, EXPIRED, WAIT = 'paid', 'failed', 'expired', 'wait'
+
+
+def _classify(payments, created_at, expire_before):
+    """Outcome for an order given its Razorpay payment attempts. Returns (outcome, payment)."""
+    for payment in payments:
+        if payment.get('status') == 'captured':
+            return PAID, payment
+    if payments:
+        if all(payment.get('status') == 'failed' for payment in payments):
+            return FAILED, payments[-1]
+        return WAIT, None  # created / authorized: still in flight
+    if created_at < expire_before:
+        return EXPIRED, None
+    return WAIT, None
+
+
+class ReconciliationService:
+    """Bulk reconciliation of stuck PENDING orders against Razorpay."""
+
+    @staticmethod
+    def _lookup(razorpay_order_id):
+        """Thread-pool worker: payment attempts, or the exception raised fetching them."""
+        try:
+            return RazorpayService.fetch_order_payments(razorpay_order_id)
+        except Exception as exc:
+            return exc
+
+    @staticmethod
+    def _apply(outcomes: dict) -> dict:
+        """Apply {outcome: [(order_pk, payment)]} in one transaction. Returns orders moved per outcome."""
+        moved = {PAID: 0, FAILED: 0, EXPIRED: 0}
+        with transaction.atomic():
+            if outcomes[PAID]:
+                payment_ids = {pk: payment['id'] for pk, payment in outcomes[PAID]}
+                paid = OrderStateService.bulk_transition(
+                    Order.objects.filter(pk__in=payment_ids, status='PENDING'), 'PAID',
+                    payment_status='CAPTURED',
+                    razorpay_payment_id=Case(
+                        *[When(pk=pk, then=Value(pid)) for pk, pid in payment_ids.items()], output_field=CharField(),
+                    ),
+                )
+                OrderStateService.transition_payments(
+                    paid, 'CAPTURED',
+                    razorpay_payment_id=Case(
+                        *[When(order_id=pk, then=Value(payment_ids[pk])) for pk in paid], output_field=CharField(),
+                    ),
+                )
+                moved[PAID] = len(paid)
+
+            if outcomes[FAILED]:
+                failed = OrderStateService.bulk_transition(
+                    Order.objects.filter(pk__in=[pk for pk, _ in outcomes[FAILED]], status='PENDING'), 'FAILED',
+                    payment_status='FAILED',
+                )
+                errors = {pk: payment.get('error_description') or '' for pk, payment in outcomes[FAILED]}
+                OrderStateService.transition_payments(
+                    failed, 'FAILED',
+                    error_description=Case(
+                        *[When(order_id=pk, then=Value(errors[pk])) for pk in failed], output_field=CharField(),
+                    ),
+                )
+                moved[FAILED] = len(failed)
+
+            if outcomes[EXPIRED]:
+                moved[EXPIRED] = len(OrderStateService.bulk_transition(
+                    Order.objects.filter(pk__in=[pk for pk, _ in outcomes[EXPIRED]], status='PENDING'), 'CANCELLED',
+                    payment_status='EXPIRED',
+                ))
+
+        for outcome, count in moved.items():
+            if count:
+                logger.info(f"[Reconcile] {count} order(s) {outcome}")
+        return moved
+
+    @staticmethod
+    def sweep(
+        older_than: timedelta | None = None,
+        batch_size: int | None = None,
+        concurrency: int | None = None,
+        limit: int | None = None,
+        dry_run: bool = False,
+    ) -> dict:
+        """
+        Reconcile PENDING orders created more than ``older_than`` ago, oldest first.
+
+        Args:
+            older_than:  Minimum order age (default RECONCILE_PENDING_AFTER_MINUTES).
+            batch_size:  Orders per batch (default RECONCILE_BATCH_SIZE).
+            concurrency: Parallel gateway lookups (default RECONCILE_CONCURRENCY).
+            limit:       Stop after scanning this many orders.
+            dry_run:     Classify only; change nothing.
+
+        Returns:
+            Counts (scanned, paid, failed, expired, waiting, errors), elapsed
+            seconds and orders_per_second. ``aborted`` is True if the gateway's
+            circuit breaker opened mid-sweep.
+        """
+        older_than = older_than or timedelta(minutes=getattr(settings, 'RECONCILE_PENDING_AFTER_MINUTES', 15))
+        batch_size = batch_size or getattr(settings, 'RECONCILE_BATCH_SIZE', 200)
+        concurrency = concurrency or getattr(settings, 'RECONCILE_CONCURRENCY', 8)
+        now = timezone.now()
+        expire_before = now - InventoryService.reservation_ttl()
+
+        stats = {'scanned': 0, PAID: 0, FAILED: 0, EXPIRED: 0, 'waiting': 0, 'errors': 0, 'aborted': False}
+        pending = Order.objects.filter(status='PENDING', created_at__lt=now - older_than).order_by('created_at', 'pk')
+        cursor = None
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='reconcile') as pool:
+            while limit is None or stats['scanned'] < limit:
+                page = pending
+                if cursor is not None:
+                    page = page.filter(Q(created_at__gt=cursor[0]) | Q(created_at=cursor[0], pk__gt=cursor[1]))
+                size = batch_size if limit is None else min(batch_size, limit - stats['scanned'])
+                rows = {pk: (rzp_id, created_at) for pk, rzp_id, created_at in
+                        page.values_list('pk', 'razorpay_order_id', 'created_at')[:size]}
+                if not rows:
+                    break
+                last_pk = max(rows, key=lambda pk: (rows[pk][1], pk))
+                cursor = (rows[last_pk][1], last_pk)
+                stats['scanned'] += len(rows)
+
+                # An order that never reached the gateway has no attempts to look up
+                lookups = [pk for pk, (rzp_id, _) in rows.items() if rzp_id]
+                results = dict(zip(lookups, pool.map(ReconciliationService._lookup, [rows[pk][0] for pk in lookups])))
+
+                outcomes = {PAID: [], FAILED: [], EXPIRED: []}
+                for pk, (_, created_at) in rows.items():
+                    payments = results.get(pk, [])
+                    if isinstance(payments, Exception):
+                        stats['errors'] += 1
+                        stats['aborted'] = stats['aborted'] or isinstance(payments, GatewayUnavailable)
+                        continue
+                    outcome, payment = _classify(payments, created_at, expire_before)
+                    if outcome == WAIT:
+                        stats['waiting'] += 1
+                    else:
+                        outcomes[outcome].append((pk, payment))
+
+                if dry_run:
+                    for outcome, orders in outcomes.items():
+                        stats[outcome] += len(orders)
+                else:
+                    for outcome, count in ReconciliationService._apply(outcomes).items():
+                        stats[outcome] += count
+
+                if stats['aborted']:
+                    logger.warning("[Reconcile] Razorpay circuit breaker open, stopping early")
+                    break
+
+        stats['elapsed'] = round(time.perf_counter() - started, 3)
+        stats['orders_per_second'] = round(stats['scanned'] / stats['elapsed'], 1) if stats['elapsed'] else 0.0
+        return stats
@@ -2,13 +2,28 @@
 S3 Service — PrintBox3D
 Centralises all AWS S3 interactions.
 
+The boto3 client is created lazily once per process (building one costs tens
+of milliseconds) and rebuilt only when the credentials/region change.
+Presigned URLs are signed locally with SigV4 by ``presign_v4()`` — the same
+URL botocore would produce, without its per-call endpoint resolution and
+request-model machinery. Set ``AWS_S3_LOCAL_PRESIGN = False`` to fall back
+to ``client.generate_presigned_url``.
+
 Usage:
     from api.services.s3_service import S3Service
     url = S3Service.generate_presigned_upload_url('products', 'planter.jpg', 'image/jpeg')
+    urls = S3Service.generate_presigned_upload_urls('products', [{'file_name': ..., 'content_type': ..., 'file_size': ...}])
 """
 
+import datetime
+import hashlib
+import hmac
 import logging
+import threading
+from urllib.parse import quote
+
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
 from django.conf import settings
 
@@ -43,15 +58,114 @@ MAX_SIZES = {
     'custom_orders': 25 * 1024 * 1024,  # 25 MB
 }
 
+# S3's minimum multipart part size (every part except the last must be at least this big)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+_client_lock = threading.Lock()
+_client = None
+_client_config = None
+
+# Derived SigV4 signing keys, one per (secret, day, region); tiny and bounded in practice
+_signing_keys = {}
+
 
 def _get_client():
-    """Return a boto3 S3 client configured from Django settings."""
-    return boto3.client(
-        's3',
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME,
+    """
+    Return this process's boto3 S3 client configured from Django settings.
+
+    Created on first use and rebuilt only if the credentials or region change.
+    """
+    global _client, _client_config
+    config = (settings.AWS_ACCESS_KEY_ID, settings.AWS_SECRET_ACCESS_KEY, settings.AWS_S3_REGION_NAME)
+    with _client_lock:
+        if _client is None or _client_config != config:
+            _client = boto3.client(
+                's3',
+                aws_access_key_id=config[0],
+                aws_secret_access_key=config[1],
+                region_name=config[2],
+                config=Config(signature_version='s3v4', s3={'addressing_style': 'virtual'}),
+            )
+            _client_config = config
+        return _client
+
+
+def _signing_key(secret_key: str, date_stamp: str, region: str) -> bytes:
+    cache_key = (secret_key, date_stamp, region)
+    key = _signing_keys.get(cache_key)
+    if key is None:
+        key = ('AWS4' + secret_key).encode('utf-8')
+        for part in (date_stamp, region, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+        if len(_signing_keys) > 64:
+            _signing_keys.clear()
+        _signing_keys[cache_key] = key
+    return key
+
+
+def presign_v4(
+    method: str,
+    s3_key: str,
+    expiry_seconds: int,
+    content_type: str | None = None,
+    now: datetime.datetime | None = None,
+    params: dict | None = None,
+) -> str:
+    """
+    Build an S3 SigV4 query-string presigned URL entirely locally.
+
+    Produces the same URL as ``client.generate_presigned_url`` for a
+    virtual-hosted bucket. When ``content_type`` is given it is a signed
+    header, so the uploader must send exactly that Content-Type. ``params``
+    adds signed query parameters (e.g. ``partNumber``/``uploadId``).
+    """
+    access_key = settings.AWS_ACCESS_KEY_ID
+    secret_key = settings.AWS_SECRET_ACCESS_KEY
+    if not access_key or not secret_key:
+        raise NoCredentialsError()
+
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    region = settings.AWS_S3_REGION_NAME
+    host = f"{bucket}.s3.{region}.amazonaws.com"
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+    date_stamp = now.strftime('%Y%m%d')
+    scope = f"{date_stamp}/{region}/s3/aws4_request"
+
+    headers = {'host': host}
+    if content_type:
+        headers['content-type'] = content_type
+    signed_headers = ';'.join(sorted(headers))
+
+    query = {
+        'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+        'X-Amz-Credential': f"{access_key}/{scope}",
+        'X-Amz-Date': amz_date,
+        'X-Amz-Expires': str(expiry_seconds),
+        'X-Amz-SignedHeaders': signed_headers,
+        **{name: str(value) for name, value in (params or {}).items()},
+    }
+    canonical_query = '&'.join(
+        f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(query.items())
     )
+    canonical_uri = '/' + quote(s3_key, safe='/-_.~')
+    canonical_headers = ''.join(f"{name}:{' '.join(headers[name].split())}\n" for name in sorted(headers))
+    canonical_request = '\n'.join([
+        method, canonical_uri, canonical_query, canonical_headers, signed_headers, 'UNSIGNED-PAYLOAD',
+    ])
+    string_to_sign = '\n'.join([
+        'AWS4-HMAC-SHA256', amz_date, scope,
+        hashlib.sha256(canonical_request.encode('utf-8')).hexdigest(),
+    ])
+    signature = hmac.new(
+        _signing_key(secret_key, date_stamp, region), string_to_sign.encode('utf-8'), hashlib.sha256
+    ).hexdigest()
+    return f"https://{host}{canonical_uri}?{canonical_query}&X-Amz-Signature={signature}"
+
+
+def _use_local_presign() -> bool:
+    return getattr(settings, 'AWS_S3_LOCAL_PRESIGN', True)
 
 
 class S3Service:
@@ -146,16 +260,18 @@ class S3Service:
         region = settings.AWS_S3_REGION_NAME
 
         try:
-            client = _get_client()
-            upload_url = client.generate_presigned_url(
-                'put_object',
-                Params={
-                    'Bucket': bucket,
-                    'Key': s3_key,
-                    'ContentType': content_type,
-                },
-                ExpiresIn=expiry_seconds,
-            )
+            if _use_local_presign():
+                upload_url = presign_v4('PUT', s3_key, expiry_seconds, content_type=content_type)
+            else:
+                upload_url = _get_client().generate_presigned_url(
+                    'put_object',
+                    Params={
+                        'Bucket': bucket,
+                        'Key': s3_key,
+                        'ContentType': content_type,
+                    },
+                    ExpiresIn=expiry_seconds,
+                )
 
             file_url = (
                 f"https://{bucket}.s3.{region}.amazonaws.com/{s3_key}"
@@ -177,6 +293,41 @@ class S3Service:
             logger.error(f"[S3] Failed to generate presigned URL: {e}")
             raise RuntimeError(f"Failed to generate upload URL: {e}")
 
+    @staticmethod
+    def generate_presigned_upload_urls(folder: str, files: list, expiry_seconds: int = 300) -> list:
+        """
+        Presign several uploads to one folder in a single call.
+
+        Every file is validated before anything is signed, so the batch either
+        succeeds as a whole or fails without issuing any URL.
+
+        Args:
+            folder: Destination sub-folder (e.g. 'products', 'custom_orders')
+            files:  [{'file_name': str, 'content_type': str, 'file_size': int}, ...]
+            expiry_seconds: How long each presigned URL is valid
+
+        Returns:
+            List of {'upload_url', 'file_url', 's3_key'} dicts, in input order.
+
+        Raises:
+            ValueError: if any file fails validation (message lists every failure)
+            RuntimeError: if presigned URL generation fails
+        """
+        errors = []
+        for index, item in enumerate(files):
+            name = item.get('file_name') or f'#{index + 1}'
+            if not S3Service.validate_file_type(item['content_type'], folder):
+                errors.append(f"{name}: file type '{item['content_type']}' is not allowed for folder '{folder}'")
+            if not S3Service.validate_file_size(item['file_size'], folder):
+                errors.append(f"{name}: file is too large for folder '{folder}'")
+        if errors:
+            raise ValueError('; '.join(errors))
+
+        return [
+            S3Service.generate_presigned_upload_url(folder, item['file_name'], item['content_type'], expiry_seconds)
+            for item in files
+        ]
+
     @staticmethod
     def generate_presigned_read_url(s3_key: str, expiry_seconds: int = 3600) -> str:
         """
@@ -193,8 +344,9 @@ class S3Service:
             Presigned GET URL string
         """
         try:
-            client = _get_client()
-            url = client.generate_presigned_url(
+            if _use_local_presign():
+                return presign_v4('GET', s3_key, expiry_seconds)
+            url = _get_client().generate_presigned_url(
                 'get_object',
                 Params={
                     'Bucket': settings.AWS_STORAGE_BUCKET_NAME,
@@ -203,6 +355,9 @@ class S3Service:
                 ExpiresIn=expiry_seconds,
             )
             return url
+        except NoCredentialsError:
+            logger.error("[S3] AWS credentials not configured")
+            raise RuntimeError("AWS credentials are not configured on the server")
         except ClientError as e:
             logger.error(f"[S3] Failed to generate presigned read URL for {s3_key}: {e}")
             raise RuntimeError(f"Failed to generate read URL: {e}")
@@ -230,6 +385,223 @@ class S3Service:
             logger.error(f"[S3] Failed to delete {s3_key}: {e}")
             return False
 
+    # ------------------------------------------------------------------
+    # Multipart uploads (large custom-order design files)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _part_url(s3_key: str, upload_id: str, part_number: int, expiry_seconds: int) -> str:
+        if _use_local_presign():
+            return presign_v4(
+                'PUT', s3_key, expiry_seconds, params={'partNumber': part_number, 'uploadId': upload_id}
+            )
+        return _get_client().generate_presigned_url(
+            'upload_part',
+            Params={
+                'Bucket': settings.AWS_STORAGE_BUCKET_NAME,
+                'Key': s3_key,
+                'PartNumber': part_number,
+                'UploadId': upload_id,
+            },
+            ExpiresIn=expiry_seconds,
+        )
+
+    @staticmethod
+    def create_multipart_upload(
+        folder: str,
+        file_name: str,
+        content_type: str,
+        file_size: int,
+        expiry_seconds: int = 3600,
+    ) -> dict:
+        """
+        Start a multipart upload and presign a PUT URL for every part.
+
+        The client PUTs each byte range (``part_size`` bytes, the last part
+        smaller) to its URL — in parallel if it likes — keeps the returned
+        ETag headers, and calls ``complete_multipart_upload``. A failed part
+        is simply re-sent; nothing already uploaded is lost.
+
+        Returns:
+            {
+                'upload_id': str,
+                's3_key':    str,
+                'file_url':  str,
+                'part_size': int,
+                'parts':     [{'part_number': 1, 'upload_url': str}, ...],
+            }
+
+        Raises:
+            ValueError: if the file type or size is not allowed
+            RuntimeError: if S3 refuses to start the upload
+        """
+        if not S3Service.validate_file_type(content_type, folder):
+            raise ValueError(f"File type '{content_type}' is not allowed for folder '{folder}'")
+        if file_size <= 0 or not S3Service.validate_file_size(file_size, folder):
+            raise ValueError(f"File size {file_size} is not allowed for folder '{folder}'")
+
+        import uuid
+        import os
+        ext = os.path.splitext(file_name)[-1].lower()
+        s3_key = f"{folder}/{uuid.uuid4().hex}{ext}"
+        bucket = settings.AWS_STORAGE_BUCKET_NAME
+        part_size = max(MIN_PART_SIZE, getattr(settings, 'AWS_S3_MULTIPART_PART_SIZE', MIN_PART_SIZE))
+        part_count = -(-file_size // part_size)
+
+        try:
+            upload_id = _get_client().create_multipart_upload(
+                Bucket=bucket, Key=s3_key, ContentType=content_type,
+            )['UploadId']
+            parts = [
+                {'part_number': n, 'upload_url': S3Service._part_url(s3_key, upload_id, n, expiry_seconds)}
+                for n in range(1, part_count + 1)
+            ]
+        except NoCredentialsError:
+            logger.error("[S3] AWS credentials not configured")
+            raise RuntimeError("AWS credentials are not configured on the server")
+        except ClientError as e:
+            logger.error(f"[S3] Failed to start multipart upload: {e}")
+            raise RuntimeError(f"Failed to start multipart upload: {e}")
+
+        logger.info(f"[S3] Multipart upload started → {s3_key} ({part_count} parts)")
+        return {
+            'upload_id': upload_id,
+            's3_key': s3_key,
+            'file_url': f"https://{bucket}.s3.{settings.AWS_S3_REGION_NAME}.amazonaws.com/{s3_key}",
+            'part_size': part_size,
+            'parts': parts,
+        }
+
+    @staticmethod
+    def _uploaded_parts(s3_key: str, upload_id: str) -> list:
+        """Parts S3 holds for an upload: [{'part_number', 'etag', 'size'}, ...]."""
+        uploaded = []
+        paginator = _get_client().get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3_key, UploadId=upload_id):
+            uploaded.extend(
+                {'part_number': part['PartNumber'], 'etag': part['ETag'], 'size': part['Size']}
+                for part in page.get('Parts', [])
+            )
+        return uploaded
+
+    @staticmethod
+    def resume_multipart_upload(s3_key: str, upload_id: str, part_numbers: list, expiry_seconds: int = 3600) -> dict:
+        """
+        Report which parts S3 already has and presign fresh URLs for ``part_numbers``.
+
+        Returns:
+            {
+                'uploaded': [{'part_number': 1, 'etag': str, 'size': int}, ...],
+                'parts':    [{'part_number': 2, 'upload_url': str}, ...],
+            }
+
+        Raises:
+            RuntimeError: if the upload does not exist or S3 fails
+        """
+        try:
+            uploaded = S3Service._uploaded_parts(s3_key, upload_id)
+            parts = [
+                {'part_number': n, 'upload_url': S3Service._part_url(s3_key, upload_id, n, expiry_seconds)}
+                for n in part_numbers
+            ]
+        except ClientError as e:
+            logger.error(f"[S3] Failed to resume multipart upload {s3_key}: {e}")
+            raise RuntimeError(f"Failed to resume multipart upload: {e}")
+        return {'uploaded': uploaded, 'parts': parts}
+
+    @staticmethod
+    def complete_multipart_upload(s3_key: str, upload_id: str, parts: list) -> str:
+        """
+        Assemble the uploaded parts into the final object.
+
+        Part URLs cannot bound how many bytes a client PUTs, so the size
+        declared at creation proves nothing: the real part sizes are summed
+        from S3 first, and an upload over the folder's limit is aborted.
+
+        Args:
+            parts: [{'part_number': int, 'etag': str}, ...] — ETags returned by each part PUT
+
+        Returns:
+            Location (URL) of the completed object.
+
+        Raises:
+            ValueError: if the uploaded parts exceed the folder's size limit (the upload is aborted)
+            RuntimeError: if S3 rejects the part list
+        """
+        folder = s3_key.split('/', 1)[0]
+        wanted = {int(part['part_number']) for part in parts}
+        try:
+            total = sum(
+                part['size'] for part in S3Service._uploaded_parts(s3_key, upload_id)
+                if part['part_number'] in wanted
+            )
+        except ClientError as e:
+            logger.error(f"[S3] Failed to list parts of multipart upload {s3_key}: {e}")
+            raise RuntimeError(f"Failed to complete multipart upload: {e}")
+        if not S3Service.validate_file_size(total, folder):
+            S3Service.abort_multipart_upload(s3_key, upload_id)
+            raise ValueError(f"Uploaded size {total} is not allowed for folder '{folder}'")
+
+        try:
+            result = _get_client().complete_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': [
+                    {'PartNumber': int(part['part_number']), 'ETag': part['etag']}
+                    for part in sorted(parts, key=lambda part: int(part['part_number']))
+                ]},
+            )
+        except ClientError as e:
+            logger.error(f"[S3] Failed to complete multipart upload {s3_key}: {e}")
+            raise RuntimeError(f"Failed to complete multipart upload: {e}")
+        logger.info(f"[S3] Multipart upload completed → {s3_key}")
+        return result.get('Location', '')
+
+    @staticmethod
+    def abort_multipart_upload(s3_key: str, upload_id: str) -> bool:
+        """
+        Abort a multipart upload and discard its parts.
+
+        Returns:
+            True on success, False on failure
+        """
+        try:
+            _get_client().abort_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3_key, UploadId=upload_id,
+            )
+            logger.info(f"[S3] Multipart upload aborted → {s3_key}")
+            return True
+        except ClientError as e:
+            logger.error(f"[S3] Failed to abort multipart upload {s3_key}: {e}")
+            return False
+
+    @staticmethod
+    def stale_multipart_uploads(older_than: datetime.timedelta) -> list:
+        """
+        List incomplete multipart uploads started more than ``older_than`` ago.
+
+        Returns:
+            [{'s3_key': str, 'upload_id': str, 'initiated': datetime}, ...]
+        """
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - older_than
+        stale = []
+        paginator = _get_client().get_paginator('list_multipart_uploads')
+        for page in paginator.paginate(Bucket=settings.AWS_STORAGE_BUCKET_NAME):
+            for upload in page.get('Uploads', []):
+                if upload['Initiated'] < cutoff:
+                    stale.append({
+                        's3_key': upload['Key'],
+                        'upload_id': upload['UploadId'],
+                        'initiated': upload['Initiated'],
+                    })
+        return stale
+
+    @staticmethod
+    def upload_folders() -> set:
+        """Folders clients may upload into."""
+        return set(ALLOWED_TYPES)
+
     @staticmethod
     def is_configured() -> bool:
         """Return True if S3 credentials are present in settings."""
@@ -0,0 +1,214 @@
+"""
+Webhook Service — PrintBox3D
+Inbox for Razorpay webhooks: record first, apply later.
+
+The webhook view only verifies the signature and inserts the raw event into
+WebhookEvent, keyed by Razorpay's event id (X-Razorpay-Event-Id) under a
+unique constraint. Razorpay delivers at least once, so a redelivered event
+is an INSERT ... ON CONFLICT DO NOTHING and nothing else. The response is
+sent straight away; slow handlers can no longer time the gateway out.
+
+The task worker then applies each order's pending events in event-time
+order, holding a row lock on the Order, so two workers never interleave
+events for the same order:
+
+    payment.captured, order.paid   PENDING/FAILED → PAID (commit stock, queue confirmation email;
+                                   a FAILED order claims its stock and coupon again)
+    payment.failed                 PENDING → FAILED (release stock and coupon)
+    refund.created / .failed       payment_status CAPTURED ⇄ REFUND_PENDING
+    refund.processed               payment_status REFUNDED / PARTIALLY_REFUNDED
+    anything else                  IGNORED
+
+Status changes go through OrderStateService, so an event can never move an
+order or payment backwards.
+
+Usage:
+    from api.services.webhook_service import WebhookService
+    event, created = WebhookService.ingest(raw_body, event_id)
+    WebhookService.process_order(event.razorpay_order_id)   # from the worker
+    WebhookService.replay(since, until)                     # reprocess a window
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Order, WebhookEvent
+from .order_state_service import OrderStateService
+
+logger = logging.getLogger(__name__)
+
+# Events that move money or order state; everything else is stored and ignored
+PAID_EVENTS = ('payment.captured', 'order.paid')
+FAILED_EVENTS = ('payment.failed',)
+
+
+def _entity(payload: dict, name: str) -> dict:
+    return (payload.get('payload') or {}).get(name, {}).get('entity') or {}
+
+
+def _order_id(payload: dict) -> str:
+    """Razorpay order id an event belongs to (payment, order and refund events all carry one)."""
+    return _entity(payload, 'payment').get('order_id') or _entity(payload, 'order').get('id') or ''
+
+
+class WebhookService:
+    """Deduplicated, per-order-sequenced webhook processing."""
+
+    @staticmethod
+    def ingest(raw_body: bytes, event_id: str = '') -> tuple:
+        """
+        Store a verified webhook and queue its order for processing.
+
+        Args:
+            raw_body: The signed request body.
+            event_id: X-Razorpay-Event-Id; a hash of the body is used if absent.
+
+        Returns:
+            (WebhookEvent, created) — created is False for a duplicate delivery.
+
+        Raises:
+            ValueError: if the body is not a JSON object.
+        """
+        from ..tasks import enqueue
+
+        payload = json.loads(raw_body)
+        if not isinstance(payload, dict):
+            raise ValueError('Webhook body is not a JSON object')
+        event_id = event_id or 'sha256:' + hashlib.sha256(raw_body).hexdigest()
+        created_at = payload.get('created_at')
+
+        candidate = WebhookEvent(
+            event_id=event_id,
+            event=str(payload.get('event', ''))[:50],
+            razorpay_order_id=_order_id(payload),
+            payload=payload,
+            event_created_at=(
+                datetime.fromtimestamp(created_at, tz=dt_timezone.utc) if isinstance(created_at, int) else None
+            ),
+        )
+        with transaction.atomic():
+            WebhookEvent.objects.bulk_create([candidate], ignore_conflicts=True)
+            event = WebhookEvent.objects.get(event_id=event_id)
+            # ignore_conflicts cannot report whether the row was new; a redelivery finds the
+            # older row, whose received_at differs from the one stamped on ``candidate``
+            created = event.received_at == candidate.received_at
+            if event.status == WebhookEvent.RECEIVED:
+                enqueue('razorpay.webhooks', razorpay_order_id=event.razorpay_order_id)
+        return event, created
+
+    @staticmethod
+    def process_order(razorpay_order_id: str) -> int:
+        """
+        Apply every RECEIVED event of one Razorpay order, oldest first.
+
+        Returns:
+            Number of events handled.
+        """
+        with transaction.atomic():
+            order = (
+                Order.objects.select_for_update().filter(razorpay_order_id=razorpay_order_id).first()
+                if razorpay_order_id else None
+            )
+            events = list(
+                WebhookEvent.objects.select_for_update()
+                .filter(razorpay_order_id=razorpay_order_id, status=WebhookEvent.RECEIVED)
+                .order_by('event_created_at', 'pk')
+            )
+            now = timezone.now()
+            for event in events:
+                event.attempts += 1
+                event.processed_at = now
+                if order is None:
+                    event.status = WebhookEvent.IGNORED
+                    event.last_error = 'No order with this razorpay_order_id'
+                    logger.error(f"[Webhook] {event.event} {event.event_id}: order {razorpay_order_id!r} not found")
+                else:
+                    event.status = WebhookService._apply(order, event)
+                    event.last_error = ''
+            WebhookEvent.objects.bulk_update(events, ['status', 'attempts', 'processed_at', 'last_error'])
+        return len(events)
+
+    @staticmethod
+    def _apply(order, event) -> str:
+        """Apply one event to the locked ``order``. Returns the event's new status."""
+        payment = _entity(event.payload, 'payment')
+
+        if event.event in PAID_EVENTS:
+            payment_id = payment.get('id') or order.razorpay_payment_id
+            if OrderStateService.transition(
+                order.pk, 'PAID', payment_status='CAPTURED', razorpay_payment_id=payment_id
+            ):
+                order.status, order.payment_status, order.razorpay_payment_id = 'PAID', 'CAPTURED', payment_id
+                OrderStateService.transition_payment(order.pk, 'CAPTURED', razorpay_payment_id=payment_id)
+                logger.info(f"[Webhook] Order {order.order_id} marked PAID by {event.event}")
+            elif order.status == 'FAILED':
+                # Stock or coupon use went to someone else: the order stays FAILED, payment to refund
+                logger.error(f"[Webhook] {event.event} for FAILED order {order.order_id} not honoured, refund {payment_id}")
+            return WebhookEvent.PROCESSED
+
+        if event.event in FAILED_EVENTS:
+            # A failed attempt does not undo a payment captured by a later attempt
+            if OrderStateService.transition(order.pk, 'FAILED', payment_status='FAILED'):
+                order.status, order.payment_status = 'FAILED', 'FAILED'
+                OrderStateService.transition_payment(
+                    order.pk, 'FAILED',
+                    error_code=payment.get('error_code') or '',
+                    error_description=payment.get('error_description') or '',
+                )
+                logger.info(f"[Webhook] Order {order.order_id} marked FAILED")
+            return WebhookEvent.PROCESSED
+
+        if event.event == 'refund.created':
+            if order.payment_status == 'CAPTURED':
+                order.payment_status = 'REFUND_PENDING'
+                order.save(update_fields=['payment_status', 'updated_at'])
+            return WebhookEvent.PROCESSED
+
+        if event.event == 'refund.failed':
+            if order.payment_status == 'REFUND_PENDING':
+                order.payment_status = 'CAPTURED'
+                order.save(update_fields=['payment_status', 'updated_at'])
+            logger.warning(f"[Webhook] Refund failed for order {order.order_id}")
+            return WebhookEvent.PROCESSED
+
+        if event.event == 'refund.processed':
+            # The payment entity carries the running total refunded, in paise
+            amount = payment.get('amount') or int(order.total_amount * 100)
+            refunded = payment.get('amount_refunded') or _entity(event.payload, 'refund').get('amount') or 0
+            full = refunded >= amount
+            order.payment_status = 'REFUNDED' if full else 'PARTIALLY_REFUNDED'
+            order.save(update_fields=['payment_status', 'updated_at'])
+            if full:
+                OrderStateService.transition_payment(order.pk, 'REFUNDED')
+            logger.info(f"[Webhook] Order {order.order_id} {order.payment_status} ({refunded} of {amount} paise)")
+            return WebhookEvent.PROCESSED
+
+        return WebhookEvent.IGNORED
+
+    @staticmethod
+    def replay(since, until=None, events=None, process: bool = True) -> int:
+        """
+        Reprocess stored events received in [since, until).
+
+        Handlers only move orders forward, so replaying already-applied
+        events is safe.
+
+        Returns:
+            Number of events reset to RECEIVED.
+        """
+        queryset = WebhookEvent.objects.filter(received_at__gte=since)
+        if until is not None:
+            queryset = queryset.filter(received_at__lt=until)
+        if events:
+            queryset = queryset.filter(event__in=list(events))
+        order_ids = sorted(set(queryset.values_list('razorpay_order_id', flat=True)))
+        count = queryset.update(status=WebhookEvent.RECEIVED, last_error='')
+        if process:
+            for razorpay_order_id in order_ids:
+                WebhookService.process_order(razorpay_order_id)
+        return count
@@ -0,0 +1,216 @@
+"""
+Background tasks — PrintBox3D
+A small durable task queue stored in the database.
+
+``enqueue()`` inserts a Task row — inside the caller's transaction if there
+is one, so a task is queued exactly when the data it refers to is
+committed. ``python manage.py run_worker`` claims due tasks and runs their
+handlers:
+
+    - on Postgres tasks are claimed with SELECT ... FOR UPDATE SKIP LOCKED,
+      so any number of workers can poll the same table without contention;
+      on SQLite (no row locks) a conditional UPDATE claims each task
+    - a failing task is retried with exponential backoff plus jitter
+    - after ``max_attempts`` failures it is dead-lettered (status DEAD) and
+      kept for inspection / retry from the admin
+    - tasks left RUNNING by a crashed worker are re-queued after
+      TASK_QUEUE_LOCK_TIMEOUT seconds
+
+Handlers receive the JSON payload as keyword arguments; pass ids, not model
+instances, and make handlers safe to run more than once.
+
+Usage:
+    from api.tasks import enqueue, task
+
+    @task('email.contact_notification')
+    def contact_notification(contact_message_id):
+        ...
+
+    enqueue('email.contact_notification', contact_message_id=msg.pk)
+"""
+
+import logging
+import os
+import random
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ContactMessage, CustomOrder, Order, Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+# execute() outcome when the task was requeued and reclaimed while it ran
+LOST = 'LOST'
+
+
+def task(name: str):
+    """Register a function as the handler for tasks called ``name``."""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name: str, max_attempts: int | None = None, delay: timedelta | None = None, **payload) -> Task:
+    """Queue a task; it runs once the surrounding transaction (if any) commits."""
+    if name not in _registry:
+        raise KeyError(f'Unknown task {name!r}')
+    return Task.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=max_attempts or getattr(settings, 'TASK_QUEUE_MAX_ATTEMPTS', 5),
+        run_at=timezone.now() + (delay or timedelta()),
+    )
+
+
+def worker_id() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def backoff(attempts: int) -> timedelta:
+    """Delay before retry number ``attempts``: base · 2^(attempts-1), capped, ±25% jitter."""
+    base = getattr(settings, 'TASK_QUEUE_RETRY_BASE_SECONDS', 30)
+    cap = getattr(settings, 'TASK_QUEUE_RETRY_MAX_SECONDS', 3600)
+    delay = min(cap, base * 2 ** max(0, attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.75, 1.25))
+
+
+def requeue_stale() -> int:
+    """Put tasks abandoned by a crashed worker back in the queue."""
+    timeout = getattr(settings, 'TASK_QUEUE_LOCK_TIMEOUT', 600)
+    return Task.objects.filter(
+        status=Task.RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(status=Task.QUEUED, locked_at=None, locked_by='', updated_at=timezone.now())
+
+
+def claim(limit: int, worker: str) -> list:
+    """Atomically take up to ``limit`` due tasks for ``worker``."""
+    now = timezone.now()
+    due = Task.objects.filter(status=Task.QUEUED, run_at__lte=now).order_by('run_at', 'pk')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        candidates = list(due.values_list('pk', flat=True)[:limit])
+        claimed = []
+        for pk in candidates:
+            # Conditional update: on databases without SKIP LOCKED another worker may have won
+            if Task.objects.filter(pk=pk, status=Task.QUEUED).update(
+                status=Task.RUNNING, locked_at=now, locked_by=worker,
+                attempts=F('attempts') + 1, updated_at=now,
+            ):
+                claimed.append(pk)
+    return list(Task.objects.filter(pk__in=claimed).order_by('run_at', 'pk'))
+
+
+def _finish(job: Task, outcome: str, **fields) -> str:
+    """Record ``outcome`` only if ``job`` is still ours; returns the outcome or LOST."""
+    if Task.objects.filter(pk=job.pk, status=Task.RUNNING, locked_by=job.locked_by).update(
+        status=outcome, locked_at=None, updated_at=timezone.now(), **fields
+    ):
+        return outcome
+    logger.warning(f'[Tasks] {job} was requeued while {job.locked_by} ran it; {outcome} not recorded')
+    return LOST
+
+
+def execute(job: Task) -> str:
+    """Run one claimed task and record the outcome. Returns the new status (LOST if no longer ours)."""
+    handler = _registry.get(job.name)
+    try:
+        if handler is None:
+            raise KeyError(f'No handler registered for task {job.name!r}')
+        handler(**job.payload)
+    except Exception as exc:
+        error = f'{type(exc).__name__}: {exc}'
+        if job.attempts >= job.max_attempts:
+            logger.error(f'[Tasks] {job} dead after {job.attempts} attempt(s): {error}', exc_info=True)
+            return _finish(job, Task.DEAD, last_error=error)
+        retry_at = timezone.now() + backoff(job.attempts)
+        logger.warning(f'[Tasks] {job} failed (attempt {job.attempts}), retrying at {retry_at:%H:%M:%S}: {error}')
+        return _finish(job, Task.QUEUED, run_at=retry_at, last_error=error, locked_by='')
+
+    return _finish(job, Task.DONE)
+
+
+def run_pending(limit: int = 20, worker: str | None = None) -> dict:
+    """
+    Run up to ``limit`` due tasks. Returns {status: count}.
+
+    Tasks are claimed one at a time, right before each runs: a task claimed
+    with a batch would age towards TASK_QUEUE_LOCK_TIMEOUT while waiting its
+    turn, and requeue_stale() could hand it to a second worker.
+    """
+    worker = worker or worker_id()
+    results = {}
+    for _ in range(limit):
+        jobs = claim(1, worker)
+        if not jobs:
+            break
+        outcome = execute(jobs[0])
+        results[outcome] = results.get(outcome, 0) + 1
+    return results
+
+
+# ----------------------------------------------------------------------
+# Email tasks
+# ----------------------------------------------------------------------
+# The email_utils senders log and return False on failure; raise instead so
+# the queue retries.
+
+@task('email.order_confirmation')
+def order_confirmation_email(order_id):
+    from .email_utils import send_order_confirmation_email
+    # Order and items in one prefetch pass (two queries); the email only reads them
+    order = Order.objects.prefetch_related('items').get(pk=order_id)
+    if not send_order_confirmation_email(order):
+        raise RuntimeError(f'Order confirmation email for {order.order_id} was not sent')
+
+
+@task('email.custom_order_notification')
+def custom_order_notification_email(custom_order_id):
+    from .email_utils import send_custom_order_notification
+    if not send_custom_order_notification(CustomOrder.objects.get(pk=custom_order_id)):
+        raise RuntimeError(f'Custom order #{custom_order_id} notification was not sent')
+
+
+@task('email.contact_notification')
+def contact_notification_email(contact_message_id):
+    from .email_utils import send_contact_message_notification
+    if not send_contact_message_notification(ContactMessage.objects.get(pk=contact_message_id)):
+        raise RuntimeError(f'Contact message #{contact_message_id} notification was not sent')
+
+
+# ----------------------------------------------------------------------
+# Razorpay webhooks
+# ----------------------------------------------------------------------
+
+@task('razorpay.webhooks')
+def razorpay_webhooks(razorpay_order_id):
+    """Apply the pending webhook events of one Razorpay order."""
+    from .services.webhook_service import WebhookService
+    WebhookService.process_order(razorpay_order_id)
+
+
+# ----------------------------------------------------------------------
+# Newsletter
+# ----------------------------------------------------------------------
+
+@task('newsletter.broadcast')
+def newsletter_broadcast(campaign_id):
+    """Send one time-boxed slice of a campaign, then queue the next slice."""
+    from .services.newsletter_service import BUSY, LEASE_SECONDS, PAUSED, QUOTA, NewsletterService
+
+    outcome = NewsletterService.send(campaign_id, time_budget=getattr(settings, 'NEWSLETTER_TASK_SECONDS', 240))
+    if outcome == PAUSED:
+        enqueue('newsletter.broadcast', campaign_id=campaign_id)
+    elif outcome == QUOTA:
+        enqueue('newsletter.broadcast', campaign_id=campaign_id, delay=timedelta(hours=1))
+    elif outcome == BUSY:
+        # Someone else is sending it; check back once their lease could have expired
+        enqueue('newsletter.broadcast', campaign_id=campaign_id, delay=timedelta(seconds=LEASE_SECONDS))
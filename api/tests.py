@@ -1,7 +1,58 @@
-from django.test import TestCase
-from rest_framework.test import APIClient
+import asyncio
+import base64
+import gc
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import smtplib
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock, skipIf
+from urllib.parse import parse_qs, urlsplit
+
+from botocore.stub import ANY, Stubber
+try:
+    from aiosmtpd.controller import Controller as SMTPController
+except ImportError:  # optional: only needed for the SMTP transport tests
+    SMTPController = None
+from django.contrib.auth.models import User
+from django.core import mail, signing
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
-from api.models import Category, Material, Product, CustomOrder, ContactMessage, Newsletter
+from api import catalog_cache, email_utils, tasks
+from api.mesh import MeshError, UnsupportedMesh, analyze_file
+from api.models import (
+    Category, Material, Product, CustomOrder, ContactMessage, Newsletter,
+    Order, OrderItem, Coupon, StockReservation, IdempotencyKey, MaterialPricing, Task,
+    NewsletterCampaign, NewsletterDelivery, WebhookEvent, BestSeller,
+)
+from api.services.coupon_service import CouponService
+from api.services.inventory_service import InventoryService
+from api.services.order_state_service import IllegalTransition, OrderStateService
+from api.services import newsletter_service
+from api.services.newsletter_service import NewsletterService
+from api.services.quote_service import QuoteService
+from api.services.ranking_service import BestSellerService
+from api.services import reconciliation_service
+from api.services.reconciliation_service import ReconciliationService
+from api.services import s3_service
+from api.views import MULTIPART_TOKEN_SALT, CustomOrderViewSet
+from api.services.razorpay_service import GatewayUnavailable, RazorpayService, _get_client
 
 
 class ProductAPITest(TestCase):
@@ -35,6 +86,22 @@ class ProductAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['name'], 'Test Product')
 
+    def test_list_query_count_is_constant(self):
+        for i in range(5):
+            Product.objects.create(
+                name=f"Extra {i}", description="Test", price=100,
+                category=self.category, material=self.material
+            )
+        with self.assertNumQueries(3):  # ETag aggregate + COUNT for pagination + joined page
+            response = self.client.get('/api/products/')
+        self.assertEqual(response.data['results'][0]['category_name'], 'Test Category')
+
+    def test_detail_query_count(self):
+        with self.assertNumQueries(2):  # ETag aggregate + joined, annotated row
+            response = self.client.get(f'/api/products/{self.product.slug}/')
+        self.assertEqual(response.data['category']['product_count'], 1)
+        self.assertEqual(response.data['material']['name'], 'PLA')
+
     def test_filter_products_by_category(self):
         response = self.client.get(f'/api/products/?category__slug={self.category.slug}')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -69,6 +136,221 @@ class CustomOrderAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+class DesignFileStreamingTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=self.media_root, DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.client = APIClient()
+        response = self.client.post('/api/custom-orders/', {
+            'name': 'John Doe', 'email': 'john@example.com', 'phone': '+91 1234567890',
+            'material': 'PLA', 'color': 'Blue', 'description': 'Gearbox housing', 'quantity': 1,
+        })
+        self.order_id = response.data['order_id']
+        self.token = response.data['upload_token']
+
+    def _url(self, file_name):
+        return f'/api/custom-orders/{self.order_id}/design-file/?file_name={file_name}'
+
+    def _upload(self, body, file_name='housing.stl', token=None):
+        return self.client.generic(
+            'POST', self._url(file_name), body, content_type='application/octet-stream',
+            HTTP_X_UPLOAD_TOKEN=token or self.token,
+        )
+
+    def test_10mb_upload_streams_with_bounded_memory(self):
+        body = b'\x00' * 80 + (10 * 1024 * 1024 - 80) * b'\x01'
+        # Build the request (and its in-memory body) before measuring
+        request = APIRequestFactory().generic(
+            'POST', self._url('housing.stl'), body, content_type='application/octet-stream',
+            HTTP_X_UPLOAD_TOKEN=self.token,
+        )
+        view = CustomOrderViewSet.as_view({'post': 'design_file'})
+
+        tracemalloc.start()
+        try:
+            response = view(request, pk=str(self.order_id))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertLess(peak, 1024 * 1024)
+        order = CustomOrder.objects.get(pk=self.order_id)
+        self.assertEqual(order.design_file.size, len(body))
+
+    def test_mislabelled_file_is_rejected_and_not_stored(self):
+        response = self._upload(b'not really a png' * 10, file_name='render.png')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CustomOrder.objects.get(pk=self.order_id).design_file)
+
+    def test_oversized_upload_is_rejected_upfront(self):
+        response = self._upload(b'solid big\n' + b' ' * (10 * 1024 * 1024))
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_upload_requires_token_for_this_order(self):
+        other = CustomOrder.objects.create(
+            name='Other', email='o@example.com', phone='1', color='Red', description='x',
+        )
+        response = self._upload(b'solid part\nendsolid part\n', token='bogus')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.generic(
+            'POST', f'/api/custom-orders/{other.pk}/design-file/?file_name=a.stl', b'solid a\n',
+            content_type='application/octet-stream', HTTP_X_UPLOAD_TOKEN=self.token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+# A 10 mm cube: 8 corners, 12 outward-facing triangles
+CUBE_VERTICES = [(0, 0, 0), (10, 0, 0), (10, 10, 0), (0, 10, 0), (0, 0, 10), (10, 0, 10), (10, 10, 10), (0, 10, 10)]
+CUBE_FACES = [
+    (0, 2, 1), (0, 3, 2), (4, 5, 6), (4, 6, 7), (0, 1, 5), (0, 5, 4),
+    (1, 2, 6), (1, 6, 5), (2, 3, 7), (2, 7, 6), (3, 0, 4), (3, 4, 7),
+]
+
+
+def _cube_binary_stl(header=b'binary cube'):
+    import struct
+    body = b''.join(
+        struct.pack('<12fH', 0, 0, 0, *[c for i in face for c in CUBE_VERTICES[i]], 0) for face in CUBE_FACES
+    )
+    return header.ljust(80, b' ') + struct.pack('<I', len(CUBE_FACES)) + body
+
+
+def _cube_ascii_stl():
+    lines = ['solid cube']
+    for face in CUBE_FACES:
+        lines += ['  facet normal 0 0 0', '    outer loop']
+        lines += ['      vertex %g %g %g' % CUBE_VERTICES[i] for i in face]
+        lines += ['    endloop', '  endfacet']
+    return ('\n'.join(lines + ['endsolid cube']) + '\n').encode()
+
+
+def _cube_obj():
+    # Quads, with negative (relative) indices on the last face
+    lines = ['# cube'] + ['v %g %g %g' % v for v in CUBE_VERTICES] + [
+        'f 1 4 3 2', 'f 5/1 6/1 7/1 8/1', 'f 1//1 2//1 6//1 5//1', 'f 2 3 7 6', 'f 3 4 8 7', 'f -8 -4 -1 -5',
+    ]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+class MeshAnalysisTest(TestCase):
+    def _assert_cube(self, stats, triangles=12):
+        self.assertEqual(stats.triangle_count, triangles)
+        self.assertEqual(stats.size, (10.0, 10.0, 10.0))
+        self.assertAlmostEqual(stats.surface_area, 600.0, places=6)
+        self.assertAlmostEqual(stats.volume, 1000.0, places=6)
+
+    def test_binary_stl(self):
+        data = _cube_binary_stl()
+        self._assert_cube(analyze_file(BytesIO(data), 'cube.stl', size=len(data), chunk_triangles=5))
+
+    def test_binary_stl_with_solid_header(self):
+        data = _cube_binary_stl(header=b'solid exported by CAD')
+        self._assert_cube(analyze_file(BytesIO(data), 'cube.STL', size=len(data)))
+
+    def test_ascii_stl_across_chunk_boundaries(self):
+        self._assert_cube(analyze_file(BytesIO(_cube_ascii_stl()), 'cube.stl', chunk_bytes=97))
+
+    def test_obj_quads_and_relative_indices(self):
+        self._assert_cube(analyze_file(BytesIO(_cube_obj()), 'cube.obj', chunk_bytes=31, chunk_triangles=5))
+
+    def test_truncated_and_unsupported_files(self):
+        data = _cube_binary_stl()[:-20]
+        with self.assertRaises(MeshError):
+            analyze_file(BytesIO(data), 'cube.stl')
+        with self.assertRaises(UnsupportedMesh):
+            analyze_file(BytesIO(b'PK\x03\x04'), 'part.3mf')
+
+    def test_uploaded_design_file_is_analysed_by_command(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            client = APIClient()
+            created = client.post('/api/custom-orders/', {
+                'name': 'John Doe', 'email': 'john@example.com', 'phone': '+91 1234567890',
+                'color': 'Blue', 'description': 'Cube', 'quantity': 1,
+            })
+            client.generic(
+                'POST', f"/api/custom-orders/{created.data['order_id']}/design-file/?file_name=cube.stl",
+                _cube_binary_stl(), content_type='application/octet-stream',
+                HTTP_X_UPLOAD_TOKEN=created.data['upload_token'],
+            )
+            order = CustomOrder.objects.get(pk=created.data['order_id'])
+            self.assertEqual(order.analysis_status, CustomOrder.ANALYSIS_PENDING)
+
+            call_command('analyze_custom_orders', stdout=StringIO())
+
+        order.refresh_from_db()
+        self.assertEqual(order.analysis_status, CustomOrder.ANALYSIS_DONE)
+        self.assertEqual(order.mesh_triangle_count, 12)
+        self.assertAlmostEqual(order.mesh_volume, 1000.0)
+        self.assertEqual((order.mesh_size_x, order.mesh_size_y, order.mesh_size_z), (10.0, 10.0, 10.0))
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_mesh_analysis', triangles=[10_000], stdout=out)
+        self.assertIn('vol err', out.getvalue())
+
+
+class QuoteEngineTest(TestCase):
+    def _order(self, material='PLA', volume=20_000.0, quantity=1, **extra):
+        return CustomOrder.objects.create(
+            name='Q', email='q@example.com', phone='1', color='Grey', description='part',
+            material=material, quantity=quantity, analysis_status=CustomOrder.ANALYSIS_DONE,
+            mesh_volume=volume, **extra,
+        )
+
+    def test_seeded_pricing_quotes_order_with_breakdown(self):
+        order = self._order(volume=20_000.0, quantity=2)  # 20 cm³ of PLA
+        self.assertEqual(QuoteService.quote_orders(CustomOrder.objects.all()), 1)
+        order.refresh_from_db()
+
+        # 20 cm³ × 0.35 = 7 cm³ printed → 8.68 g, 0.5833 h
+        breakdown = order.quote_breakdown
+        self.assertAlmostEqual(breakdown['mass_g'], 8.68)
+        self.assertEqual(breakdown['material_cost'], '10.42')   # 8.68 g × ₹1200/kg
+        self.assertEqual(breakdown['machine_cost'], '35.00')    # 0.5833 h × ₹60/h
+        self.assertEqual(breakdown['unit_price'], '199.00')     # minimum price applies
+        self.assertEqual(order.quote_amount, Decimal('398.00'))
+
+    def test_manual_quote_is_kept_unless_forced(self):
+        order = self._order(volume=500_000.0)
+        QuoteService.quote_orders(CustomOrder.objects.all())
+        CustomOrder.objects.filter(pk=order.pk).update(quote_amount=Decimal('999.00'))
+
+        self.assertEqual(QuoteService.quote_backlog(), 0)
+        self.assertEqual(QuoteService.quote_backlog(force=True), 1)
+        order.refresh_from_db()
+        self.assertNotEqual(order.quote_amount, Decimal('999.00'))
+
+    def test_backlog_repriced_in_constant_queries_after_price_change(self):
+        for i in range(300):
+            self._order(material=('PLA', 'PETG', 'NYLON')[i % 3], volume=100_000.0 + i)
+        self._order(status='QUOTED')             # already sent to the customer
+        self._order(material='OTHER')            # no pricing row
+        QuoteService.quote_backlog()
+        before = CustomOrder.objects.filter(material='PLA', status='PENDING').values_list('quote_amount', flat=True).first()
+
+        MaterialPricing.objects.filter(code='PLA').update(price_per_kg=2400)
+        with self.assertNumQueries(4):  # pricing, orders, one bulk UPDATE inside its savepoint
+            repriced = QuoteService.quote_backlog()
+        self.assertEqual(repriced, 300)
+        after = CustomOrder.objects.filter(material='PLA', status='PENDING').values_list('quote_amount', flat=True).first()
+        self.assertGreater(after, before)
+        self.assertFalse(CustomOrder.objects.filter(status='QUOTED', quote_amount__isnull=False).exists())
+
+    def test_command_reprices_one_material(self):
+        self._order(material='PLA')
+        self._order(material='ABS')
+        out = StringIO()
+        call_command('quote_custom_orders', material=['ABS'], stdout=out)
+        self.assertIn('Re-priced 1 custom order', out.getvalue())
+
+
 class ContactMessageAPITest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -98,3 +380,1827 @@ class NewsletterAPITest(TestCase):
         data = {'email': 'test@example.com'}
         response = self.client.post('/api/newsletter/', data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(NEWSLETTER_SEND_RATE=0, NEWSLETTER_DAILY_QUOTA=0, NEWSLETTER_BATCH_SIZE=100, RESEND_API_KEY='')
+class NewsletterBroadcastTest(TestCase):
+    def setUp(self):
+        Newsletter.objects.bulk_create([Newsletter(email=f'sub{i}@example.com') for i in range(250)])
+        Newsletter.objects.filter(email='sub7@example.com').update(is_active=False)
+        self.campaign = NewsletterCampaign.objects.create(subject='New filaments', body='Silk PLA is here.')
+
+    def _recipients(self):
+        return [m.to[0] for m in mail.outbox]
+
+    def test_worker_broadcasts_to_active_subscribers(self):
+        self.assertTrue(NewsletterService.start(self.campaign))
+        self.assertFalse(NewsletterService.start(self.campaign))
+        call_command('run_worker', once=True, stdout=StringIO())
+
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, NewsletterCampaign.SENT)
+        self.assertEqual((self.campaign.total_recipients, self.campaign.sent_count), (249, 249))
+        self.assertEqual(len(mail.outbox), 249)
+        self.assertNotIn('sub7@example.com', self._recipients())
+        self.assertEqual(NewsletterDelivery.objects.filter(status=NewsletterDelivery.SENT).count(), 249)
+
+    def test_queries_per_batch_are_constant(self):
+        NewsletterService.start(self.campaign)
+        with CaptureQueriesContext(connection) as queries:
+            NewsletterService.send(self.campaign.pk, batch_size=50)
+        # lease, load, 5 × (select batch, delivered, insert, cursor) + empty select, finish, reload, release
+        self.assertEqual(len(queries), 2 + 5 * 4 + 1 + 3)
+
+    def test_crashed_run_resumes_without_resending(self):
+        NewsletterService.start(self.campaign)
+        real_send = newsletter_service.send_bulk_emails
+        calls = []
+
+        def flaky(messages, failed=None):
+            calls.append(len(messages))
+            if len(calls) == 2:
+                raise ConnectionError('provider down')
+            return real_send(messages, failed=failed)
+
+        with mock.patch.object(newsletter_service, 'send_bulk_emails', side_effect=flaky):
+            with self.assertRaises(ConnectionError):
+                NewsletterService.send(self.campaign.pk)
+        self.campaign.refresh_from_db()
+        self.assertEqual((self.campaign.sent_count, self.campaign.lease_expires_at), (100, None))
+
+        self.assertEqual(NewsletterService.send(self.campaign.pk), newsletter_service.FINISHED)
+        recipients = self._recipients()
+        self.assertEqual(len(recipients), 249)
+        self.assertEqual(len(set(recipients)), 249)
+
+    @override_settings(NEWSLETTER_DAILY_QUOTA=120)
+    def test_daily_quota_pauses_campaign(self):
+        NewsletterService.start(self.campaign)
+        call_command('run_worker', once=True, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 120)
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, NewsletterCampaign.SENDING)
+        retry = Task.objects.get(name='newsletter.broadcast', status=Task.QUEUED)
+        self.assertGreater(retry.run_at, timezone.now() + timedelta(minutes=59))
+
+    @override_settings(NEWSLETTER_SEND_RATE=500)
+    def test_send_rate_is_paced(self):
+        NewsletterService.start(self.campaign)
+        started = time.monotonic()
+        NewsletterService.send(self.campaign.pk, batch_size=50)
+        # 249 messages at 500/s: only the first batch of 50 may go out unpaced
+        self.assertGreaterEqual(time.monotonic() - started, (249 - 50) / 500)
+
+    def test_lease_and_cancellation(self):
+        NewsletterService.start(self.campaign)
+        NewsletterCampaign.objects.filter(pk=self.campaign.pk).update(
+            lease_expires_at=timezone.now() + timedelta(minutes=1)
+        )
+        self.assertEqual(NewsletterService.send(self.campaign.pk), newsletter_service.BUSY)
+
+        NewsletterCampaign.objects.filter(pk=self.campaign.pk).update(lease_expires_at=None)
+        real_send = newsletter_service.send_bulk_emails
+
+        def cancel_after_first_batch(messages, failed=None):
+            NewsletterCampaign.objects.filter(pk=self.campaign.pk).update(status=NewsletterCampaign.CANCELLED)
+            return real_send(messages, failed=failed)
+
+        with mock.patch.object(newsletter_service, 'send_bulk_emails', side_effect=cancel_after_first_batch):
+            self.assertEqual(NewsletterService.send(self.campaign.pk), newsletter_service.INACTIVE)
+        self.assertEqual(len(mail.outbox), 100)
+
+    def test_memory_flat_in_subscriber_count(self):
+        def peak(extra):
+            Newsletter.objects.bulk_create([Newsletter(email=f'more{extra:05d}-{i:05d}@example.com') for i in range(extra)])
+            campaign = NewsletterCampaign.objects.create(subject='Hi', body='Body')
+            NewsletterService.start(campaign)
+            # A plain function: a Mock would keep every batch in call_args_list
+            with mock.patch.object(newsletter_service, 'send_bulk_emails', lambda messages, failed=None: 0):
+                gc.collect()
+                tracemalloc.start()
+                NewsletterService.send(campaign.pk, batch_size=100)
+                result = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            return result
+
+        # Collect cyclic garbage (ORM query objects) promptly, so the peak reflects live data only
+        thresholds = gc.get_threshold()
+        gc.set_threshold(100, 1, 1)
+        self.addCleanup(gc.set_threshold, *thresholds)
+        peak(100)  # warm-up: lazy imports and compiled-SQL caches are allocated once, not per subscriber
+        small, large = peak(1000), peak(12000)  # ~1.3k vs ~13.3k active subscribers
+        # Holding all ~13k rows at once costs ~11 MB; keyset batches keep the growth to noise
+        self.assertLess(large - small, 256 * 1024)
+
+class CategoryAPITest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def _create_categories(self, count):
+        for i in range(count):
+            category = Category.objects.create(name=f"Category {i}")
+            Product.objects.create(
+                name=f"Product {i}", description="Test", price=100,
+                category=category, is_available=True
+            )
+            Product.objects.create(
+                name=f"Hidden Product {i}", description="Test", price=100,
+                category=category, is_available=False
+            )
+
+    def test_product_count_excludes_unavailable(self):
+        self._create_categories(1)
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['product_count'], 1)
+
+    def test_list_query_count_is_constant(self):
+        self._create_categories(2)
+        with self.assertNumQueries(3):  # ETag aggregate + COUNT for pagination + annotated page
+            self.client.get('/api/categories/')
+
+        for i in range(10):
+            Category.objects.create(name=f"Extra {i}")
+        with self.assertNumQueries(3):
+            self.client.get('/api/categories/')
+
+
+class CatalogCacheTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Cached Category")
+        catalog_cache.reset_stats()
+
+    def test_second_request_is_served_from_cache(self):
+        self.client.get('/api/categories/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/categories/')
+        self.assertEqual(response.data['results'][0]['name'], 'Cached Category')
+        stats = catalog_cache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_querystring_is_part_of_key(self):
+        self.client.get('/api/categories/')
+        self.client.get('/api/categories/?page=1')
+        self.assertEqual(catalog_cache.get_stats()['misses'], 2)
+
+    def test_stats_are_kept_in_the_cache(self):
+        # Counters live in the shared cache, so every worker's hits add up
+        self.client.get('/api/categories/')
+        self.client.get('/api/categories/')
+        cache = catalog_cache._get_cache()
+        self.assertEqual(cache.get(catalog_cache.STATS_KEY_PREFIX + 'hits'), 1)
+        out = StringIO()
+        call_command('catalog_cache_stats', '--reset', stdout=out)
+        self.assertIn('hit_ratio: 0.5', out.getvalue())
+        self.assertEqual(catalog_cache.get_stats()['hits'], 0)
+
+    def test_save_bumps_generation(self):
+        self.client.get('/api/categories/')
+        generation = catalog_cache.get_generation()
+        self.category.name = "Renamed"
+        self.category.save()
+        self.assertEqual(catalog_cache.get_generation(), generation + 1)
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed')
+
+    def test_delete_bumps_generation(self):
+        generation = catalog_cache.get_generation()
+        self.category.delete()
+        self.assertEqual(catalog_cache.get_generation(), generation + 1)
+
+    def test_stock_change_invalidates_only_product_responses(self):
+        product = Product.objects.create(
+            name="Stocked", description="Test", price=100, category=self.category, stock_quantity=5,
+        )
+        order = Order.objects.create(
+            customer_name='Asha', customer_email='asha@example.com', customer_phone='9876543210',
+            shipping_address='1 MG Road', shipping_city='Bengaluru', shipping_state='KA',
+            shipping_pincode='560001', total_amount=100,
+        )
+        self.client.get('/api/categories/')
+        self.client.get('/api/products/')
+        generation = catalog_cache.get_generation()
+
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            InventoryService.reserve(order, {product.pk: 2})
+
+        self.assertEqual(catalog_cache.get_generation(), generation)
+        with self.assertNumQueries(0):
+            self.client.get('/api/categories/')
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.data['results'][0]['stock_quantity'], 3)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Conditional Category")
+        self.product = Product.objects.create(
+            name="Conditional Product", description="Test", price=100,
+            category=self.category
+        )
+
+    def test_product_list_returns_304_for_matching_etag(self):
+        response = self.client.get('/api/products/')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_304_without_serialization_on_cache_miss(self):
+        etag = self.client.get(f'/api/products/{self.product.slug}/')['ETag']
+        with self.settings(CATALOG_CACHE_ENABLED=False):
+            with self.assertNumQueries(1):  # the validator aggregate only
+                response = self.client.get(
+                    f'/api/products/{self.product.slug}/', HTTP_IF_NONE_MATCH=etag
+                )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_changes_when_product_changes(self):
+        etag = self.client.get('/api/categories/')['ETag']
+        self.product.is_available = False
+        self.product.save()
+        response = self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['product_count'], 0)
+
+    def test_product_etag_changes_when_material_changes(self):
+        material = Material.objects.create(name="PLA")
+        self.product.material = material
+        self.product.save()
+        etag = self.client.get('/api/products/')['ETag']
+        material.name = "PLA+"
+        material.save()
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['material_name'], 'PLA+')
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get('/api/categories/')['Last-Modified']
+        response = self.client.get('/api/categories/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_missing_product_still_404(self):
+        response = self.client.get('/api/products/does-not-exist/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name="Home Decor")
+        Product.objects.create(name="Spiral Vase", description="A twisted vase", price=499, category=category)
+        Product.objects.create(name="Desk Lamp", description="Warm light", price=899, category=category)
+
+    def test_search_matches_name_and_description(self):
+        response = self.client.get('/api/products/?search=vase')
+        self.assertEqual([p['name'] for p in response.data['results']], ['Spiral Vase'])
+        response = self.client.get('/api/products/?search=warm')
+        self.assertEqual([p['name'] for p in response.data['results']], ['Desk Lamp'])
+
+    def test_explicit_ordering_still_applies(self):
+        response = self.client.get('/api/products/?search=a&ordering=price')
+        self.assertEqual([p['price'] for p in response.data['results']], ['499.00', '899.00'])
+
+    @mock.patch('api.search.refresh_product_search_vector')
+    def test_search_vector_refreshed_only_when_its_columns_change(self, refresh):
+        product = Product.objects.get(name="Desk Lamp")
+        product.price = 999
+        product.save()
+        Product.objects.only('id', 'slug', 'stock_quantity').get(pk=product.pk).save()
+        refresh.assert_not_called()
+
+        product.name = "Desk Lamp Pro"
+        product.save()
+        product.category = Category.objects.create(name="Lighting")
+        product.save()
+        self.assertEqual(refresh.call_count, 2)
+
+    @mock.patch('api.search.refresh_category_search_vectors')
+    def test_category_refreshes_product_vectors_only_on_rename(self, refresh):
+        category = Category.objects.get(pk=Product.objects.get(name="Desk Lamp").category_id)
+        category.description = "Updated"
+        category.save()
+        refresh.assert_not_called()
+
+        category.name = "Renamed"
+        category.save()
+        category.save()
+        refresh.assert_called_once_with(category)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name="Keyset Category")
+        for i in range(45):
+            Product.objects.create(
+                name=f"Keyset Product {i}", description="Test", price=100,
+                category=category, is_featured=(i % 10 == 0)
+            )
+
+    def test_walks_all_products_in_listing_order(self):
+        expected = list(
+            Product.objects.order_by('-is_featured', '-created_at', 'id').values_list('slug', flat=True)
+        )
+        seen = []
+        url = '/api/products/?cursor='
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(p['slug'] for p in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+    def test_no_count_query(self):
+        with self.settings(CATALOG_CACHE_ENABLED=False):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get('/api/products/?cursor=')
+        self.assertFalse(any('COUNT(*)' in q['sql'] for q in queries.captured_queries))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/products/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tampered_cursor(self):
+        # Well-formed base64 JSON whose values the model fields reject
+        def cursor(values):
+            return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+        response = self.client.get('/api/products/?cursor=' + cursor([True, 'not-a-date', 'x']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(User.objects.create_user('buyer', 'buyer@example.com', 'pass12345'))
+        response = self.client.get('/api/orders/user/me/?cursor=' + cursor(['not-a-date', 'x']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_user_orders_cursor(self):
+        user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        for i in range(25):
+            Order.objects.create(
+                user=user if i % 2 else None, customer_name='Buyer',
+                customer_email='buyer@example.com', customer_phone='9876543210',
+                shipping_address='1 Street', shipping_city='Pune',
+                shipping_state='MH', shipping_pincode='411001', total_amount=100,
+            )
+        self.client.force_authenticate(user)
+        first = self.client.get('/api/orders/user/me/?cursor=')
+        self.assertEqual(len(first.data['results']), 20)
+        second = self.client.get(first.data['next'])
+        self.assertEqual(len(second.data['results']), 5)
+        self.assertIsNone(second.data['next'])
+        ids = [o['id'] for o in first.data['results'] + second.data['results']]
+        self.assertEqual(len(set(ids)), 25)
+
+    def test_user_orders_union_is_deduplicated_without_or(self):
+        user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        other = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        for i in range(6):
+            Order.objects.create(
+                user=[user, None, other][i % 3], customer_name='Buyer',
+                customer_email='other@example.com' if i == 5 else 'buyer@example.com',
+                customer_phone='9876543210', shipping_address='1 Street', shipping_city='Pune',
+                shipping_state='MH', shipping_pincode='411001', total_amount=100,
+            )
+        expected = list(
+            Order.objects.filter(Q(user=user) | Q(customer_email='buyer@example.com'))
+            .order_by('-created_at', 'id').values_list('id', flat=True)
+        )
+        self.client.force_authenticate(user)
+        for url in ('/api/orders/user/me/', '/api/orders/user/me/?cursor='):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            results = response.data['results'] if 'cursor' in url else response.data
+            self.assertEqual([o['id'] for o in results], expected)
+            order_queries = [q['sql'] for q in queries.captured_queries if 'FROM "api_order"' in q['sql']]
+            self.assertFalse(any(' OR ' in sql for sql in order_queries))
+
+
+class CheckoutTestMixin:
+    """20 products with 5 units each and a stubbed Razorpay order API."""
+    mock_razorpay = True
+
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Order Category")
+        self.products = [
+            Product.objects.create(
+                name=f"Cart Product {i}", description="Test", price=100 + i,
+                category=self.category, stock_quantity=5
+            )
+            for i in range(20)
+        ]
+        if not self.mock_razorpay:
+            return
+        patcher = mock.patch(
+            'api.views.RazorpayService.create_order',
+            side_effect=lambda amount_inr, receipt, notes=None: {
+                'id': f'order_{receipt}', 'amount': int(amount_inr * 100), 'currency': 'INR',
+            },
+        )
+        self.razorpay = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _payload(self, products, quantity=1):
+        return {
+            'customer_name': 'Asha', 'customer_email': 'asha@example.com',
+            'customer_phone': '9876543210', 'shipping_address': '1 MG Road',
+            'shipping_city': 'Bengaluru', 'shipping_state': 'KA', 'shipping_pincode': '560001',
+            'items': [{'product_id': str(p.id), 'quantity': str(quantity)} for p in products],
+        }
+
+
+@override_settings(RAZORPAY_KEY_ID='rzp_test_key', RAZORPAY_KEY_SECRET='secret')
+class CreateOrderAPITest(CheckoutTestMixin, TestCase):
+    def _count_queries(self, products):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/orders/create/', self._payload(products), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return len(queries)
+
+    def test_query_count_independent_of_cart_size(self):
+        self.assertEqual(self._count_queries(self.products[:2]), self._count_queries(self.products))
+        self.assertEqual(OrderItem.objects.count(), 22)
+
+    def test_all_stock_errors_reported_at_once(self):
+        response = self.client.post(
+            '/api/orders/create/', self._payload(self.products[:3], quantity=6), format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data['errors']), 3)
+        self.assertFalse(Order.objects.exists())
+
+    def test_unknown_product(self):
+        payload = self._payload(self.products[:1])
+        payload['items'].append({'product_id': '999999', 'quantity': '1'})
+        response = self.client.post('/api/orders/create/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['missing_product_ids'], ['999999'])
+
+
+@override_settings(RAZORPAY_KEY_ID='rzp_test_key', RAZORPAY_KEY_SECRET='secret')
+class StockReservationTest(CheckoutTestMixin, TestCase):
+    def _create(self, products, quantity=1):
+        response = self.client.post('/api/orders/create/', self._payload(products, quantity), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return Order.objects.get(order_id=response.data['order_id'])
+
+    def test_checkout_reserves_stock(self):
+        order = self._create(self.products[:2], quantity=2)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 3)
+        self.assertEqual(order.stock_reservations.filter(status=StockReservation.ACTIVE).count(), 2)
+
+    def test_payment_failed_releases_stock(self):
+        order = self._create(self.products[:1], quantity=5)
+        response = self.client.post('/api/orders/payment-failed/', {'order_id': order.order_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 5)
+        # Releasing twice is a no-op
+        self.client.post('/api/orders/payment-failed/', {'order_id': order.order_id}, format='json')
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 5)
+
+    def test_expired_reservations_are_released(self):
+        order = self._create(self.products[:1], quantity=4)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        call_command('release_expired_reservations', stdout=StringIO())
+        order.refresh_from_db()
+        self.products[0].refresh_from_db()
+        self.assertEqual(order.status, 'CANCELLED')
+        self.assertEqual(self.products[0].stock_quantity, 5)
+
+
+@override_settings(RAZORPAY_KEY_ID='rzp_test_key', RAZORPAY_KEY_SECRET='secret')
+class ConcurrentCheckoutTest(TransactionTestCase):
+    """Many threads race for the last units of one product; stock must never go negative."""
+
+    THREADS = 16
+
+    def setUp(self):
+        category = Category.objects.create(name="Race Category")
+        self.product = Product.objects.create(
+            name="Last Few", description="Test", price=100, category=category, stock_quantity=5
+        )
+        patcher = mock.patch(
+            'api.views.RazorpayService.create_order',
+            side_effect=lambda amount_inr, receipt, notes=None: {
+                'id': f'order_{receipt}', 'amount': int(amount_inr * 100), 'currency': 'INR',
+            },
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _checkout(self, barrier, results):
+        # The test client re-raises exceptions signalled by *any* thread; collect status codes instead
+        client = APIClient(raise_request_exception=False)
+        payload = {
+            'customer_name': 'Racer', 'customer_email': 'racer@example.com',
+            'customer_phone': '9876543210', 'shipping_address': '1 Lane',
+            'shipping_city': 'Chennai', 'shipping_state': 'TN', 'shipping_pincode': '600001',
+            'items': [{'product_id': str(self.product.pk), 'quantity': '1'}],
+        }
+        barrier.wait()
+        try:
+            # Under SQLite contention some requests fail with "database table is locked" (500)
+            results.append(client.post('/api/orders/create/', payload, format='json').status_code)
+        finally:
+            connection.close()
+
+    def test_stock_never_negative(self):
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+        threads = [
+            threading.Thread(target=self._checkout, args=(barrier, results))
+            for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        created = results.count(status.HTTP_201_CREATED)
+        reserved = sum(
+            StockReservation.objects.filter(status=StockReservation.ACTIVE).values_list('quantity', flat=True)
+        )
+        self.assertGreaterEqual(self.product.stock_quantity, 0)
+        self.assertLessEqual(created, 5)
+        # A 500 after the reservation committed (SQLite "table is locked" during the
+        # gateway/cleanup step) leaves its hold for release_expired_reservations
+        self.assertGreaterEqual(reserved, created)
+        self.assertEqual(self.product.stock_quantity + reserved, 5)
+
+
+class CouponRedemptionTest(TransactionTestCase):
+    def setUp(self):
+        self.coupon = Coupon.objects.create(
+            code='LIMITED10', discount_type='FLAT', discount_value=50, max_uses=10
+        )
+
+    def _redeem(self, barrier, results):
+        barrier.wait()
+        try:
+            while True:
+                try:
+                    results.append(CouponService.redeem(self.coupon))
+                    return
+                except OperationalError:
+                    # SQLite's "database table is locked" — a retry, not a redemption outcome
+                    time.sleep(0.001)
+        finally:
+            connection.close()
+
+    def test_exactly_max_uses_succeed_under_contention(self):
+        barrier = threading.Barrier(50)
+        results = []
+        threads = [threading.Thread(target=self._redeem, args=(barrier, results)) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 50)
+        self.assertEqual(results.count(True), 10)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_used, 10)
+
+    def test_failed_order_returns_its_use_once(self):
+        self.assertTrue(CouponService.redeem(self.coupon))
+        order = Order.objects.create(
+            customer_name='Asha', customer_email='asha@example.com', customer_phone='9876543210',
+            shipping_address='1 MG Road', shipping_city='Bengaluru', shipping_state='KA',
+            shipping_pincode='560001', total_amount=100, coupon_code=self.coupon.code,
+            coupon_redeemed=True,
+        )
+        client = APIClient()
+        for _ in range(2):
+            client.post('/api/orders/payment-failed/', {'order_id': order.order_id}, format='json')
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_used, 0)
+
+
+@override_settings(RAZORPAY_KEY_ID='rzp_test_key', RAZORPAY_KEY_SECRET='secret')
+class IdempotentCheckoutTest(CheckoutTestMixin, TestCase):
+    def _post(self, payload, key='checkout-key-1'):
+        return self.client.post('/api/orders/create/', payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        payload = self._payload(self.products[:2])
+        first = self._post(payload)
+        second = self._post(payload)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data['order_id'], first.data['order_id'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.razorpay.call_count, 1)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 4)
+
+    def test_key_reused_with_different_body_is_rejected(self):
+        self._post(self._payload(self.products[:1]))
+        response = self._post(self._payload(self.products[1:2]))
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_gateway_failure_allows_retry_with_same_key(self):
+        payload = self._payload(self.products[:1])
+        with mock.patch('api.views.RazorpayService.create_order', side_effect=Exception('gateway down')):
+            failed = self._post(payload)
+        self.assertEqual(failed.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        retried = self._post(payload)
+        self.assertEqual(retried.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 1)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 4)
+
+    def test_requests_without_key_are_not_deduplicated(self):
+        payload = self._payload(self.products[:1])
+        self.client.post('/api/orders/create/', payload, format='json')
+        self.client.post('/api/orders/create/', payload, format='json')
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_same_key_from_another_customer_is_not_replayed(self):
+        first = self._post(self._payload(self.products[:1]))
+        other = {**self._payload(self.products[:1]), 'customer_email': 'ravi@example.com'}
+        second = self._post(other)
+
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(second.data['order_id'], first.data['order_id'])
+        self.assertFalse(second.has_header('Idempotent-Replayed'))
+        self.assertEqual(
+            set(IdempotencyKey.objects.values_list('scope', flat=True)),
+            {'email:asha@example.com', 'email:ravi@example.com'},
+        )
+
+    def test_purge_deletes_only_expired_keys(self):
+        self._post(self._payload(self.products[:1]), key='old')
+        self._post(self._payload(self.products[:1]), key='new')
+        IdempotencyKey.objects.filter(key='old').update(created_at=timezone.now() - timedelta(hours=25))
+
+        out = StringIO()
+        call_command('purge_idempotency_keys', hours=24, stdout=out)
+        self.assertIn('Purged 1', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+
+@override_settings(
+    RAZORPAY_KEY_ID='rzp_test_key', RAZORPAY_KEY_SECRET='secret',
+    TASK_QUEUE_MAX_ATTEMPTS=3, TASK_QUEUE_RETRY_BASE_SECONDS=10,
+)
+class TaskQueueTest(CheckoutTestMixin, TestCase):
+    def _run_worker(self):
+        out = StringIO()
+        call_command('run_worker', once=True, stdout=out)
+        return out.getvalue()
+
+    def _make_due(self):
+        Task.objects.filter(status=Task.QUEUED).update(run_at=timezone.now())
+
+    @mock.patch('api.email_utils.send_contact_message_notification', return_value=True)
+    def test_contact_notification_is_queued_not_sent(self, send):
+        response = self.client.post('/api/contact/', {
+            'name': 'Asha', 'email': 'asha@example.com', 'subject': 'Hi', 'message': 'Hello',
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        send.assert_not_called()
+        job = Task.objects.get()
+        self.assertEqual((job.name, job.payload), ('email.contact_notification', {'contact_message_id': response.data['message_id']}))
+
+        self.assertIn('Processed 1 task(s). 1 done', self._run_worker())
+        send.assert_called_once()
+        self.assertEqual(Task.objects.get().status, Task.DONE)
+
+    @mock.patch('api.email_utils.send_custom_order_notification', return_value=True)
+    def test_custom_order_notification_is_queued(self, send):
+        response = self.client.post('/api/custom-orders/', {
+            'name': 'Asha', 'email': 'asha@example.com', 'phone': '9876543210',
+            'material': 'PLA', 'color': 'Blue', 'description': 'Bracket', 'quantity': 1,
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        send.assert_not_called()
+        self.assertTrue(Task.objects.filter(name='email.custom_order_notification', status=Task.QUEUED).exists())
+
+    @mock.patch('api.email_utils.send_order_confirmation_email', return_value=True)
+    def test_verified_payment_queues_confirmation_without_a_thread(self, send):
+        response = self.client.post('/api/orders/create/', self._payload(self.products[:2]), format='json')
+        order = Order.objects.get(order_id=response.data['order_id'])
+        with mock.patch('api.views.RazorpayService.verify_signature', return_value=True), \
+                mock.patch('threading.Thread.start') as start:
+            response = self.client.post('/api/orders/verify-payment/', {
+                'razorpay_order_id': order.razorpay_order_id,
+                'razorpay_payment_id': 'pay_1', 'razorpay_signature': 'sig',
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        start.assert_not_called()
+        send.assert_not_called()
+
+        self._run_worker()
+        send.assert_called_once()
+        emailed = send.call_args.args[0]
+        self.assertEqual(emailed.pk, order.pk)
+        self.assertEqual(len(emailed._prefetched_objects_cache['items']), 2)
+
+    @mock.patch('api.email_utils.send_contact_message_notification', return_value=False)
+    def test_failures_back_off_then_dead_letter(self, send):
+        message = ContactMessage.objects.create(name='Asha', email='asha@example.com', subject='Hi', message='Hello')
+        job = tasks.enqueue('email.contact_notification', contact_message_id=message.pk)
+
+        self._run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.QUEUED, 1))
+        self.assertIn('was not sent', job.last_error)
+        delay = (job.run_at - timezone.now()).total_seconds()
+        self.assertTrue(5 < delay <= 12.5, delay)
+
+        # Not due yet: a second pass does nothing
+        self._run_worker()
+        self.assertEqual(send.call_count, 1)
+
+        self._make_due()
+        self._run_worker()
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+        self.assertTrue((job.run_at - timezone.now()).total_seconds() > 12)  # doubled
+
+        self._make_due()
+        self._run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, send.call_count), (Task.DEAD, 3, 3))
+
+    def test_claimed_task_is_not_claimed_twice(self):
+        message = ContactMessage.objects.create(name='Asha', email='asha@example.com', subject='Hi', message='Hello')
+        tasks.enqueue('email.contact_notification', contact_message_id=message.pk)
+        self.assertEqual(len(tasks.claim(10, 'worker-a')), 1)
+        self.assertEqual(tasks.claim(10, 'worker-b'), [])
+
+    @mock.patch('api.email_utils.send_contact_message_notification')
+    def test_worker_claims_each_task_when_it_starts(self, send):
+        for _ in range(3):
+            message = ContactMessage.objects.create(
+                name='Asha', email='asha@example.com', subject='Hi', message='Hello',
+            )
+            tasks.enqueue('email.contact_notification', contact_message_id=message.pk)
+        self._make_due()
+
+        def sent(message):
+            # The tasks behind the running one are still QUEUED, not locked by this worker
+            self.assertEqual(Task.objects.filter(status=Task.RUNNING).count(), 1)
+            return True
+        send.side_effect = sent
+        self.assertEqual(tasks.run_pending(limit=10, worker='worker-a'), {Task.DONE: 3})
+        self.assertEqual(send.call_count, 3)
+
+    def test_stale_running_task_is_requeued(self):
+        message = ContactMessage.objects.create(name='Asha', email='asha@example.com', subject='Hi', message='Hello')
+        job = tasks.enqueue('email.contact_notification', contact_message_id=message.pk)
+        tasks.claim(10, 'crashed-worker')
+        Task.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(tasks.requeue_stale(), 1)
+        self.assertEqual(Task.objects.get(pk=job.pk).status, Task.QUEUED)
+
+    @mock.patch('api.email_utils.send_contact_message_notification', return_value=True)
+    def test_outcome_not_recorded_after_task_was_reclaimed(self, send):
+        message = ContactMessage.objects.create(name='Asha', email='asha@example.com', subject='Hi', message='Hello')
+        job = tasks.enqueue('email.contact_notification', contact_message_id=message.pk)
+        slow = tasks.claim(1, 'slow-worker')[0]
+        # The slow worker overran the lock timeout; another worker now holds the task
+        Task.objects.filter(pk=job.pk).update(locked_by='fast-worker')
+
+        with self.assertLogs('api.tasks', 'WARNING'):
+            self.assertEqual(tasks.execute(slow), tasks.LOST)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Task.RUNNING, 'fast-worker'))
+
+    def test_unknown_task_name_rejected(self):
+        with self.assertRaises(KeyError):
+            tasks.enqueue('email.nope')
+
+
+@override_settings(RAZORPAY_KEY_ID='rzp_test_key', RAZORPAY_KEY_SECRET='secret', RAZORPAY_WEBHOOK_SECRET='whsec')
+class RazorpayWebhookTest(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        response = self.client.post('/api/orders/create/', self._payload(self.products[:2], quantity=2), format='json')
+        self.order = Order.objects.get(order_id=response.data['order_id'])
+
+    def _deliver(self, event, event_id, created_at=1700000000, razorpay_order_id=None, **payment):
+        body = json.dumps({
+            'event': event,
+            'created_at': created_at,
+            'payload': {'payment': {'entity': {
+                'id': 'pay_1', 'order_id': razorpay_order_id or self.order.razorpay_order_id, 'amount': 40600,
+                **payment,
+            }}},
+        }).encode()
+        signature = hmac.new(b'whsec', body, hashlib.sha256).hexdigest()
+        return self.client.generic(
+            'POST', '/api/payments/webhook/', body, content_type='application/json',
+            HTTP_X_RAZORPAY_SIGNATURE=signature, HTTP_X_RAZORPAY_EVENT_ID=event_id,
+        )
+
+    def _run_worker(self):
+        call_command('run_worker', once=True, stdout=StringIO())
+        self.order.refresh_from_db()
+
+    def test_event_is_acknowledged_then_applied_by_worker(self):
+        self.assertEqual(self._deliver('payment.captured', 'evt_1').status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'PENDING')
+
+        self._run_worker()
+        self.assertEqual((self.order.status, self.order.payment_status), ('PAID', 'CAPTURED'))
+        self.assertEqual(self.order.payment.status, 'CAPTURED')
+        self.assertFalse(StockReservation.objects.filter(order=self.order, status=StockReservation.ACTIVE).exists())
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.PROCESSED)
+
+    def test_duplicate_delivery_is_a_no_op(self):
+        self._deliver('payment.captured', 'evt_1')
+        self._run_worker()
+        tasks_before = Task.objects.count()
+
+        self.assertEqual(self._deliver('payment.captured', 'evt_1').status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(Task.objects.count(), tasks_before)
+
+    def test_events_applied_in_event_time_order(self):
+        # Razorpay delivered the earlier failed attempt after the successful retry
+        self._deliver('payment.captured', 'evt_2', created_at=1700000200)
+        self._deliver('payment.failed', 'evt_1', created_at=1700000100, error_code='BAD_REQUEST_ERROR')
+        self._run_worker()
+        self.assertEqual(self.order.status, 'PAID')
+        self.assertEqual(
+            list(WebhookEvent.objects.order_by('event_created_at').values_list('event', 'status')),
+            [('payment.failed', WebhookEvent.PROCESSED), ('payment.captured', WebhookEvent.PROCESSED)],
+        )
+
+    def test_capture_queues_confirmation_email(self):
+        self._deliver('payment.captured', 'evt_1')
+        self._run_worker()
+        self.assertEqual(Task.objects.filter(name='email.order_confirmation').count(), 1)
+
+    def test_capture_after_failure_claims_stock_again(self):
+        self._deliver('payment.failed', 'evt_1', created_at=1700000100)
+        self._run_worker()
+        self.assertEqual(self.order.status, 'FAILED')
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock_quantity, 5)
+
+        self._deliver('payment.captured', 'evt_2', created_at=1700000200)
+        self._run_worker()
+        self.assertEqual(self.order.status, 'PAID')
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock_quantity, 3)
+        self.assertEqual(
+            StockReservation.objects.filter(order=self.order, status=StockReservation.COMMITTED).count(), 2
+        )
+        self.assertEqual(Task.objects.filter(name='email.order_confirmation').count(), 1)
+
+    def test_capture_after_failure_is_refused_when_stock_is_gone(self):
+        self._deliver('payment.failed', 'evt_1', created_at=1700000100)
+        self._run_worker()
+        Product.objects.filter(pk=self.products[0].pk).update(stock_quantity=1)
+
+        self._deliver('payment.captured', 'evt_2', created_at=1700000200)
+        self._run_worker()
+        self.assertEqual((self.order.status, self.order.payment_status), ('FAILED', 'CAPTURED'))
+        self.assertEqual(Product.objects.get(pk=self.products[1].pk).stock_quantity, 5)
+        self.assertFalse(Task.objects.filter(name='email.order_confirmation').exists())
+
+    def test_late_failure_does_not_undo_capture(self):
+        self._deliver('payment.captured', 'evt_1', created_at=1700000100)
+        self._run_worker()
+        self._deliver('payment.failed', 'evt_2', created_at=1700000200)
+        self._run_worker()
+        self.assertEqual(self.order.status, 'PAID')
+
+    def test_refunds(self):
+        self._deliver('order.paid', 'evt_1')
+        self._deliver('refund.created', 'evt_2', created_at=1700000100)
+        self._run_worker()
+        self.assertEqual(self.order.payment_status, 'REFUND_PENDING')
+
+        self._deliver('refund.processed', 'evt_3', created_at=1700000200, amount_refunded=10000)
+        self._run_worker()
+        self.assertEqual(self.order.payment_status, 'PARTIALLY_REFUNDED')
+
+        self._deliver('refund.processed', 'evt_4', created_at=1700000300, amount_refunded=40600)
+        self._run_worker()
+        self.assertEqual(self.order.payment_status, 'REFUNDED')
+        self.assertEqual(self.order.payment.status, 'REFUNDED')
+
+    def test_rejects_bad_signature_and_body(self):
+        response = self.client.generic(
+            'POST', '/api/payments/webhook/', b'{}', content_type='application/json',
+            HTTP_X_RAZORPAY_SIGNATURE='forged',
+        )
+        self.assertEqual(response.status_code, 400)
+        body = b'not json'
+        response = self.client.generic(
+            'POST', '/api/payments/webhook/', body, content_type='application/json',
+            HTTP_X_RAZORPAY_SIGNATURE=hmac.new(b'whsec', body, hashlib.sha256).hexdigest(),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_replay_window(self):
+        self._deliver('payment.captured', 'evt_1', razorpay_order_id='order_unknown')
+        self._run_worker()
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.IGNORED)
+
+        Order.objects.filter(pk=self.order.pk).update(razorpay_order_id='order_unknown')
+        out = StringIO()
+        call_command('replay_webhooks', hours=1, dry_run=True, stdout=out)
+        self.assertIn('Would replay 1 event(s)', out.getvalue())
+        call_command('replay_webhooks', hours=1, stdout=out)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'PAID')
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.PROCESSED)
+
+
+class _RecordingSMTPHandler:
+    def __init__(self):
+        self.messages = []
+        self.sessions = []
+        self.reply_delay = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        if not any(s is session for s in self.sessions):
+            self.sessions.append(session)
+        await asyncio.sleep(self.reply_delay)
+        return '250 OK'
+
+
+@skipIf(SMTPController is None, 'aiosmtpd is not installed')
+class SMTPTransportTest(TestCase):
+    """Pooled SMTP transport against a local aiosmtpd server."""
+
+    def setUp(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.handler = _RecordingSMTPHandler()
+        controller = SMTPController(self.handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        self.addCleanup(controller.stop)
+        overrides = override_settings(
+            EMAIL_BACKEND='api.email_backend.HostingerEmailBackend', EMAIL_HOST='127.0.0.1', EMAIL_PORT=port,
+            EMAIL_USE_TLS=False, EMAIL_USE_SSL=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+            RESEND_API_KEY='', EMAIL_SMTP_IDLE_TIMEOUT=60,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        email_utils.close_email_connections()
+        self.addCleanup(email_utils.close_email_connections)
+
+    def _messages(self, n):
+        return [(f'customer{i}@example.com', f'Order {i}', 'Thanks!') for i in range(n)]
+
+    def test_bulk_send_uses_one_connection_and_is_faster(self):
+        messages = self._messages(100)
+
+        started = time.perf_counter()
+        for to, subject, text in messages:
+            # Previous behaviour: a new connection (connect, EHLO, QUIT) per message
+            connection = email_utils.get_connection(fail_silently=False)
+            email_utils.EmailMessage(subject, text, 'shop@example.com', [to], connection=connection).send()
+        unpooled_rate = len(messages) / (time.perf_counter() - started)
+        self.assertEqual(len(self.handler.sessions), 100)
+
+        self.handler.sessions.clear()
+        started = time.perf_counter()
+        self.assertEqual(email_utils.send_bulk_emails(messages), 100)
+        pooled_rate = len(messages) / (time.perf_counter() - started)
+
+        self.assertEqual(len(self.handler.messages), 200)
+        self.assertEqual(len(self.handler.sessions), 1)
+        self.assertGreater(pooled_rate, unpooled_rate)
+
+    def test_single_sends_reuse_the_connection(self):
+        connects = email_utils._smtp.connects
+        for to, subject, text in self._messages(3):
+            email_utils._send_email(to, subject, text)
+        self.assertEqual(len(self.handler.sessions), 1)
+        self.assertEqual(email_utils._smtp.connects - connects, 1)
+
+    def test_reconnects_after_server_hangs_up(self):
+        email_utils._send_email('a@example.com', 'One', 'Body')
+        email_utils._smtp._backend.connection.sock.shutdown(socket.SHUT_RDWR)  # connection dropped under us
+        email_utils._send_email('b@example.com', 'Two', 'Body')
+        self.assertEqual([m.rcpt_tos for m in self.handler.messages], [['a@example.com'], ['b@example.com']])
+        self.assertEqual(len(self.handler.sessions), 2)
+
+    @override_settings(EMAIL_TIMEOUT=0.2)
+    def test_timeout_after_data_is_not_resent(self):
+        self.handler.reply_delay = 0.5  # the server has the message but answers too late
+        message = email_utils.EmailMessage('Slow', 'Body', 'shop@example.com', ['a@example.com'])
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            email_utils._smtp.send(message)
+        time.sleep(0.6)
+        self.assertEqual(len(self.handler.messages), 1)
+
+    @override_settings(EMAIL_SMTP_IDLE_TIMEOUT=0)
+    def test_idle_connection_is_replaced(self):
+        email_utils._send_email('a@example.com', 'One', 'Body')
+        time.sleep(0.01)
+        email_utils._send_email('b@example.com', 'Two', 'Body')
+        self.assertEqual(len(self.handler.sessions), 2)
+
+
+@override_settings(RESEND_API_KEY='re_test')
+class ResendTransportTest(TestCase):
+    def setUp(self):
+        email_utils.close_email_connections()
+        self.addCleanup(email_utils.close_email_connections)
+        response = mock.Mock(ok=True, status_code=200, text='{}')
+        response.json.return_value = {'id': 'email_1'}
+        patcher = mock.patch('requests.Session.post', return_value=response)
+        self.post = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_session_is_reused(self):
+        email_utils._send_email('a@example.com', 'One', 'Body')
+        session = email_utils._resend._session
+        email_utils._send_email('b@example.com', 'Two', 'Body')
+        self.assertIs(email_utils._resend._session, session)
+        self.assertEqual(session.headers['Authorization'], 'Bearer re_test')
+        self.assertEqual(self.post.call_args.args[0], 'https://api.resend.com/emails')
+
+    def test_bulk_send_uses_batch_endpoint(self):
+        messages = [(f'c{i}@example.com', 'Hi', 'Body') for i in range(250)]
+        self.assertEqual(email_utils.send_bulk_emails(messages), 250)
+        self.assertEqual(self.post.call_count, 3)
+        self.assertEqual(self.post.call_args.args[0], 'https://api.resend.com/emails/batch')
+        self.assertEqual([len(call.kwargs['json']) for call in self.post.call_args_list], [100, 100, 50])
+
+
+@override_settings(RAZORPAY_KEY_ID='rzp_test_key', RAZORPAY_KEY_SECRET='secret')
+class VerifyPaymentTest(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        response = self.client.post('/api/orders/create/', self._payload(self.products[:2]), format='json')
+        self.order = Order.objects.get(order_id=response.data['order_id'])
+
+    def _verify(self, valid=True):
+        with mock.patch('api.views.RazorpayService.verify_signature', return_value=valid):
+            return self.client.post('/api/orders/verify-payment/', {
+                'razorpay_order_id': self.order.razorpay_order_id,
+                'razorpay_payment_id': 'pay_1', 'razorpay_signature': 'sig',
+            }, format='json')
+
+    def test_paid_transition_updates_order_and_payment(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._verify()
+        self.assertEqual(response.json(), {'success': True, 'order_id': self.order.order_id, 'status': 'PAID'})
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_status, self.order.razorpay_payment_id), ('PAID', 'CAPTURED', 'pay_1'))
+        self.assertEqual((self.order.payment.status, self.order.payment.razorpay_payment_id), ('CAPTURED', 'pay_1'))
+        self.assertEqual(Task.objects.filter(name='email.order_confirmation').count(), 1)
+
+        writes = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "api_order"')]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"status" IN', writes[0])
+        self.assertNotIn('"customer_name"', writes[0])  # no full-row save
+
+    def test_losing_the_race_to_the_webhook_is_a_success_without_side_effects(self):
+        Order.objects.filter(pk=self.order.pk).update(status='PAID', payment_status='CAPTURED')
+        response = self._verify()
+        self.assertEqual((response.status_code, response.json()['status']), (200, 'PAID'))
+        self.assertFalse(Task.objects.filter(name='email.order_confirmation').exists())
+
+    def test_confirmation_email_is_queued_once_whoever_wins(self):
+        # The webhook worker settles the order first
+        self.assertTrue(OrderStateService.transition(self.order.pk, 'PAID', payment_status='CAPTURED'))
+        self.assertEqual(self._verify().json()['status'], 'PAID')
+        self.assertEqual(Task.objects.filter(name='email.order_confirmation').count(), 1)
+
+    def test_cancelled_order_is_not_paid(self):
+        Order.objects.filter(pk=self.order.pk).update(status='CANCELLED')
+        response = self._verify()
+        self.assertEqual(response.status_code, 409)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'CANCELLED')
+
+    def test_invalid_signature_fails_only_pending_orders(self):
+        self.assertEqual(self._verify(valid=False).status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'FAILED')
+        self.assertFalse(StockReservation.objects.filter(order=self.order, status=StockReservation.ACTIVE).exists())
+
+        Order.objects.filter(pk=self.order.pk).update(status='PAID')
+        self._verify(valid=False)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'PAID')
+
+
+class OrderStateTest(CheckoutTestMixin, TestCase):
+    def _orders(self, count, status='PAID'):
+        Order.objects.bulk_create([
+            Order(
+                order_id=f'ORDSHIP{i:04d}', status=status, customer_name='Buyer',
+                customer_email='buyer@example.com', customer_phone='9876543210',
+                shipping_address='1 Street', shipping_city='Pune', shipping_state='MH',
+                shipping_pincode='411001', total_amount=100,
+            )
+            for i in range(count)
+        ])
+        return list(Order.objects.filter(order_id__startswith='ORDSHIP').order_by('order_id'))
+
+    def test_illegal_transitions_are_refused(self):
+        order = self._orders(1, status='DELIVERED')[0]
+        self.assertFalse(OrderStateService.transition(order.pk, 'PAID'))
+        self.assertFalse(OrderStateService.transition(order.pk, 'CANCELLED'))
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'DELIVERED')
+        with self.assertRaises(IllegalTransition):
+            OrderStateService.transition(order.pk, 'CONFIRMED')
+
+    def test_late_failure_callback_does_not_regress_a_paid_order(self):
+        response = self.client.post('/api/orders/create/', self._payload(self.products[:1]), format='json')
+        order = Order.objects.get(order_id=response.data['order_id'])
+        self.assertTrue(OrderStateService.transition(order.pk, 'PAID', payment_status='CAPTURED'))
+
+        response = self.client.post('/api/orders/payment-failed/', {'order_id': order.order_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.payment_status), ('PAID', 'CAPTURED'))
+        self.assertTrue(StockReservation.objects.filter(order=order, status=StockReservation.COMMITTED).exists())
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock_quantity, 4)
+
+    def _failed_order_with_coupon(self):
+        """Last unit of a product bought with a single-use coupon, then the payment failed."""
+        product = self.products[0]
+        Product.objects.filter(pk=product.pk).update(stock_quantity=1)
+        coupon = Coupon.objects.create(code='ONE', discount_type='FLAT', discount_value=10, max_uses=1)
+        response = self.client.post(
+            '/api/orders/create/', {**self._payload([product]), 'coupon_code': 'ONE'}, format='json'
+        )
+        order = Order.objects.get(order_id=response.data['order_id'])
+        self.assertTrue(order.coupon_redeemed)
+        self.client.post('/api/orders/payment-failed/', {'order_id': order.order_id}, format='json')
+        self.assertEqual(Product.objects.get(pk=product.pk).stock_quantity, 1)
+        self.assertEqual(Coupon.objects.get(pk=coupon.pk).times_used, 0)
+        return order, product, coupon
+
+    def test_failed_order_paid_by_retry_claims_stock_and_coupon_again(self):
+        order, product, coupon = self._failed_order_with_coupon()
+        self.assertTrue(OrderStateService.transition(order.pk, 'PAID', payment_status='CAPTURED'))
+
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.coupon_redeemed), ('PAID', True))
+        self.assertEqual(Product.objects.get(pk=product.pk).stock_quantity, 0)
+        self.assertEqual(Coupon.objects.get(pk=coupon.pk).times_used, 1)
+        self.assertEqual(
+            list(StockReservation.objects.filter(order=order).order_by('pk').values_list('status', flat=True)),
+            [StockReservation.RELEASED, StockReservation.COMMITTED],
+        )
+
+    def test_failed_order_is_not_revived_when_stock_is_gone(self):
+        order, product, coupon = self._failed_order_with_coupon()
+        Product.objects.filter(pk=product.pk).update(stock_quantity=0)  # sold to someone else
+        self.assertFalse(OrderStateService.transition(order.pk, 'PAID', payment_status='CAPTURED'))
+
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.payment_status), ('FAILED', 'CAPTURED'))  # to refund
+        self.assertEqual(Coupon.objects.get(pk=coupon.pk).times_used, 0)
+
+    def test_failed_order_is_not_revived_when_coupon_is_used_up(self):
+        order, product, coupon = self._failed_order_with_coupon()
+        self.assertTrue(CouponService.redeem(coupon))  # another customer took the only use
+        self.assertFalse(OrderStateService.transition(order.pk, 'PAID', payment_status='CAPTURED'))
+
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'FAILED')
+        self.assertEqual(Product.objects.get(pk=product.pk).stock_quantity, 1)  # reservation rolled back
+        self.assertEqual(Coupon.objects.get(pk=coupon.pk).times_used, 1)
+
+    def test_cancel_releases_holds_once(self):
+        response = self.client.post('/api/orders/create/', self._payload(self.products[:2]), format='json')
+        order = Order.objects.get(order_id=response.data['order_id'])
+        self.assertEqual(OrderStateService.bulk_transition(Order.objects.filter(pk=order.pk), 'CANCELLED'), [order.pk])
+        self.assertEqual(OrderStateService.bulk_transition(Order.objects.filter(pk=order.pk), 'CANCELLED'), [])
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock_quantity, 5)
+
+    def test_cancelling_a_paid_order_restocks_and_releases_coupon(self):
+        coupon = Coupon.objects.create(code='PAIDCANCEL', discount_type='FLAT', discount_value=10, max_uses=1)
+        response = self.client.post(
+            '/api/orders/create/', {**self._payload(self.products[:2]), 'coupon_code': 'PAIDCANCEL'}, format='json'
+        )
+        order = Order.objects.get(order_id=response.data['order_id'])
+        self.assertTrue(OrderStateService.transition(order.pk, 'PAID', payment_status='CAPTURED'))
+        self.assertTrue(OrderStateService.transition(order.pk, 'PROCESSING'))
+        self.assertEqual(Coupon.objects.get(pk=coupon.pk).times_used, 1)
+
+        self.assertEqual(OrderStateService.bulk_transition(Order.objects.filter(pk=order.pk), 'CANCELLED'), [order.pk])
+        self.assertEqual(OrderStateService.bulk_transition(Order.objects.filter(pk=order.pk), 'CANCELLED'), [])
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock_quantity, 5)
+        self.assertEqual(Product.objects.get(pk=self.products[1].pk).stock_quantity, 5)
+        self.assertEqual(Coupon.objects.get(pk=coupon.pk).times_used, 0)
+        self.assertFalse(StockReservation.objects.filter(order=order).exclude(status=StockReservation.RELEASED).exists())
+
+    def test_bulk_ship_is_set_based(self):
+        orders = self._orders(600)
+        Order.objects.filter(pk=orders[0].pk).update(status='PENDING')
+        tracking = {order.order_id: f'TRK{i}' for i, order in enumerate(orders)}
+        tracking['ORDMISSING'] = 'TRKX'
+
+        with CaptureQueriesContext(connection) as queries:
+            result = OrderStateService.bulk_ship(tracking)
+        self.assertLessEqual(len(queries), 8)  # two chunks of 500: lock + update each
+        self.assertEqual(len(result['shipped']), 599)
+        self.assertEqual(set(result['skipped']), {orders[0].order_id, 'ORDMISSING'})
+        self.assertEqual(Order.objects.filter(status='SHIPPED').count(), 599)
+        self.assertEqual(Order.objects.get(pk=orders[42].pk).tracking_number, 'TRK42')
+
+    def test_ship_orders_command(self):
+        orders = self._orders(3)
+        Order.objects.filter(pk=orders[2].pk).update(status='CANCELLED')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write('order_id,tracking_number\n')
+            handle.writelines(f'{order.order_id},TRK{i}\n' for i, order in enumerate(orders))
+        self.addCleanup(lambda: os.remove(handle.name))
+
+        out = StringIO()
+        call_command('ship_orders', handle.name, dry_run=True, stdout=out)
+        self.assertIn('Would ship 2 of 3', out.getvalue())
+        self.assertFalse(Order.objects.filter(status='SHIPPED').exists())
+
+        out = StringIO()
+        call_command('ship_orders', handle.name, stdout=out)
+        self.assertIn('Shipped 2 of 3', out.getvalue())
+        self.assertIn('cannot ship a CANCELLED order', out.getvalue())
+
+    def test_admin_actions_follow_the_state_machine(self):
+        orders = self._orders(2)
+        Order.objects.filter(pk=orders[1].pk).update(status='PENDING')
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        self.client.force_login(admin_user)
+        response = self.client.post('/admin/api/order/', {
+            'action': 'mark_processing', '_selected_action': [order.pk for order in orders],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            dict(Order.objects.values_list('pk', 'status')),
+            {orders[0].pk: 'PROCESSING', orders[1].pk: 'PENDING'},
+        )
+
+
+@override_settings(RECONCILE_PENDING_AFTER_MINUTES=15, STOCK_RESERVATION_TTL_MINUTES=30)
+class ReconciliationTest(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.gateway = {}  # razorpay_order_id -> payment attempts
+        patcher = mock.patch(
+            'api.services.reconciliation_service.RazorpayService.fetch_order_payments',
+            side_effect=self._fetch,
+        )
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fetch(self, razorpay_order_id):
+        time.sleep(0.02)  # gateway round trip
+        result = self.gateway.get(razorpay_order_id, [])
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _order(self, product, minutes_old, payments=()):
+        response = self.client.post('/api/orders/create/', self._payload([product]), format='json')
+        order = Order.objects.get(order_id=response.data['order_id'])
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(minutes=minutes_old))
+        self.gateway[order.razorpay_order_id] = list(payments)
+        return order
+
+    def test_pending_orders_are_settled_from_gateway_state(self):
+        paid = self._order(self.products[0], 20, [
+            {'id': 'pay_1', 'status': 'failed'}, {'id': 'pay_2', 'status': 'captured'},
+        ])
+        failed = self._order(self.products[1], 20, [
+            {'id': 'pay_3', 'status': 'failed', 'error_description': 'Card declined'},
+        ])
+        abandoned = self._order(self.products[2], 45)
+        in_flight = self._order(self.products[3], 20, [{'id': 'pay_4', 'status': 'authorized'}])
+        no_attempt_yet = self._order(self.products[4], 20)
+        recent = self._order(self.products[5], 5, [{'id': 'pay_5', 'status': 'captured'}])
+
+        stats = ReconciliationService.sweep()
+        self.assertEqual(
+            {key: stats[key] for key in ('scanned', 'paid', 'failed', 'expired', 'waiting', 'errors')},
+            {'scanned': 5, 'paid': 1, 'failed': 1, 'expired': 1, 'waiting': 2, 'errors': 0},
+        )
+
+        statuses = dict(Order.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[paid.pk], 'PAID')
+        self.assertEqual(statuses[failed.pk], 'FAILED')
+        self.assertEqual(statuses[abandoned.pk], 'CANCELLED')
+        for order in (in_flight, no_attempt_yet, recent):
+            self.assertEqual(statuses[order.pk], 'PENDING')
+
+        paid.refresh_from_db()
+        self.assertEqual((paid.razorpay_payment_id, paid.payment.status), ('pay_2', 'CAPTURED'))
+        failed.refresh_from_db()
+        self.assertEqual((failed.payment.status, failed.payment.error_description), ('FAILED', 'Card declined'))
+        self.assertEqual(Order.objects.get(pk=abandoned.pk).payment_status, 'EXPIRED')
+        self.assertEqual(Task.objects.filter(name='email.order_confirmation').count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock_quantity, 4)  # committed
+        self.assertEqual(Product.objects.get(pk=self.products[1].pk).stock_quantity, 5)  # released
+
+    def test_order_settled_meanwhile_is_left_alone(self):
+        order = self._order(self.products[0], 20, [{'id': 'pay_1', 'status': 'failed'}])
+        classify = reconciliation_service._classify
+
+        def verified_meanwhile(*args):
+            Order.objects.filter(pk=order.pk).update(status='PAID')  # the verify endpoint wins the race
+            return classify(*args)
+
+        with mock.patch('api.services.reconciliation_service._classify', side_effect=verified_meanwhile):
+            stats = ReconciliationService.sweep()
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'PAID')
+
+    def test_lookups_run_in_parallel_across_keyset_batches(self):
+        Order.objects.bulk_create([
+            Order(
+                order_id=f'ORDRECON{i:03d}', razorpay_order_id=f'order_{i}', customer_name='Buyer',
+                customer_email='buyer@example.com', customer_phone='9876543210', shipping_address='1 Street',
+                shipping_city='Pune', shipping_state='MH', shipping_pincode='411001', total_amount=100,
+            )
+            for i in range(40)
+        ])
+        Order.objects.update(created_at=timezone.now() - timedelta(minutes=20))
+        for i in range(40):
+            self.gateway[f'order_{i}'] = [{'id': f'pay_{i}', 'status': 'created'}]
+
+        stats = ReconciliationService.sweep(batch_size=15, concurrency=8)
+        self.assertEqual((stats['scanned'], stats['waiting']), (40, 40))
+        self.assertEqual(self.fetch.call_count, 40)
+        self.assertLess(stats['elapsed'], 40 * 0.02 / 2)  # serial lookups would take 0.8s
+
+        stats = ReconciliationService.sweep(batch_size=15, limit=20)
+        self.assertEqual(stats['scanned'], 20)
+
+    def test_open_circuit_stops_the_sweep(self):
+        order = self._order(self.products[0], 45, [{'id': 'pay_1', 'status': 'captured'}])
+        self.gateway[order.razorpay_order_id] = GatewayUnavailable('open')
+        out = StringIO()
+        call_command('reconcile_pending_orders', stdout=out)
+        self.assertIn('Stopped early', out.getvalue())
+        self.assertIn('1 lookup error(s)', out.getvalue())
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'PENDING')
+
+    def test_dry_run_changes_nothing(self):
+        order = self._order(self.products[0], 20, [{'id': 'pay_1', 'status': 'captured'}])
+        out = StringIO()
+        call_command('reconcile_pending_orders', dry_run=True, stdout=out)
+        self.assertIn('Would settle: 1 paid', out.getvalue())
+        self.assertIn('orders/s', out.getvalue())
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'PENDING')
+
+
+class BestSellerTest(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = Category.objects.create(name="Other Category")
+        self.other_product = Product.objects.create(
+            name="Other Product", description="Test", price=50, category=self.other, stock_quantity=5
+        )
+
+    def _sale(self, product, quantity, days_ago=0, status='PAID'):
+        order = Order.objects.create(
+            status=status, customer_name='Buyer', customer_email='buyer@example.com',
+            customer_phone='9876543210', shipping_address='1 Street', shipping_city='Pune',
+            shipping_state='MH', shipping_pincode='411001', total_amount=product.price * quantity,
+        )
+        OrderItem.objects.create(
+            order=order, product=product, product_name=product.name, product_price=product.price,
+            quantity=quantity, subtotal=product.price * quantity,
+        )
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def _names(self, query=''):
+        response = self.client.get(f'/api/products/best_sellers/{query}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [product['name'] for product in response.data]
+
+    def test_rolling_windows_and_category(self):
+        p0, p1, p2, p3 = self.products[:4]
+        self._sale(p0, 5, days_ago=2)
+        self._sale(p1, 3)
+        self._sale(p1, 10, days_ago=20)
+        self._sale(p2, 50, days_ago=60)
+        self._sale(p3, 100, status='PENDING')
+        self._sale(p3, 100, days_ago=120)  # outside every window
+        self._sale(self.other_product, 1)
+        BestSellerService.refresh()
+
+        self.assertEqual(self._names('?window=7'), [p0.name, p1.name, self.other_product.name])
+        self.assertEqual(self._names(), [p1.name, p0.name, self.other_product.name])
+        self.assertEqual(self._names('?window=90'), [p2.name, p1.name, p0.name, self.other_product.name])
+        self.assertEqual(self._names(f'?window=90&category={self.other.slug}'), [self.other_product.name])
+        self.assertEqual(
+            list(BestSeller.objects.filter(window=30).values_list('rank', 'quantity')), [(1, 13), (2, 5), (3, 1)]
+        )
+        self.assertEqual(self.client.get('/api/products/best_sellers/?window=14').status_code, 400)
+
+    def test_request_reads_only_the_ranking(self):
+        self._sale(self.products[0], 2)
+        BestSellerService.refresh()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._names('?window=7'), [self.products[0].name])
+        self.assertFalse(any('api_orderitem' in q['sql'] for q in queries.captured_queries))
+
+    def test_incremental_refresh_follows_order_changes(self):
+        self._sale(self.products[0], 2, days_ago=40)
+        self.assertEqual(BestSellerService.refresh()['days'], 90)
+
+        order = self._sale(self.products[1], 4)
+        result = BestSellerService.refresh()
+        self.assertLess(result['days'], 90)  # only the sale days of recently changed orders
+        self.assertTrue(result['changed'])
+        self.assertEqual(self._names('?window=7'), [self.products[1].name])
+
+        self.assertFalse(BestSellerService.refresh()['changed'])
+        OrderStateService.transition(order.pk, 'CANCELLED')
+        self.assertTrue(BestSellerService.refresh()['changed'])
+        self.assertFalse(BestSeller.objects.filter(window=7).exists())
+
+    def test_featured_fallback_before_any_sales(self):
+        Product.objects.filter(pk=self.products[0].pk).update(is_featured=True)
+        self.assertEqual(self._names(), [self.products[0].name])
+        out = StringIO()
+        call_command('refresh_best_sellers', stdout=out)
+        self.assertIn('0 ranking row(s)', out.getvalue())
+
+
+class _StubRazorpayHandler(BaseHTTPRequestHandler):
+    """Minimal Razorpay orders API; behaviour is driven by ``server.script``."""
+    protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is observable
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, body):
+        raw = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        self.server.requests.append((self.command, self.path, self.client_address))
+        mode = self.server.script.pop(0) if self.server.script else 'ok'
+        if mode == 'slow':
+            time.sleep(0.5)
+        if mode == 'error':
+            return self._reply(500, {'error': {'code': 'SERVER_ERROR', 'description': 'boom'}})
+        if mode == 'unavailable':
+            return self._reply(503, {'error': {'code': 'SERVER_ERROR', 'description': 'busy'}})
+        if self.path.endswith('/payments'):
+            return self._reply(200, {'entity': 'collection', 'items': self.server.payments})
+        self._reply(200, {'id': f"order_{payload.get('receipt', 'stub')}", 'amount': payload.get('amount', 0), 'currency': 'INR'})
+
+    do_GET = do_POST = _handle
+
+
+class RazorpayClientTest(CheckoutTestMixin, TestCase):
+    mock_razorpay = False  # talk to the stub server instead
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubRazorpayHandler)
+        cls.server.daemon_threads = True
+        cls.server.handle_error = lambda request, client_address: None  # client hung up on a slow reply
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.server.requests = []
+        self.server.script = []
+        self.server.payments = []
+        overrides = override_settings(
+            RAZORPAY_KEY_ID='rzp_test_key', RAZORPAY_KEY_SECRET='secret',
+            RAZORPAY_BASE_URL=f'http://127.0.0.1:{self.server.server_port}',
+            RAZORPAY_READ_TIMEOUT=0.2, RAZORPAY_BREAKER_THRESHOLD=2, RAZORPAY_BREAKER_RESET_SECONDS=30,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        RazorpayService.reset()
+        self.addCleanup(RazorpayService.reset)
+
+    def test_client_is_reused_across_calls(self):
+        for receipt in ('ORD1', 'ORD2', 'ORD3'):
+            self.assertEqual(RazorpayService.create_order(10, receipt)['id'], f'order_{receipt}')
+        self.assertIs(_get_client(), _get_client())
+        # One keep-alive connection served every call
+        self.assertEqual(len({address for _, _, address in self.server.requests}), 1)
+        self.assertEqual(RazorpayService.stats()['operations']['order.create']['success'], 3)
+
+    def test_fetch_order_payments(self):
+        self.server.payments = [
+            {'id': 'pay_2', 'status': 'captured', 'created_at': 20},
+            {'id': 'pay_1', 'status': 'failed', 'created_at': 10},
+        ]
+        payments = RazorpayService.fetch_order_payments('order_ORD1')
+        self.assertEqual([p['id'] for p in payments], ['pay_1', 'pay_2'])
+        self.assertEqual(self.server.requests[-1][:2], ('GET', '/v1/orders/order_ORD1/payments'))
+
+        self.server.script = ['error'] * 3  # GET: retried, then given up
+        with self.assertRaises(RuntimeError):
+            RazorpayService.fetch_order_payments('order_ORD1')
+
+    def test_read_timeout_fails_without_retrying_post(self):
+        self.server.script = ['slow']
+        started = time.monotonic()
+        with self.assertRaises(RuntimeError):
+            RazorpayService.create_order(10, 'ORD1')
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_idempotent_get_is_retried(self):
+        self.server.script = ['unavailable']
+        self.assertEqual(_get_client().order.fetch('ORD1')['id'], 'order_stub')
+        self.assertEqual([method for method, _, _ in self.server.requests], ['GET', 'GET'])
+
+    def test_breaker_opens_and_fails_fast(self):
+        self.server.script = ['error', 'error']
+        for receipt in ('ORD1', 'ORD2'):
+            with self.assertRaises(RuntimeError):
+                RazorpayService.create_order(10, receipt)
+        with self.assertRaises(GatewayUnavailable):
+            RazorpayService.create_order(10, 'ORD3')
+
+        self.assertEqual(len(self.server.requests), 2)
+        stats = RazorpayService.stats()
+        self.assertEqual(stats['breaker']['state'], 'open')
+        self.assertEqual(stats['operations']['order.create']['failure'], 2)
+        self.assertEqual(stats['operations']['order.create']['rejected'], 1)
+
+    @override_settings(RAZORPAY_BREAKER_RESET_SECONDS=0.05)
+    def test_breaker_closes_after_successful_trial_call(self):
+        RazorpayService.reset()
+        self.server.script = ['error', 'error']
+        for receipt in ('ORD1', 'ORD2'):
+            with self.assertRaises(RuntimeError):
+                RazorpayService.create_order(10, receipt)
+        time.sleep(0.06)
+        self.assertEqual(RazorpayService.stats()['breaker']['state'], 'half_open')
+        RazorpayService.create_order(10, 'ORD3')
+        self.assertEqual(RazorpayService.stats()['breaker']['state'], 'closed')
+
+    def test_checkout_returns_503_while_breaker_is_open(self):
+        self.server.script = ['error', 'error']
+        for receipt in ('ORD1', 'ORD2'):
+            with self.assertRaises(RuntimeError):
+                RazorpayService.create_order(10, receipt)
+
+        response = self.client.post('/api/orders/create/', self._payload(self.products[:1]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(Order.objects.exists())
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 5)
+
+    def test_stats_endpoint_is_staff_only(self):
+        url = '/api/payments/gateway-stats/'
+        self.assertIn(self.client.get(url).status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+        self.client.force_authenticate(User.objects.create_user('ops', password='x', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['breaker']['state'], 'closed')
+
+
+@override_settings(
+    AWS_ACCESS_KEY_ID='AKIDEXAMPLE', AWS_SECRET_ACCESS_KEY='secret',
+    AWS_STORAGE_BUCKET_NAME='printbox-media', AWS_S3_REGION_NAME='ap-south-1',
+)
+class S3PresignTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('uploader', password='x'))
+
+    def test_client_is_cached_until_credentials_change(self):
+        first = s3_service._get_client()
+        self.assertIs(s3_service._get_client(), first)
+        with override_settings(AWS_SECRET_ACCESS_KEY='rotated'):
+            self.assertIsNot(s3_service._get_client(), first)
+
+    def test_local_presign_matches_botocore(self):
+        fixed = datetime(2026, 1, 2, 3, 4, 5)
+        with mock.patch('botocore.auth.datetime') as fake_datetime:
+            fake_datetime.datetime.utcnow.return_value = fixed
+            for method, params in (
+                ('put_object', {'ContentType': 'image/jpeg'}),
+                ('get_object', {}),
+            ):
+                expected = s3_service._get_client().generate_presigned_url(
+                    method, Params={'Bucket': 'printbox-media', 'Key': 'products/a b.jpg', **params}, ExpiresIn=300,
+                )
+                local = s3_service.presign_v4(
+                    'PUT' if method == 'put_object' else 'GET', 'products/a b.jpg', 300,
+                    content_type=params.get('ContentType'), now=fixed,
+                )
+                self.assertEqual(local, expected)
+
+    def test_presigned_upload_endpoint(self):
+        response = self.client.post('/api/s3/presigned-upload/', {
+            'folder': 'products', 'file_name': 'planter.jpg', 'content_type': 'image/jpeg', 'file_size': 1024,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['s3_key'].startswith('products/'))
+        self.assertIn('X-Amz-Signature=', response.data['upload_url'])
+        self.assertIn('X-Amz-SignedHeaders=content-type%3Bhost', response.data['upload_url'])
+
+    def test_presigned_upload_endpoint_validates_type_and_size(self):
+        bad_type = self.client.post('/api/s3/presigned-upload/', {
+            'folder': 'products', 'file_name': 'x.exe', 'content_type': 'application/x-msdownload', 'file_size': 10,
+        }, format='json')
+        too_big = self.client.post('/api/s3/presigned-upload/', {
+            'folder': 'products', 'file_name': 'x.jpg', 'content_type': 'image/jpeg', 'file_size': 50 * 1024 * 1024,
+        }, format='json')
+        self.assertEqual(bad_type.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(too_big.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_presigned_upload_endpoint(self):
+        files = [
+            {'file_name': f'view-{i}.jpg', 'content_type': 'image/jpeg', 'file_size': 2048} for i in range(3)
+        ]
+        with mock.patch('api.services.s3_service.boto3.client') as make_client:
+            response = self.client.post(
+                '/api/s3/presigned-upload/batch/', {'folder': 'products', 'files': files}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['uploads']), 3)
+        self.assertEqual(len({upload['s3_key'] for upload in response.data['uploads']}), 3)
+        make_client.assert_not_called()
+
+    def test_batch_rejects_whole_request_on_one_invalid_file(self):
+        files = [
+            {'file_name': 'ok.jpg', 'content_type': 'image/jpeg', 'file_size': 2048},
+            {'file_name': 'huge.jpg', 'content_type': 'image/jpeg', 'file_size': 50 * 1024 * 1024},
+        ]
+        response = self.client.post(
+            '/api/s3/presigned-upload/batch/', {'folder': 'products', 'files': files}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('huge.jpg', response.data['error'])
+        self.assertNotIn('uploads', response.data)
+
+    def test_benchmark_command_runs_offline(self):
+        out = StringIO()
+        call_command('benchmark_presign', iterations=20, fresh_iterations=2, stdout=out)
+        self.assertIn('local SigV4', out.getvalue())
+
+
+@override_settings(
+    AWS_ACCESS_KEY_ID='AKIDEXAMPLE', AWS_SECRET_ACCESS_KEY='secret',
+    AWS_STORAGE_BUCKET_NAME='printbox-media', AWS_S3_REGION_NAME='ap-south-1',
+    AWS_S3_MULTIPART_PART_SIZE=5 * 1024 * 1024,
+)
+class S3MultipartUploadTest(TestCase):
+    """Runs against botocore's Stubber, a local stand-in for the S3 API."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('designer', password='x')
+        self.client.force_authenticate(self.user)
+        self.stubber = Stubber(s3_service._get_client())
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+    def _token(self, user=None, s3_key='custom_orders/a.stl', upload_id='upl-1'):
+        user = user or self.user
+        return signing.dumps(
+            {'user': user.pk, 's3_key': s3_key, 'upload_id': upload_id}, salt=MULTIPART_TOKEN_SALT,
+        )
+
+    def _list_parts(self, *sizes):
+        self.stubber.add_response('list_parts', {
+            'Parts': [{'PartNumber': n, 'ETag': f'"e{n}"', 'Size': size} for n, size in enumerate(sizes, start=1)],
+            'IsTruncated': False,
+        }, {'Bucket': 'printbox-media', 'Key': 'custom_orders/a.stl', 'UploadId': 'upl-1'})
+
+    def test_create_presigns_every_part(self):
+        self.stubber.add_response(
+            'create_multipart_upload', {'UploadId': 'upl-1', 'Bucket': 'printbox-media', 'Key': 'k'},
+            {'Bucket': 'printbox-media', 'Key': ANY, 'ContentType': 'model/stl'},
+        )
+        response = self.client.post('/api/s3/multipart/create/', {
+            'file_name': 'gearbox.stl', 'content_type': 'model/stl', 'file_size': 12 * 1024 * 1024,
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['upload_id'], 'upl-1')
+        self.assertTrue(response.data['s3_key'].startswith('custom_orders/'))
+        self.assertEqual([p['part_number'] for p in response.data['parts']], [1, 2, 3])
+        query = parse_qs(urlsplit(response.data['parts'][2]['upload_url']).query)
+        self.assertEqual(query['partNumber'], ['3'])
+        self.assertEqual(query['uploadId'], ['upl-1'])
+        self.assertEqual(
+            signing.loads(response.data['upload_token'], salt=MULTIPART_TOKEN_SALT),
+            {'user': self.user.pk, 's3_key': response.data['s3_key'], 'upload_id': 'upl-1'},
+        )
+        self.stubber.assert_no_pending_responses()
+
+    def test_oversized_file_is_rejected(self):
+        response = self.client.post('/api/s3/multipart/create/', {
+            'file_name': 'huge.stl', 'content_type': 'model/stl', 'file_size': 30 * 1024 * 1024,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_local_part_url_matches_botocore(self):
+        fixed = datetime(2026, 1, 2, 3, 4, 5)
+        local = s3_service.presign_v4(
+            'PUT', 'custom_orders/a.stl', 300, now=fixed, params={'partNumber': 2, 'uploadId': 'up/+='},
+        )
+        with mock.patch('botocore.auth.datetime') as fake_datetime:
+            fake_datetime.datetime.utcnow.return_value = fixed
+            expected = s3_service._get_client().generate_presigned_url('upload_part', Params={
+                'Bucket': 'printbox-media', 'Key': 'custom_orders/a.stl', 'PartNumber': 2, 'UploadId': 'up/+=',
+            }, ExpiresIn=300)
+        self.assertEqual(parse_qs(urlsplit(local).query), parse_qs(urlsplit(expected).query))
+
+    def test_resume_reports_uploaded_parts(self):
+        self.stubber.add_response('list_parts', {
+            'Parts': [{'PartNumber': 1, 'ETag': '"etag-1"', 'Size': 5 * 1024 * 1024}], 'IsTruncated': False,
+        }, {'Bucket': 'printbox-media', 'Key': 'custom_orders/a.stl', 'UploadId': 'upl-1'})
+        response = self.client.post('/api/s3/multipart/resume/', {
+            'upload_token': self._token(), 'part_numbers': [2, 3],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['uploaded'], [{'part_number': 1, 'etag': '"etag-1"', 'size': 5 * 1024 * 1024}])
+        self.assertEqual([p['part_number'] for p in response.data['parts']], [2, 3])
+
+    def test_complete_sends_parts_in_order(self):
+        self._list_parts(5 * 1024 * 1024, 1024)
+        self.stubber.add_response('complete_multipart_upload', {'Location': 'https://example/a.stl'}, {
+            'Bucket': 'printbox-media', 'Key': 'custom_orders/a.stl', 'UploadId': 'upl-1',
+            'MultipartUpload': {'Parts': [{'PartNumber': 1, 'ETag': '"e1"'}, {'PartNumber': 2, 'ETag': '"e2"'}]},
+        })
+        response = self.client.post('/api/s3/multipart/complete/', {
+            'upload_token': self._token(),
+            'parts': [{'part_number': 2, 'etag': '"e2"'}, {'part_number': 1, 'etag': '"e1"'}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['file_url'].endswith('/custom_orders/a.stl'))
+        self.stubber.assert_no_pending_responses()
+
+    def test_complete_aborts_upload_over_the_limit(self):
+        # Declared 12 MB at creation, but the parts actually PUT add up to 30 MB
+        self._list_parts(*[5 * 1024 * 1024] * 6)
+        self.stubber.add_response('abort_multipart_upload', {}, {
+            'Bucket': 'printbox-media', 'Key': 'custom_orders/a.stl', 'UploadId': 'upl-1',
+        })
+        response = self.client.post('/api/s3/multipart/complete/', {
+            'upload_token': self._token(),
+            'parts': [{'part_number': n, 'etag': f'"e{n}"'} for n in range(1, 7)],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.stubber.assert_no_pending_responses()
+
+    def test_upload_is_bound_to_its_creator(self):
+        other = User.objects.create_user('someone-else', password='x')
+        for path, extra in (
+            ('/api/s3/multipart/resume/', {'part_numbers': [1]}),
+            ('/api/s3/multipart/complete/', {'parts': [{'part_number': 1, 'etag': '"e1"'}]}),
+            ('/api/s3/multipart/abort/', {}),
+        ):
+            response = self.client.post(path, {'upload_token': self._token(user=other), **extra}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN, path)
+            response = self.client.post(path, {
+                's3_key': 'custom_orders/a.stl', 'upload_id': 'upl-1', **extra,
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN, path)
+        self.stubber.assert_no_pending_responses()
+
+    def test_janitor_aborts_only_stale_uploads(self):
+        now = timezone.now()
+        self.stubber.add_response('list_multipart_uploads', {'Uploads': [
+            {'Key': 'custom_orders/old.stl', 'UploadId': 'old', 'Initiated': now - timedelta(days=3)},
+            {'Key': 'custom_orders/new.stl', 'UploadId': 'new', 'Initiated': now - timedelta(minutes=5)},
+        ], 'IsTruncated': False}, {'Bucket': 'printbox-media'})
+        self.stubber.add_response('abort_multipart_upload', {}, {
+            'Bucket': 'printbox-media', 'Key': 'custom_orders/old.stl', 'UploadId': 'old',
+        })
+        out = StringIO()
+        call_command('abort_stale_multipart_uploads', hours=24, stdout=out)
+        self.assertIn('Aborted 1 of 1', out.getvalue())
+        self.stubber.assert_no_pending_responses()
@@ -0,0 +1,131 @@
+"""
+Streaming design-file uploads — PrintBox3D
+Moves a custom order's design file from the request body to storage
+(S3 in production, MEDIA_ROOT locally) in fixed-size chunks.
+
+Django's multipart parser spools the whole file into memory or a temp file
+before the view runs. Here the raw request body is read CHUNK_SIZE bytes at
+a time and handed straight to ``default_storage``: S3Boto3Storage streams it
+as a multipart upload, FileSystemStorage writes it chunk by chunk. Memory
+per upload stays around one chunk (plus the S3 part buffer) whatever the
+file size, and the size limit and file signature are checked as bytes
+arrive — an oversized or mislabelled file is rejected without storing it.
+
+Usage:
+    from api.uploads import DesignFileStream, UploadRejected
+    stream = DesignFileStream(request.stream, file_name, content_length)
+    name = stream.save_to(custom_order.design_file)
+"""
+
+import io
+import os
+
+from django.core.files import File
+
+CHUNK_SIZE = 64 * 1024
+
+MAX_DESIGN_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+
+DESIGN_FILE_EXTENSIONS = ['.stl', '.obj', '.3mf', '.step', '.stp', '.jpg', '.jpeg', '.png', '.pdf']
+
+# Leading bytes each format must start with (None: no fixed signature)
+_SIGNATURES = {
+    '.3mf': (b'PK\x03\x04',),                 # ZIP container
+    '.step': (b'ISO-10303-21',),
+    '.stp': (b'ISO-10303-21',),
+    '.jpg': (b'\xff\xd8\xff',),
+    '.jpeg': (b'\xff\xd8\xff',),
+    '.png': (b'\x89PNG\r\n\x1a\n',),
+    '.pdf': (b'%PDF',),
+    '.stl': None,
+    '.obj': None,
+}
+
+
+class UploadRejected(Exception):
+    """Raised when an upload fails a size or type check; carries an HTTP status."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _check_signature(ext: str, head: bytes) -> None:
+    signatures = _SIGNATURES.get(ext)
+    if signatures and not head.startswith(signatures):
+        raise UploadRejected(f"File content does not look like a {ext} file")
+    if ext == '.stl' and not head.lstrip().startswith(b'solid') and len(head) < 84:
+        # Binary STL: 80-byte header + uint32 triangle count at minimum
+        raise UploadRejected("File is too short to be an STL file")
+    if ext == '.obj' and b'\x00' in head:
+        raise UploadRejected("File content does not look like an OBJ (text) file")
+
+
+class DesignFileStream:
+    """
+    Read-only, non-seekable file object over a request body that validates
+    the data while it is read.
+    """
+
+    def __init__(self, source, file_name: str, content_length: int, max_size: int = MAX_DESIGN_FILE_SIZE):
+        self.ext = os.path.splitext(file_name)[-1].lower()
+        if self.ext not in DESIGN_FILE_EXTENSIONS:
+            raise UploadRejected(
+                f"File type not allowed. Allowed types: {', '.join(DESIGN_FILE_EXTENSIONS)}"
+            )
+        if content_length <= 0:
+            raise UploadRejected("Content-Length is required", status_code=411)
+        if content_length > max_size:
+            raise UploadRejected(f"File size cannot exceed {max_size // (1024 * 1024)}MB", status_code=413)
+
+        self.name = os.path.basename(file_name)
+        self.size = content_length
+        self.closed = False
+        self._source = source
+        self._max_size = max_size
+        self._read = 0
+        # Check the signature before storage sees a single byte
+        self._head = self._source.read(min(CHUNK_SIZE, content_length))
+        _check_signature(self.ext, self._head)
+
+    def read(self, size: int = -1) -> bytes:
+        if self._head:
+            chunk, self._head = self._head, b''
+            if 0 <= size < len(chunk):
+                chunk, self._head = chunk[:size], chunk[size:]
+        else:
+            chunk = self._source.read(CHUNK_SIZE if size is None or size < 0 else size)
+        self._read += len(chunk)
+        if self._read > self._max_size or self._read > self.size:
+            raise UploadRejected("Upload is larger than its declared Content-Length", status_code=413)
+        if not chunk and self._read < self.size:
+            raise UploadRejected("Upload ended before Content-Length bytes were received")
+        return chunk
+
+    def seekable(self) -> bool:
+        return False
+
+    def seek(self, *args):
+        raise io.UnsupportedOperation('DesignFileStream is not seekable')
+
+    def close(self) -> None:
+        self.closed = True
+
+    def save_to(self, field_file) -> str:
+        """
+        Stream into ``field_file``'s storage and point the field at the result.
+
+        Partial files left by a rejected upload are removed. The model instance
+        itself is not saved.
+        """
+        storage = field_file.storage
+        name = field_file.field.generate_filename(field_file.instance, self.name)
+        name = storage.get_available_name(name, max_length=field_file.field.max_length)
+        try:
+            name = storage.save(name, File(self, name=self.name), max_length=field_file.field.max_length)
+        except UploadRejected:
+            if storage.exists(name):
+                storage.delete(name)
+            raise
+        field_file.name = name
+        return name
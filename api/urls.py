@@ -7,7 +7,8 @@ from .views import (
     CustomOrderViewSet, ContactMessageViewSet,
     NewsletterViewSet, TestimonialViewSet,
     create_order, verify_payment_simple, get_order_status, payment_failed,
-    get_user_orders, get_s3_upload_url, razorpay_webhook, validate_coupon,
+    get_user_orders, get_s3_upload_url, get_s3_upload_urls_batch, razorpay_webhook,
+    create_multipart_upload, resume_multipart_upload, complete_multipart_upload, abort_multipart_upload, validate_coupon, gateway_stats,
 )
 from .auth_views import register, login, logout, get_user_profile, update_user_profile, forgot_password, reset_password
 
@@ -43,7 +44,13 @@ urlpatterns = [
 
     # Razorpay webhook (CSRF exempt — signature verified internally)
     path('payments/webhook/', razorpay_webhook, name='razorpay_webhook'),
+    path('payments/gateway-stats/', gateway_stats, name='gateway_stats'),
 
     # S3 presigned upload
     path('s3/presigned-upload/', get_s3_upload_url, name='s3_presigned_upload'),
+    path('s3/presigned-upload/batch/', get_s3_upload_urls_batch, name='s3_presigned_upload_batch'),
+    path('s3/multipart/create/', create_multipart_upload, name='s3_multipart_create'),
+    path('s3/multipart/resume/', resume_multipart_upload, name='s3_multipart_resume'),
+    path('s3/multipart/complete/', complete_multipart_upload, name='s3_multipart_complete'),
+    path('s3/multipart/abort/', abort_multipart_upload, name='s3_multipart_abort'),
 ]
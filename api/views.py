@@ -11,25 +11,37 @@ This module contains all API endpoints for the PrintBox3D application including:
 """
 
 from django.http import JsonResponse, HttpResponse
-from rest_framework import viewsets, status, filters
+from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
 from django.conf import settings
+from django.core import signing
 from django.views.decorators.csrf import csrf_exempt
-from django.db import connection as db_connection
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Q, Subquery, prefetch_related_objects
+from django.utils import timezone
 import logging
-import threading
 import json
 
-from .services.razorpay_service import RazorpayService
-from .services.s3_service import S3Service
-from .email_utils import (
-    send_order_confirmation_email,
-    send_custom_order_notification,
-    send_contact_message_notification
+from .catalog_cache import CatalogCacheMixin, catalog_cached
+from .conditional import ConditionalGetMixin
+from .idempotency import idempotent
+from .pagination import OrderKeysetPagination, ProductKeysetPagination
+from .search import ProductSearchFilter, ProductOrderingFilter
+from .uploads import DesignFileStream, UploadRejected
+from .services.coupon_service import CouponService
+from .services.inventory_service import InventoryService, InsufficientStock
+from .services.mesh_service import MeshAnalysisService
+from .services.order_state_service import OrderStateService
+from .services.ranking_service import (
+    DEFAULT_WINDOW as BEST_SELLER_DEFAULT_WINDOW, WINDOWS as BEST_SELLER_WINDOWS, BestSellerService,
 )
+from .services.razorpay_service import GatewayUnavailable, RazorpayService
+from .services.s3_service import S3Service
+from .services.webhook_service import WebhookService
+from .tasks import enqueue
 from .models import (
     Category, Material, Product, CustomOrder,
     ContactMessage, Newsletter, Testimonial,
@@ -46,7 +58,7 @@ from .serializers import (
 logger = logging.getLogger(__name__)
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for product categories.
     
@@ -61,8 +73,23 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CategorySerializer
     lookup_field = 'slug'
 
+    def get_queryset(self):
+        """Annotate the available-product count so the serializer never hits the DB per row."""
+        return Category.objects.annotate(
+            available_product_count=Count('products', filter=Q(products__is_available=True))
+        ).order_by('name')  # GROUP BY drops Meta.ordering
+
+    def get_validator_aggregates(self):
+        """ETag inputs: the categories themselves plus the products they count."""
+        return {
+            'count': Count('id', distinct=True),
+            'updated': Max('updated_at'),
+            'products_updated': Max('products__updated_at'),
+            'available_products': Count('products', filter=Q(products__is_available=True), distinct=True),
+        }
+
 
-class MaterialViewSet(viewsets.ReadOnlyModelViewSet):
+class MaterialViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for 3D printing materials.
     
@@ -77,7 +104,7 @@ class MaterialViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = MaterialSerializer
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductViewSet(CatalogCacheMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for products with filtering and search capabilities.
     
@@ -88,28 +115,95 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         GET /api/products/ - List all products
         GET /api/products/{slug}/ - Get product details by slug
         GET /api/products/featured/ - Get featured products (max 6)
-        GET /api/products/best_sellers/ - Get best-selling products (max 6)
+        GET /api/products/best_sellers/?window=30&category=home-decor - Get best-selling products (max 6)
     
     Query Parameters:
         category__slug - Filter by category slug
         material__name - Filter by material name
         is_featured - Filter featured products (true/false)
-        search - Search in name and description
+        search - Full-text search over name, category and description
+                 (ranked by relevance on Postgres, typo tolerant)
         ordering - Sort by: price, name, created_at (prefix with - for descending)
     
     Examples:
         /api/products/?category__slug=home-decor
         /api/products/?search=keychain&ordering=-price
         /api/products/?is_featured=true
+        /api/products/?cursor=  (keyset pagination; follow the returned `next` link)
     """
     queryset = Product.objects.filter(is_available=True)
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, ProductOrderingFilter]
     filterset_fields = ['category__slug', 'material__name', 'is_featured']
     search_fields = ['name', 'description']
     ordering_fields = ['price', 'name', 'created_at', 'is_featured']
     ordering = ['-is_featured', '-created_at']
     lookup_field = 'slug'
-    
+    catalog_cache_tracks_stock = True  # cached responses are dropped on every reserve / release
+
+    # Columns read by ProductListSerializer — keep in sync with its Meta.fields
+    LIST_ONLY_FIELDS = [
+        'id', 'name', 'slug', 'price', 'original_price', 'discount_percentage',
+        'image_url', 'image_url_2', 'image_url_3',
+        'is_featured', 'is_available', 'stock_quantity',
+        'category', 'category__name', 'material', 'material__name',
+        'created_at',  # keyset pagination key
+    ]
+
+    @property
+    def paginator(self):
+        """Switch to keyset pagination when the client opts in with ?cursor=."""
+        if not hasattr(self, '_paginator'):
+            if ProductKeysetPagination.cursor_query_param in self.request.query_params:
+                self._paginator = ProductKeysetPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+    def get_queryset(self):
+        """
+        Tune the queryset per action.
+
+        List-style actions join category/material and fetch only the columns the
+        list serializer renders. Retrieve joins the same relations and annotates
+        the category's available-product count so the nested CategorySerializer
+        does not issue its own COUNT query.
+        """
+        queryset = Product.objects.filter(is_available=True).select_related('category', 'material')
+        if self.action == 'retrieve':
+            return queryset.defer('search_vector').annotate(
+                category_available_product_count=Subquery(
+                    Product.objects.filter(category=OuterRef('category'), is_available=True)
+                    .order_by()
+                    .values('category')
+                    .annotate(count=Count('id'))
+                    .values('count')[:1]
+                )
+            )
+        return queryset.only(*self.LIST_ONLY_FIELDS)
+
+    def get_validator_aggregates(self):
+        """ETag inputs: the products plus the category and material data rendered alongside them."""
+        aggregates = {
+            'count': Count('id', distinct=True),
+            'updated': Max('updated_at'),
+            'category_updated': Max('category__updated_at'),
+            'material_updated': Max('material__updated_at'),
+        }
+        if self.action == 'retrieve':
+            # The nested category shows an available-product count
+            aggregates['category_products'] = Count(
+                'category__products', filter=Q(category__products__is_available=True), distinct=True
+            )
+            aggregates['category_products_updated'] = Max('category__products__updated_at')
+        return aggregates
+
+    def get_object(self):
+        product = super().get_object()
+        count = getattr(product, 'category_available_product_count', None)
+        if count is not None:
+            product.category.available_product_count = count
+        return product
+
     def get_serializer_class(self):
         """Use detailed serializer for single product, list serializer for multiple."""
         if self.action == 'retrieve':
@@ -117,24 +211,50 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         return ProductListSerializer
     
     @action(detail=False, methods=['get'])
+    @catalog_cached
     def featured(self, request):
         """
         Get featured products.
         
         Returns up to 6 featured products for homepage display.
         """
-        featured_products = self.queryset.filter(is_featured=True)[:6]
+        featured_products = self.get_queryset().filter(is_featured=True)[:6]
         serializer = self.get_serializer(featured_products, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
+    @catalog_cached
     def best_sellers(self, request):
         """
-        Get best-selling products.
+        Get best-selling products (max 6), ranked by units sold on paid orders.
+        
+        Reads the precomputed ranking (`python manage.py refresh_best_sellers`);
+        falls back to featured products until there are sales to rank.
         
-        Currently returns featured products. Can be enhanced with actual sales data.
+        Query Parameters:
+            window - Rolling window in days: 7, 30 (default) or 90
+            category - Category slug
         """
-        best_sellers = self.queryset.filter(is_featured=True)[:6]
+        try:
+            window = int(request.query_params.get('window', BEST_SELLER_DEFAULT_WINDOW))
+        except ValueError:
+            window = None
+        if window not in BEST_SELLER_WINDOWS:
+            return Response(
+                {'error': f"window must be one of {', '.join(map(str, BEST_SELLER_WINDOWS))}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        category = request.query_params.get('category') or None
+        
+        ranked = BestSellerService.top(window, category_slug=category, limit=6)
+        if ranked:
+            products = self.get_queryset().in_bulk(ranked)
+            best_sellers = [products[pk] for pk in ranked if pk in products]
+        else:
+            best_sellers = self.get_queryset().filter(is_featured=True)
+            if category:
+                best_sellers = best_sellers.filter(category__slug=category)
+            best_sellers = best_sellers[:6]
         serializer = self.get_serializer(best_sellers, many=True)
         return Response(serializer.data)
 
@@ -148,6 +268,9 @@ class CustomOrderViewSet(viewsets.ModelViewSet):
     
     Endpoints:
         POST /api/custom-orders/ - Submit custom order request
+        POST /api/custom-orders/{id}/design-file/?file_name=part.stl
+             - Stream the design file as the raw request body
+               (header X-Upload-Token: upload_token from the create response)
     
     Request Body:
         name - Customer name
@@ -159,22 +282,65 @@ class CustomOrderViewSet(viewsets.ModelViewSet):
     queryset = CustomOrder.objects.all()
     serializer_class = CustomOrderSerializer
     http_method_names = ['post', 'get']
+
+    UPLOAD_TOKEN_SALT = 'custom-order-design-upload'
+    UPLOAD_TOKEN_MAX_AGE = 60 * 60  # seconds
     
     def create(self, request, *args, **kwargs):
         """Create custom order and send notification email."""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         custom_order = serializer.save()
+        MeshAnalysisService.queue(custom_order)
         
-        # Send email notification to admin
-        try:
-            send_custom_order_notification(custom_order)
-        except Exception as email_error:
-            logger.warning(f"Failed to send custom order notification: {email_error}")
+        # Admin notification is sent by the task worker
+        enqueue('email.custom_order_notification', custom_order_id=custom_order.pk)
         
         return Response({
             'message': 'Custom order request submitted successfully! We will contact you within 24-48 hours.',
-            'order_id': serializer.data['id']
+            'order_id': serializer.data['id'],
+            'upload_token': signing.dumps(custom_order.pk, salt=self.UPLOAD_TOKEN_SALT),
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], url_path='design-file', parser_classes=[])
+    def design_file(self, request, pk=None):
+        """
+        Stream a design file into storage without buffering it in the worker.
+
+        The body is the raw file (any Content-Type); request.data is never
+        touched, so DRF/Django parsers do not spool it. Size and file
+        signature are checked as the bytes arrive.
+        """
+        try:
+            token_pk = signing.loads(
+                request.headers.get('X-Upload-Token', ''),
+                salt=self.UPLOAD_TOKEN_SALT, max_age=self.UPLOAD_TOKEN_MAX_AGE,
+            )
+        except signing.BadSignature:
+            return Response({'error': 'Invalid or expired upload token'}, status=status.HTTP_403_FORBIDDEN)
+        if str(token_pk) != str(pk):
+            return Response({'error': 'Invalid or expired upload token'}, status=status.HTTP_403_FORBIDDEN)
+
+        custom_order = self.get_object()
+        if custom_order.design_file:
+            return Response({'error': 'A design file was already uploaded'}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            content_length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            content_length = 0
+        try:
+            stream = DesignFileStream(request.stream, request.query_params.get('file_name', ''), content_length)
+            stream.save_to(custom_order.design_file)
+        except UploadRejected as exc:
+            return Response({'error': str(exc)}, status=exc.status_code)
+
+        custom_order.analysis_status = CustomOrder.ANALYSIS_PENDING
+        custom_order.save(update_fields=['design_file', 'analysis_status', 'updated_at'])
+        logger.info(f"Design file streamed for custom order #{custom_order.pk} ({content_length} bytes)")
+        return Response({
+            'order_id': custom_order.pk,
+            'design_file': custom_order.design_file.url,
         }, status=status.HTTP_201_CREATED)
 
 
@@ -204,11 +370,8 @@ class ContactMessageViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         contact_message = serializer.save()
         
-        # Send email notification to admin
-        try:
-            send_contact_message_notification(contact_message)
-        except Exception as email_error:
-            logger.warning(f"Failed to send contact message notification: {email_error}")
+        # Admin notification is sent by the task worker
+        enqueue('email.contact_notification', contact_message_id=contact_message.pk)
         
         return Response({
             'message': 'Thank you for contacting us! We will respond within 24 hours.',
@@ -244,7 +407,7 @@ class NewsletterViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_201_CREATED)
 
 
-class TestimonialViewSet(viewsets.ReadOnlyModelViewSet):
+class TestimonialViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for customer testimonials.
     
@@ -258,6 +421,7 @@ class TestimonialViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TestimonialSerializer
     
     @action(detail=False, methods=['get'])
+    @catalog_cached
     def featured(self, request):
         """Get featured testimonials for homepage display."""
         featured = self.queryset.filter(is_featured=True)[:6]
@@ -331,16 +495,24 @@ def validate_coupon(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@idempotent('create_order')
 def create_order(request):
     """
     Create new order and initiate Razorpay payment.
     
     This endpoint:
     1. Validates order data and cart items
-    2. Checks product availability and stock
-    3. Creates Order and OrderItem records
-    4. Initializes Razorpay payment order
+    2. Locks the cart's products and checks availability and stock
+    3. Creates Order and OrderItem records and reserves the stock
+       (released on payment failure or after STOCK_RESERVATION_TTL_MINUTES)
+    4. Initializes Razorpay payment order (after the DB transaction has
+       committed — no transaction or row lock is held across the HTTP call)
     5. Returns payment details for frontend
+
+    Headers:
+        Idempotency-Key - Optional client-generated unique key. Retrying with
+                          the same key replays the stored response instead of
+                          creating a second order / Razorpay order.
     
     Request Body:
         customer_name - Customer full name
@@ -379,24 +551,42 @@ def create_order(request):
     
     data = serializer.validated_data
     
-    # Calculate total amount from cart items
-    total_amount = 0
-    order_items = []
-    
-    for item in data['items']:
-        try:
-            product = Product.objects.get(id=item['product_id'], is_available=True)
-            quantity = int(item['quantity'])
-            
-            # Check stock
-            if product.stock_quantity < quantity:
-                return Response({
-                    'error': f'Insufficient stock for {product.name}. Available: {product.stock_quantity}'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
+    # Lookup, validation and all inserts run in one transaction
+    with transaction.atomic():
+        # Fetch and lock every product in the cart with one query
+        cart_lines = [(str(item['product_id']), int(item['quantity'])) for item in data['items']]
+        product_ids = {int(pid) for pid, _ in cart_lines if pid.isdigit()}
+        products = InventoryService.lock_products(product_ids)
+
+        missing = [pid for pid, _ in cart_lines if not pid.isdigit() or int(pid) not in products]
+        if missing:
+            return Response({
+                'error': f'Product with ID {missing[0]} not found',
+                'missing_product_ids': missing,
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        # Validate stock per product (a product may appear on several cart lines)
+        requested = {}
+        for pid, quantity in cart_lines:
+            requested[int(pid)] = requested.get(int(pid), 0) + quantity
+        stock_errors = [
+            f'Insufficient stock for {products[pk].name}. Available: {products[pk].stock_quantity}'
+            for pk, quantity in requested.items()
+            if products[pk].stock_quantity < quantity
+        ]
+        if stock_errors:
+            return Response({
+                'error': ' '.join(stock_errors),
+                'errors': stock_errors,
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Calculate total amount from cart items
+        total_amount = 0
+        order_items = []
+        for pid, quantity in cart_lines:
+            product = products[int(pid)]
             subtotal = product.price * quantity
             total_amount += subtotal
-            
             order_items.append({
                 'product': product,
                 'product_name': product.name,
@@ -405,59 +595,58 @@ def create_order(request):
                 'quantity': quantity,
                 'subtotal': subtotal
             })
-            
-        except Product.DoesNotExist:
-            return Response({
-                'error': f'Product with ID {item["product_id"]} not found'
-            }, status=status.HTTP_404_NOT_FOUND)
-    
-    # Apply coupon discount if provided
-    coupon_code_input = data.get('coupon_code', '').strip().upper()
-    discount_amount = 0
-    applied_coupon = None
 
-    if coupon_code_input:
-        from decimal import Decimal
-        from django.utils import timezone
-        try:
-            applied_coupon = Coupon.objects.get(code=coupon_code_input, is_active=True)
-            # Re-validate before applying
-            expired = applied_coupon.expiry_date and applied_coupon.expiry_date < timezone.now().date()
-            maxed = applied_coupon.max_uses is not None and applied_coupon.times_used >= applied_coupon.max_uses
-            below_min = total_amount < applied_coupon.min_order_amount
-            if not expired and not maxed and not below_min:
-                discount_amount = applied_coupon.calculate_discount(total_amount)
-                total_amount = max(Decimal('0'), total_amount - discount_amount)
-            else:
-                applied_coupon = None  # invalid at this point, ignore silently
-        except Coupon.DoesNotExist:
-            pass  # invalid code, just ignore
-
-    # Create order
-    order = Order.objects.create(
-        user=request.user if request.user.is_authenticated else None,
-        customer_name=data['customer_name'],
-        customer_email=data['customer_email'],
-        customer_phone=data['customer_phone'],
-        shipping_address=data['shipping_address'],
-        shipping_city=data['shipping_city'],
-        shipping_state=data['shipping_state'],
-        shipping_pincode=data['shipping_pincode'],
-        total_amount=total_amount,
-        discount_amount=discount_amount,
-        coupon_code=applied_coupon.code if applied_coupon else '',
-        status='PENDING',
-        payment_status='PENDING'
-    )
+        # Apply coupon discount if provided
+        coupon_code_input = data.get('coupon_code', '').strip().upper()
+        discount_amount = 0
+        applied_coupon = None
+
+        if coupon_code_input:
+            from decimal import Decimal
+            from django.utils import timezone
+            try:
+                applied_coupon = Coupon.objects.get(code=coupon_code_input, is_active=True)
+                # Re-validate before applying; the usage limit is enforced by the
+                # atomic redemption itself, never by the (possibly stale) in-memory count
+                expired = applied_coupon.expiry_date and applied_coupon.expiry_date < timezone.now().date()
+                below_min = total_amount < applied_coupon.min_order_amount
+                if not expired and not below_min and CouponService.redeem(applied_coupon):
+                    discount_amount = applied_coupon.calculate_discount(total_amount)
+                    total_amount = max(Decimal('0'), total_amount - discount_amount)
+                else:
+                    applied_coupon = None  # invalid at this point, ignore silently
+            except Coupon.DoesNotExist:
+                pass  # invalid code, just ignore
+
+        # Create order
+        order = Order.objects.create(
+            user=request.user if request.user.is_authenticated else None,
+            customer_name=data['customer_name'],
+            customer_email=data['customer_email'],
+            customer_phone=data['customer_phone'],
+            shipping_address=data['shipping_address'],
+            shipping_city=data['shipping_city'],
+            shipping_state=data['shipping_state'],
+            shipping_pincode=data['shipping_pincode'],
+            total_amount=total_amount,
+            discount_amount=discount_amount,
+            coupon_code=applied_coupon.code if applied_coupon else '',
+            coupon_redeemed=applied_coupon is not None,
+            status='PENDING',
+            payment_status='PENDING'
+        )
 
-    # Create order items
-    for item_data in order_items:
-        product = item_data.pop('product')
-        OrderItem.objects.create(order=order, product=product, **item_data)
+        # Create order items in a single INSERT
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, **item_data) for item_data in order_items
+        ])
 
-    # Increment coupon usage after order is saved
-    if applied_coupon:
-        Coupon.objects.filter(pk=applied_coupon.pk).update(times_used=applied_coupon.times_used + 1)
+        # Hold the stock until payment succeeds, fails or the reservation expires
+        try:
+            InventoryService.reserve(order, requested)
+        except InsufficientStock as exc:
+            transaction.set_rollback(True)
+            return Response({'error': str(exc), 'errors': [str(exc)]}, status=status.HTTP_409_CONFLICT)
     
     # Create Razorpay order via service layer
     try:
@@ -491,9 +680,19 @@ def create_order(request):
             'customer_phone': order.customer_phone,
         }, status=status.HTTP_201_CREATED)
         
+    except GatewayUnavailable:
+        # Circuit breaker open — fail fast instead of queueing on a degraded gateway
+        _discard_order(order)
+        response = Response({
+            'error': 'Payment gateway temporarily unavailable',
+            'details': 'Please try again in a minute'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = str(getattr(settings, 'RAZORPAY_BREAKER_RESET_SECONDS', 30))
+        return response
+
     except ValueError as ve:
         # Razorpay credentials not configured
-        order.delete()
+        _discard_order(order)
         logger.error(f"Razorpay configuration error: {str(ve)}")
         return Response({
             'error': 'Payment gateway not configured',
@@ -502,7 +701,7 @@ def create_order(request):
         
     except Exception as e:
         # Delete order if Razorpay order creation fails
-        order.delete()
+        _discard_order(order)
         logger.error(f"Razorpay order creation failed: {str(e)}", exc_info=True)
         return Response({
             'error': 'Failed to create payment order',
@@ -510,6 +709,30 @@ def create_order(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def gateway_stats(request):
+    """
+    Razorpay client health for the worker process answering the request:
+    circuit breaker state and per-operation latency histograms.
+    GET /api/payments/gateway-stats/  (staff only)
+    """
+    return Response(RazorpayService.stats())
+
+
+def _release_order_holds(order_ids):
+    """Return reserved stock and claimed coupon uses for FAILED/CANCELLED orders."""
+    InventoryService.release(order_ids)
+    CouponService.release(order_ids)
+
+
+def _discard_order(order):
+    """Return reserved stock and delete an order that never reached the gateway."""
+    with transaction.atomic():
+        _release_order_holds([order.pk])
+        order.delete()
+
+
 # ============================================================================
 # PAYMENT VERIFICATION (plain Django view - avoids DRF/CSRF middleware issues)
 # ============================================================================
@@ -551,10 +774,9 @@ def verify_payment_simple(request):
             response = JsonResponse({'success': False, 'error': 'Missing fields'}, status=400)
             return add_cors(response)
         
-        # Find order
-        try:
-            order = Order.objects.get(razorpay_order_id=razorpay_order_id)
-        except Order.DoesNotExist:
+        # Find order (indexed on razorpay_order_id)
+        order = Order.objects.filter(razorpay_order_id=razorpay_order_id).only('pk', 'order_id', 'status').first()
+        if order is None:
             response = JsonResponse({'success': False, 'error': 'Order not found'}, status=404)
             return add_cors(response)
         
@@ -562,40 +784,42 @@ def verify_payment_simple(request):
         if not RazorpayService.verify_signature(
             razorpay_order_id, razorpay_payment_id, razorpay_signature
         ):
-            order.status = 'FAILED'
-            order.payment_status = 'FAILED'
-            order.save(update_fields=['status', 'payment_status'])
+            OrderStateService.transition(order.pk, 'FAILED', payment_status='FAILED')
             response = JsonResponse({'success': False, 'error': 'Invalid signature'}, status=400)
             return add_cors(response)
         
-        # Update order
-        order.status = "PAID"
-        order.payment_status = "CAPTURED"
-        order.razorpay_payment_id = razorpay_payment_id
-        order.save()
-        
-        # Send confirmation email in background thread (non-blocking)
-        # Pre-fetch items in the main thread before handing off to the background thread
-        order_items = list(order.items.values('product_name', 'quantity', 'product_price', 'subtotal'))
-
-        def send_email_async():
-            # Close the inherited DB connection so the thread gets its own fresh one
-            db_connection.close()
-            try:
-                send_order_confirmation_email(order, prefetched_items=order_items)
-                logger.info(f"Confirmation email sent for order {order.order_id}")
-            except Exception as email_error:
-                logger.error(f"Email sending error: {email_error}", exc_info=True)
+        # PAID transition as one conditional UPDATE: exactly one of this request and the
+        # payment.captured webhook wins; the winner's transition queues the confirmation email.
+        # A FAILED order can still be paid by a retried attempt if its stock and coupon are available.
+        with transaction.atomic():
+            won = OrderStateService.transition(
+                order.pk, 'PAID',
+                payment_status='CAPTURED',
+                razorpay_payment_id=razorpay_payment_id,
+                razorpay_signature=razorpay_signature,
+            )
+            if won:
+                OrderStateService.transition_payment(
+                    order.pk, 'CAPTURED',
+                    razorpay_payment_id=razorpay_payment_id,
+                    razorpay_signature=razorpay_signature,
+                )
         
-        # daemon=False ensures the thread completes even after the response is returned
-        email_thread = threading.Thread(target=send_email_async)
-        email_thread.daemon = False
-        email_thread.start()
+        if won:
+            current_status = 'PAID'
+        else:
+            # Already settled (usually by the webhook): report the order's state
+            current_status = Order.objects.filter(pk=order.pk).values_list('status', flat=True).first()
+            if current_status not in Order.PAID_STATUSES:
+                response = JsonResponse({
+                    'success': False, 'error': f'Order is {current_status.lower()}', 'status': current_status,
+                }, status=409)
+                return add_cors(response)
         
         response = JsonResponse({
             'success': True,
             'order_id': order.order_id,
-            'status': 'PAID'
+            'status': current_status,
         })
         return add_cors(response)
         
@@ -629,16 +853,18 @@ def payment_failed(request):
     error_description = request.data.get('error_description', 'Payment failed')
     
     try:
-        order = Order.objects.get(order_id=order_id)
-        order.status = 'FAILED'
-        order.payment_status = 'FAILED'
-        order.save()
+        order = Order.objects.only('pk', 'order_id').get(order_id=order_id)
+        # Only a PENDING order can fail; a repeated callback, or one arriving after
+        # the payment was captured, leaves the order as it is
+        with transaction.atomic():
+            if OrderStateService.transition(order.pk, 'FAILED', payment_status='FAILED'):
+                OrderStateService.transition_payment(order.pk, 'FAILED', error_description=error_description)
         
-        if hasattr(order, 'payment'):
-            payment = order.payment
-            payment.status = 'FAILED'
-            payment.error_description = error_description
-            payment.save()
+        current_status = Order.objects.filter(pk=order.pk).values_list('status', flat=True).first()
+        if current_status in Order.PAID_STATUSES:
+            return Response({
+                'error': f'Order is {current_status.lower()}', 'status': current_status,
+            }, status=status.HTTP_409_CONFLICT)
         
         return Response({
             'message': 'Payment failure recorded',
@@ -654,16 +880,27 @@ def get_user_orders(request):
     """
     Get all orders for the authenticated user
     Returns orders linked to user account + orders with matching email
+
+    Query Parameters:
+        cursor - Opt into keyset pagination (pass empty for the first page)
     """
-    # Get orders linked to user account
-    user_orders = Order.objects.filter(user=request.user)
-    
-    # Also get orders with the same email (for guest checkouts before login)
-    email_orders = Order.objects.filter(customer_email=request.user.email)
-    
-    # Combine and remove duplicates, order by creation date
-    all_orders = (user_orders | email_orders).distinct().order_by('-created_at')
-    
+    # Orders linked to the account, plus guest checkouts made with the same email.
+    # Each is read through its own keyset index and merged in Python: an OR of
+    # the two predicates cannot be served by either index.
+    sources = [Order.objects.filter(user=request.user)]
+    if request.user.email:
+        sources.append(Order.objects.filter(customer_email=request.user.email))
+
+    # Opt-in keyset pagination: ?cursor= for the first page, then follow `next`
+    paginator = OrderKeysetPagination()
+    if paginator.cursor_query_param in request.query_params:
+        page = paginator.paginate_querysets(sources, request)
+        prefetch_related_objects(page, 'items__product')
+        serializer = OrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    all_orders = paginator.merge(sources)
+    prefetch_related_objects(all_orders, 'items__product')
     serializer = OrderSerializer(all_orders, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -691,37 +928,227 @@ def get_s3_upload_url(request):
     folder       = request.data.get('folder', 'products')
     file_name    = request.data.get('file_name', '')
     content_type = request.data.get('content_type', '')
-    file_size    = int(request.data.get('file_size', 0))
+    try:
+        file_size = int(request.data.get('file_size', 0))
+    except (TypeError, ValueError):
+        return Response({'error': 'file_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
 
     if not file_name or not content_type:
         return Response({'error': 'file_name and content_type are required'}, status=status.HTTP_400_BAD_REQUEST)
 
     # Validate MIME type and size
-    type_ok, type_err = S3Service.validate_file_type(folder, content_type)
-    if not type_ok:
-        return Response({'error': type_err}, status=status.HTTP_400_BAD_REQUEST)
-
-    size_ok, size_err = S3Service.validate_file_size(folder, file_size)
-    if not size_ok:
-        return Response({'error': size_err}, status=status.HTTP_400_BAD_REQUEST)
-
-    result = S3Service.generate_presigned_upload_url(
-        folder=folder,
-        file_name=file_name,
-        content_type=content_type,
-    )
-    if result is None:
-        logger.error('S3Service failed to generate presigned URL')
+    if not S3Service.validate_file_type(content_type, folder):
+        return Response(
+            {'error': f"File type '{content_type}' is not allowed for folder '{folder}'"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    if not S3Service.validate_file_size(file_size, folder):
+        return Response({'error': f"File is too large for folder '{folder}'"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        result = S3Service.generate_presigned_upload_url(
+            folder=folder,
+            file_name=file_name,
+            content_type=content_type,
+        )
+    except (ValueError, RuntimeError) as exc:
+        logger.error(f'S3Service failed to generate presigned URL: {exc}')
         return Response({'error': 'Could not generate upload URL'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    upload_url, file_url, s3_key = result
     return Response({
-        'upload_url': upload_url,
-        'file_url':   file_url,
-        's3_key':     s3_key,
+        'upload_url': result['upload_url'],
+        'file_url':   result['file_url'],
+        's3_key':     result['s3_key'],
     }, status=status.HTTP_200_OK)
 
 
+MAX_BATCH_UPLOADS = 10
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def get_s3_upload_urls_batch(request):
+    """
+    Return presigned S3 upload URLs for several files in one round trip
+    (e.g. all three product images, or every design file of a custom order).
+
+    Body:
+        folder – destination folder in the bucket (default: 'products')
+        files  – list of {file_name, content_type, file_size}, at most MAX_BATCH_UPLOADS
+    """
+    if not S3Service.is_configured():
+        return Response({'error': 'S3 storage is not configured'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    folder = request.data.get('folder', 'products')
+    files = request.data.get('files')
+    if not isinstance(files, list) or not files:
+        return Response({'error': 'files must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(files) > MAX_BATCH_UPLOADS:
+        return Response(
+            {'error': f'At most {MAX_BATCH_UPLOADS} files can be presigned per request'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    cleaned = []
+    for index, item in enumerate(files):
+        if not isinstance(item, dict) or not item.get('file_name') or not item.get('content_type'):
+            return Response(
+                {'error': f'files[{index}]: file_name and content_type are required'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            file_size = int(item.get('file_size', 0))
+        except (TypeError, ValueError):
+            return Response(
+                {'error': f'files[{index}]: file_size must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        cleaned.append({'file_name': item['file_name'], 'content_type': item['content_type'], 'file_size': file_size})
+
+    try:
+        results = S3Service.generate_presigned_upload_urls(folder, cleaned)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    except RuntimeError as exc:
+        logger.error(f'S3Service failed to generate presigned URLs: {exc}')
+        return Response({'error': 'Could not generate upload URLs'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return Response({'uploads': results}, status=status.HTTP_200_OK)
+
+
+MULTIPART_TOKEN_SALT = 's3-multipart-upload'
+
+
+def _multipart_target(request):
+    """
+    Pull (s3_key, upload_id) from the body's ``upload_token``.
+
+    The token is signed at create time for the requesting user, so only the
+    user who started an upload can resume, complete or abort it. It lives as
+    long as the stale-upload janitor lets the upload live.
+    """
+    max_age = getattr(settings, 'AWS_S3_MULTIPART_STALE_HOURS', 24) * 60 * 60
+    try:
+        target = signing.loads(request.data.get('upload_token', ''), salt=MULTIPART_TOKEN_SALT, max_age=max_age)
+    except signing.BadSignature:
+        return None, None
+    if target.get('user') != request.user.pk:
+        return None, None
+    return target['s3_key'], target['upload_id']
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_multipart_upload(request):
+    """
+    Start a multipart upload for a large file and presign every part.
+
+    Body:
+        folder       – destination folder (default: 'custom_orders')
+        file_name    – original filename (used to derive extension)
+        content_type – MIME type of the file
+        file_size    – size in bytes (decides the number of parts)
+    """
+    if not S3Service.is_configured():
+        return Response({'error': 'S3 storage is not configured'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    folder       = request.data.get('folder', 'custom_orders')
+    file_name    = request.data.get('file_name', '')
+    content_type = request.data.get('content_type', '')
+    try:
+        file_size = int(request.data.get('file_size', 0))
+    except (TypeError, ValueError):
+        return Response({'error': 'file_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not file_name or not content_type:
+        return Response({'error': 'file_name and content_type are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        result = S3Service.create_multipart_upload(folder, file_name, content_type, file_size)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    except RuntimeError as exc:
+        logger.error(f'S3Service failed to start multipart upload: {exc}')
+        return Response({'error': 'Could not start upload'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    result['upload_token'] = signing.dumps(
+        {'user': request.user.pk, 's3_key': result['s3_key'], 'upload_id': result['upload_id']},
+        salt=MULTIPART_TOKEN_SALT,
+    )
+    return Response(result, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def resume_multipart_upload(request):
+    """
+    Resume an interrupted multipart upload.
+
+    Body:
+        upload_token      – from create_multipart_upload
+        part_numbers      – parts that still need (fresh) upload URLs
+    """
+    s3_key, upload_id = _multipart_target(request)
+    if not s3_key:
+        return Response({'error': 'Invalid or expired upload token'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        part_numbers = [int(n) for n in request.data.get('part_numbers', [])]
+    except (TypeError, ValueError):
+        return Response({'error': 'part_numbers must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if any(n < 1 or n > 10000 for n in part_numbers):
+        return Response({'error': 'part_numbers must be between 1 and 10000'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        return Response(S3Service.resume_multipart_upload(s3_key, upload_id, part_numbers))
+    except RuntimeError:
+        return Response({'error': 'Upload not found or no longer active'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def complete_multipart_upload(request):
+    """
+    Finish a multipart upload. Uploads over the folder's size limit are aborted.
+
+    Body:
+        upload_token      – from create_multipart_upload
+        parts             – [{part_number, etag}, ...] for every uploaded part
+    """
+    s3_key, upload_id = _multipart_target(request)
+    if not s3_key:
+        return Response({'error': 'Invalid or expired upload token'}, status=status.HTTP_403_FORBIDDEN)
+    parts = request.data.get('parts')
+    if (
+        not isinstance(parts, list) or not parts
+        or not all(isinstance(p, dict) and p.get('part_number') and p.get('etag') for p in parts)
+    ):
+        return Response({'error': 'parts must list part_number and etag for every part'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        S3Service.complete_multipart_upload(s3_key, upload_id, parts)
+    except (ValueError, RuntimeError) as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    return Response({
+        's3_key': s3_key,
+        'file_url': f"https://{bucket}.s3.{settings.AWS_S3_REGION_NAME}.amazonaws.com/{s3_key}",
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def abort_multipart_upload(request):
+    """Abandon a multipart upload so S3 discards its parts. Body: upload_token."""
+    s3_key, upload_id = _multipart_target(request)
+    if not s3_key:
+        return Response({'error': 'Invalid or expired upload token'}, status=status.HTTP_403_FORBIDDEN)
+    if not S3Service.abort_multipart_upload(s3_key, upload_id):
+        return Response({'error': 'Could not abort upload'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 # ============================================================================
 # RAZORPAY WEBHOOK
 # ============================================================================
@@ -729,8 +1156,12 @@ def get_s3_upload_url(request):
 @csrf_exempt
 def razorpay_webhook(request):
     """
-    Receives Razorpay event webhooks and reconciles payment / order status.
+    Receives Razorpay event webhooks into the webhook inbox.
     Must be registered with CSRF exempt because Razorpay sends a raw POST.
+
+    The event is stored (once per X-Razorpay-Event-Id) and acknowledged
+    immediately; order / payment updates are applied by the task worker
+    (see services/webhook_service.py).
     """
     if request.method != 'POST':
         return HttpResponse(status=405)
@@ -743,38 +1174,9 @@ def razorpay_webhook(request):
         return HttpResponse(status=400)
 
     try:
-        payload = json.loads(raw_body)
-    except json.JSONDecodeError:
+        event, created = WebhookService.ingest(raw_body, request.headers.get('X-Razorpay-Event-Id', ''))
+    except ValueError:  # includes json.JSONDecodeError
         return HttpResponse(status=400)
 
-    event = payload.get('event', '')
-    logger.info('Razorpay webhook received: %s', event)
-
-    if event == 'payment.captured':
-        rz_order_id  = payload['payload']['payment']['entity'].get('order_id', '')
-        rz_payment_id = payload['payload']['payment']['entity'].get('id', '')
-        try:
-            order = Order.objects.get(razorpay_order_id=rz_order_id)
-            if order.status not in ('CONFIRMED', 'SHIPPED', 'DELIVERED'):
-                order.status         = 'CONFIRMED'
-                order.payment_status = 'PAID'
-                order.save(update_fields=['status', 'payment_status'])
-                Payment.objects.filter(order=order).update(
-                    status='CAPTURED', razorpay_payment_id=rz_payment_id
-                )
-        except Order.DoesNotExist:
-            logger.error('Webhook: order not found for razorpay_order_id=%s', rz_order_id)
-
-    elif event == 'payment.failed':
-        rz_order_id = payload['payload']['payment']['entity'].get('order_id', '')
-        try:
-            order = Order.objects.get(razorpay_order_id=rz_order_id)
-            if order.status not in ('CONFIRMED', 'SHIPPED', 'DELIVERED'):
-                order.status         = 'FAILED'
-                order.payment_status = 'FAILED'
-                order.save(update_fields=['status', 'payment_status'])
-                Payment.objects.filter(order=order).update(status='FAILED')
-        except Order.DoesNotExist:
-            logger.error('Webhook: order not found for razorpay_order_id=%s', rz_order_id)
-
+    logger.info('Razorpay webhook received: %s %s%s', event.event, event.event_id, '' if created else ' (duplicate)')
     return HttpResponse(status=200)
@@ -36,6 +36,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",  # search lookups (trigram_similar); inert on SQLite
 
     # Third-party
     "rest_framework",
@@ -118,6 +119,34 @@ else:
         }
     }
 
+# -------------------------------------------------------------------------
+# CACHE — local memory by default, Redis when REDIS_URL is set
+# -------------------------------------------------------------------------
+# Local memory is per gunicorn worker, so a catalog invalidation only reaches
+# the worker that handled the admin save until CATALOG_CACHE_TIMEOUT expires.
+# Set REDIS_URL (requires the `redis` package) to share one cache across workers.
+REDIS_URL = config("REDIS_URL", default="")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "printbox-cache",
+        }
+    }
+
+# Versioned response cache for the read-only catalog endpoints (api/catalog_cache.py)
+CATALOG_CACHE_ENABLED = config("CATALOG_CACHE_ENABLED", default=True, cast=bool)
+CATALOG_CACHE_ALIAS   = "default"
+CATALOG_CACHE_TIMEOUT = config("CATALOG_CACHE_TIMEOUT", default=300, cast=int)  # seconds
+
 # -------------------------------------------------------------------------
 # PASSWORD VALIDATION
 # -------------------------------------------------------------------------
@@ -152,6 +181,12 @@ AWS_ACCESS_KEY_ID = config("AWS_ACCESS_KEY_ID", default="")
 AWS_SECRET_ACCESS_KEY = config("AWS_SECRET_ACCESS_KEY", default="")
 AWS_STORAGE_BUCKET_NAME = config("AWS_STORAGE_BUCKET_NAME", default="printbox-media")
 AWS_S3_REGION_NAME = config("AWS_S3_REGION_NAME", default="ap-south-1")
+# Sign presigned upload/read URLs locally (SigV4) instead of through botocore
+AWS_S3_LOCAL_PRESIGN = config("AWS_S3_LOCAL_PRESIGN", default=True, cast=bool)
+# Part size for multipart design-file uploads (S3 minimum is 5 MB)
+AWS_S3_MULTIPART_PART_SIZE = config("AWS_S3_MULTIPART_PART_SIZE", default=5 * 1024 * 1024, cast=int)
+# Incomplete multipart uploads older than this are aborted by `abort_stale_multipart_uploads`
+AWS_S3_MULTIPART_STALE_HOURS = config("AWS_S3_MULTIPART_STALE_HOURS", default=24, cast=int)
 
 if AWS_ACCESS_KEY_ID:
     # --- Production: store all uploaded files in S3 ---
@@ -209,11 +244,18 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
     'cache-control',
+    'if-none-match',
+    'if-modified-since',
+    'idempotency-key',
+    'x-upload-token',
 ]
 
 CORS_EXPOSE_HEADERS = [
     'content-type',
     'x-csrftoken',
+    'etag',
+    'last-modified',
+    'idempotent-replayed',
 ]
 
 CORS_PREFLIGHT_MAX_AGE = 86400  # 24 h
@@ -288,6 +330,10 @@ EMAIL_HOST_USER     = config("EMAIL_HOST_USER",     default="")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD", default="")
 DEFAULT_FROM_EMAIL  = config("DEFAULT_FROM_EMAIL",  default="PrintBox3D <info@printbox3d.com>")
 SERVER_EMAIL = DEFAULT_FROM_EMAIL
+EMAIL_TIMEOUT       = config("EMAIL_TIMEOUT",       default=30, cast=int)   # seconds per socket operation
+# The SMTP connection is kept open between messages (api/email_utils.py) and
+# re-opened after this many idle seconds
+EMAIL_SMTP_IDLE_TIMEOUT = config("EMAIL_SMTP_IDLE_TIMEOUT", default=60, cast=int)
 
 # Resend API (preferred over SMTP on cloud platforms that block outbound SMTP)
 # Get a free API key at https://resend.com — 3,000 emails/month free
@@ -300,6 +346,56 @@ RESEND_API_KEY = config("RESEND_API_KEY", default="")
 RAZORPAY_KEY_ID             = config('RAZORPAY_KEY_ID', default='')
 RAZORPAY_KEY_SECRET         = config('RAZORPAY_KEY_SECRET', default='')
 RAZORPAY_WEBHOOK_SECRET     = config('RAZORPAY_WEBHOOK_SECRET', default='')
+RAZORPAY_BASE_URL           = config('RAZORPAY_BASE_URL', default='https://api.razorpay.com')
+
+# One pooled keep-alive client per worker process (api/services/razorpay_service.py)
+RAZORPAY_CONNECT_TIMEOUT        = config('RAZORPAY_CONNECT_TIMEOUT', default=3.05, cast=float)  # seconds
+RAZORPAY_READ_TIMEOUT           = config('RAZORPAY_READ_TIMEOUT', default=10.0, cast=float)     # seconds
+RAZORPAY_MAX_RETRIES            = config('RAZORPAY_MAX_RETRIES', default=2, cast=int)
+RAZORPAY_POOL_MAXSIZE           = config('RAZORPAY_POOL_MAXSIZE', default=10, cast=int)
+# Consecutive gateway failures before checkout fails fast with 503, and how long it stays open
+RAZORPAY_BREAKER_THRESHOLD      = config('RAZORPAY_BREAKER_THRESHOLD', default=5, cast=int)
+RAZORPAY_BREAKER_RESET_SECONDS  = config('RAZORPAY_BREAKER_RESET_SECONDS', default=30, cast=int)
+
+# -------------------------------------------------------------------------
+# INVENTORY
+# -------------------------------------------------------------------------
+# Stock reserved by an unpaid order is returned after this many minutes
+# (run `python manage.py release_expired_reservations` on a schedule)
+STOCK_RESERVATION_TTL_MINUTES = config('STOCK_RESERVATION_TTL_MINUTES', default=30, cast=int)
+
+# Idempotency-Key responses are replayable for this long
+# (run `python manage.py purge_idempotency_keys` on a schedule)
+IDEMPOTENCY_KEY_TTL_HOURS = config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int)
+
+# -------------------------------------------------------------------------
+# PENDING ORDER RECONCILIATION
+# -------------------------------------------------------------------------
+# `python manage.py reconcile_pending_orders` (cron, before release_expired_reservations)
+# asks Razorpay about PENDING orders older than this and settles them
+RECONCILE_PENDING_AFTER_MINUTES = config('RECONCILE_PENDING_AFTER_MINUTES', default=15, cast=int)
+RECONCILE_BATCH_SIZE            = config('RECONCILE_BATCH_SIZE', default=200, cast=int)
+RECONCILE_CONCURRENCY           = config('RECONCILE_CONCURRENCY', default=8, cast=int)  # <= RAZORPAY_POOL_MAXSIZE
+
+# -------------------------------------------------------------------------
+# BACKGROUND TASKS
+# -------------------------------------------------------------------------
+# Durable queue (api/tasks.py) drained by `python manage.py run_worker`
+TASK_QUEUE_MAX_ATTEMPTS         = config('TASK_QUEUE_MAX_ATTEMPTS', default=5, cast=int)
+TASK_QUEUE_RETRY_BASE_SECONDS   = config('TASK_QUEUE_RETRY_BASE_SECONDS', default=30, cast=int)     # doubles per attempt
+TASK_QUEUE_RETRY_MAX_SECONDS    = config('TASK_QUEUE_RETRY_MAX_SECONDS', default=3600, cast=int)
+TASK_QUEUE_LOCK_TIMEOUT         = config('TASK_QUEUE_LOCK_TIMEOUT', default=600, cast=int)          # re-queue stuck RUNNING tasks
+TASK_QUEUE_POLL_SECONDS         = config('TASK_QUEUE_POLL_SECONDS', default=2.0, cast=float)
+
+# -------------------------------------------------------------------------
+# NEWSLETTER BROADCASTS
+# -------------------------------------------------------------------------
+# Match the provider's limits: Resend allows a few API requests/second (100
+# messages each); shared SMTP hosts usually cap messages per day.
+NEWSLETTER_BATCH_SIZE   = config('NEWSLETTER_BATCH_SIZE', default=100, cast=int)
+NEWSLETTER_SEND_RATE    = config('NEWSLETTER_SEND_RATE', default=10, cast=float)   # messages/second, 0 = unpaced
+NEWSLETTER_DAILY_QUOTA  = config('NEWSLETTER_DAILY_QUOTA', default=0, cast=int)    # messages/24h, 0 = unlimited
+NEWSLETTER_TASK_SECONDS = config('NEWSLETTER_TASK_SECONDS', default=240, cast=int) # per worker slice (< TASK_QUEUE_LOCK_TIMEOUT)
 
 # -------------------------------------------------------------------------
 # FRONTEND URL (used for password reset links in emails)